@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import os
+
+# Append-only record of finished sources, so an interrupted batch can be
+# re-run and skip what is already done. One JSON line per source holds the
+# source's size and mtime, a signature of the options used and every output
+# with its size and mtime. A source counts as done only if all of that still
+# matches what is on disk; the latest line for a source wins.
+# Outputs are synced and renamed into place before their line is written,
+# and every line is synced, so a crash can at worst lose the record of a
+# finished source, never claim a partial one. A line cut short by a crash is
+# skipped on open, and the next line starts after it.
+
+JOURNAL_VERSION = 1
+
+# Rewrite the journal on open once it holds this many superseded lines per source
+COMPACT_RATIO = 2
+
+
+def make_signature(sizes, output_format, params):
+    payload = json.dumps([JOURNAL_VERSION, sizes, output_format, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def fsync_directory(directory):
+    # Makes a rename inside directory durable; not possible on Windows
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def ends_with_newline(journal_path):
+    with open(journal_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def open_journal(journal_path):
+    entries = {}
+    lines = 0
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash; everything before it is intact
+                    continue
+                entries[entry['source']] = entry
+                lines += 1
+    if lines > COMPACT_RATIO * max(len(entries), 1):
+        compact(journal_path, entries)
+    f = open(journal_path, 'a', encoding='utf-8', buffering=1)
+    if not ends_with_newline(journal_path):
+        # Otherwise the next entry would be glued onto the cut-short line
+        f.write("\n")
+    return {'path': journal_path, 'entries': entries, 'file': f}
+
+
+def compact(journal_path, entries):
+    temp_path = f"{journal_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for entry in entries.values():
+            f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, journal_path)
+    fsync_directory(os.path.dirname(journal_path))
+
+
+def close_journal(journal):
+    journal['file'].close()
+
+
+def completed(journal, file_path, signature):
+    # Returns the journal entry if file_path was finished with the same options
+    # and neither it nor any of its outputs changed since
+    entry = journal['entries'].get(os.path.abspath(file_path))
+    if not entry or entry['signature'] != signature:
+        return None
+    if file_state(entry['source']) != entry['state']:
+        return None
+    for output in entry['outputs']:
+        if file_state(output['path']) != output['state']:
+            return None
+    return entry
+
+
+def record(journal, file_results, signature):
+    # Only sources where every output succeeded are recorded
+    if not file_results or any(result['error'] or not result['output'] for result in file_results):
+        return
+    source = os.path.abspath(file_results[0]['source'])
+    entry = {
+        'source': source,
+        'signature': signature,
+        'state': file_state(source),
+        'outputs': [{'path': os.path.abspath(result['output']), 'size': result['size'],
+                     'format': result.get('format'), 'state': file_state(result['output'])}
+                    for result in file_results],
+    }
+    if entry['state'] is None or any(output['state'] is None for output in entry['outputs']):
+        logging.warning(f"Not journaling {source}: an output disappeared")
+        return
+    journal['entries'][source] = entry
+    journal['file'].write(json.dumps(entry) + "\n")
+    journal['file'].flush()
+    os.fsync(journal['file'].fileno())
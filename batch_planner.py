@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from PIL import Image
+import output_cache
+
+# Planning stage for batches, run before any pixel work.
+# Byte-identical sources are found by size first, then a hash of the first
+# PREFIX_BYTES, then a full hash, so a file whose size is unique is never
+# read. Only the first of each set (in sorted path order) is resized; the
+# others get hardlinks, or copies, of its outputs.
+# Sources that would write the same output names (the same stem in the same
+# output folder: a/x.png and b/x.png into one save directory, or x.png next
+# to x.jpg) are renamed deterministically. In sorted path order the first
+# keeps its stem and the others get "-2", "-3", ... skipping any stem another
+# source already has in that folder.
+
+PREFIX_BYTES = 64 * 1024
+DEDUPE_MODES = ['link', 'copy']
+
+
+def prefix_digest(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read(PREFIX_BYTES)).hexdigest()
+
+
+def group_by(paths, key, counters):
+    # (key, paths) for every key shared by more than one path; unreadable
+    # files are left out here and reported by the resize itself
+    groups = {}
+    for file_path in paths:
+        try:
+            groups.setdefault(key(file_path), []).append(file_path)
+        except OSError as e:
+            logging.warning(f"Cannot read {file_path} while planning: {str(e)}")
+            counters['unreadable'] += 1
+    return [(value, group) for value, group in groups.items() if len(group) > 1]
+
+
+def find_duplicates(paths, counters):
+    # {duplicate path: primary path}; the primary is the first in sorted order
+    def prefix(file_path):
+        counters['hashed_bytes'] += min(os.path.getsize(file_path), PREFIX_BYTES)
+        return prefix_digest(file_path)
+
+    def content(file_path):
+        counters['hashed_bytes'] += os.path.getsize(file_path)
+        return output_cache.file_digest(file_path)
+
+    duplicates = {}
+    for size, same_size in group_by(paths, os.path.getsize, counters):
+        groups = [group for _, group in group_by(same_size, prefix, counters)]
+        if size > PREFIX_BYTES:
+            # The prefix hash covered small files completely
+            groups = [identical for group in groups for _, identical in group_by(group, content, counters)]
+        for identical in groups:
+            primary, *others = sorted(identical)
+            for other in others:
+                duplicates[other] = primary
+    return duplicates
+
+
+def resolve_stems(paths, output_directory):
+    # {absolute source path: new stem} for the sources that have to be renamed
+    by_folder = {}
+    for file_path in sorted(paths, key=os.path.abspath):
+        folder = os.path.normcase(os.path.abspath(output_directory(file_path)))
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        by_folder.setdefault(folder, {}).setdefault(os.path.normcase(stem), []).append((file_path, stem))
+    renamed = {}
+    for stems in by_folder.values():
+        taken = set(stems)
+        for sources in stems.values():
+            for file_path, stem in sources[1:]:
+                number = 2
+                while os.path.normcase(f"{stem}-{number}") in taken:
+                    number += 1
+                taken.add(os.path.normcase(f"{stem}-{number}"))
+                renamed[os.path.abspath(file_path)] = f"{stem}-{number}"
+    return renamed
+
+
+def make_plan(paths, output_directory):
+    # output_directory(path) -> folder the path's outputs go to, without
+    # creating it. Returns the plan dict used by the engine and format_plan.
+    paths = list(dict.fromkeys(paths))
+    counters = {'hashed_bytes': 0, 'unreadable': 0}
+    duplicates = find_duplicates(paths, counters)
+    return {
+        'sources': paths,
+        'primaries': [file_path for file_path in paths if file_path not in duplicates],
+        'duplicates': duplicates,
+        'stems': resolve_stems(paths, output_directory),
+        'hashed_bytes': counters['hashed_bytes'],
+        'unreadable': counters['unreadable'],
+    }
+
+
+def duplicates_by_primary(plan):
+    copies = {}
+    for duplicate, primary in plan['duplicates'].items():
+        copies.setdefault(primary, []).append(duplicate)
+    return copies
+
+
+def estimate_work(plan, outputs_per_source):
+    # Reads only image headers: decoded pixels of the unique sources, outputs
+    # to encode and outputs to link
+    pixels = 0
+    source_bytes = 0
+    for file_path in plan['primaries']:
+        try:
+            source_bytes += os.path.getsize(file_path)
+            with Image.open(file_path) as img:
+                pixels += img.width * img.height * getattr(img, 'n_frames', 1)
+        except Exception:
+            continue
+    return {
+        'decode_sources': len(plan['primaries']),
+        'decode_pixels': pixels,
+        'source_bytes': source_bytes,
+        'encode_outputs': len(plan['primaries']) * outputs_per_source,
+        'linked_outputs': len(plan['duplicates']) * outputs_per_source,
+    }
+
+
+def format_plan(plan, estimate, verbose=False):
+    total = len(plan['sources'])
+    duplicates = len(plan['duplicates'])
+    share = duplicates * 100.0 / total if total else 0.0
+    lines = [
+        f"Sources: {total} ({len(plan['primaries'])} unique, {duplicates} duplicate(s), {share:.1f}% of the work)",
+        f"Renamed to avoid output collisions: {len(plan['stems'])}",
+        f"Read while hashing: {plan['hashed_bytes']} bytes",
+        f"Estimated work: decode {estimate['decode_sources']} source(s) "
+        f"({estimate['source_bytes']} bytes, {estimate['decode_pixels'] / 1e6:.1f} MP), "
+        f"encode {estimate['encode_outputs']} output(s), link {estimate['linked_outputs']}",
+    ]
+    if plan['unreadable']:
+        lines.append(f"Unreadable while planning: {plan['unreadable']}")
+    if verbose:
+        for file_path in plan['sources']:
+            stem = plan['stems'].get(os.path.abspath(file_path))
+            if file_path in plan['duplicates']:
+                lines.append(f"link    {file_path} <- {plan['duplicates'][file_path]}")
+            else:
+                lines.append(f"resize  {file_path}")
+            if stem:
+                lines.append(f"rename  {file_path} -> {stem}")
+    return "\n".join(lines)
+
+
+def link_output(source_path, target_path, mode='link'):
+    # Puts a hardlink (or a copy) of source_path at target_path, atomically
+    # like write_output. Hardlinks fall back to copying across filesystems
+    # or where they are not supported. Returns the method used.
+    directory, name = os.path.split(target_path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        if mode == 'link':
+            try:
+                os.link(source_path, temp_path)
+                os.replace(temp_path, target_path)
+                return 'link'
+            except OSError as e:
+                logging.debug(f"Hardlink to {source_path} failed ({str(e)}); copying")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, target_path)
+        return 'copy'
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import PIL
+from PIL import Image
+import resize_engine
+from instrumentation import STAGES
+from resize_engine import DEFAULT_QUALITY, RESIZE_QUALITY, DEFAULT_ENCODER_PROFILE, ENCODER_PROFILE_NAMES
+
+# Throughput benchmark for the resize pipeline. Builds a reproducible synthetic
+# corpus, runs the single-file path stage by stage and the batch path end to
+# end, and writes the numbers as JSON so runs from different commits can be
+# compared with --compare.
+
+# (format, extension, modes) written into the corpus; ICO tops out at 256px
+CORPUS_FORMATS = [
+    ("JPEG", ".jpg", ["RGB", "L"]),
+    ("PNG", ".png", ["RGB", "RGBA", "P", "L"]),
+    ("ICO", ".ico", ["RGBA"]),
+    ("BMP", ".bmp", ["RGB", "P"]),
+    ("TIFF", ".tiff", ["RGB", "RGBA"]),
+    ("GIF", ".gif", ["P"]),
+]
+DEFAULT_CORPUS_SIZES = [64, 512, 2048]
+DEFAULT_TARGETS = [16, 64, 256]
+CORPUS_VERSION = 1
+
+
+def synthetic_image(size, mode, seed):
+    # Smooth gradients plus low-frequency noise: compresses like a real picture,
+    # unlike pure noise, and is identical for the same seed and Pillow version
+    rng = random.Random(seed)
+    small = (max(2, size // 16), max(2, size // 16))
+    noise = Image.frombytes("RGB", small, rng.randbytes(small[0] * small[1] * 3))
+    noise = noise.resize((size, size), Image.BICUBIC)
+    gradient = Image.merge("RGB", [Image.linear_gradient("L").resize((size, size)),
+                                   Image.radial_gradient("L").resize((size, size)),
+                                   Image.linear_gradient("L").rotate(90).resize((size, size))])
+    img = Image.blend(gradient, noise, 0.4)
+    if mode == "RGBA":
+        img.putalpha(Image.radial_gradient("L").resize((size, size)))
+    elif mode == "P":
+        img = img.quantize(256)
+    elif mode != "RGB":
+        img = img.convert(mode)
+    return img
+
+
+def generate_corpus(corpus_dir, sizes=DEFAULT_CORPUS_SIZES, seed=0):
+    # Reuses an existing corpus when it was generated with the same parameters
+    manifest_path = os.path.join(corpus_dir, 'manifest.json')
+    params = {'version': CORPUS_VERSION, 'sizes': list(sizes), 'seed': seed, 'pillow': PIL.__version__}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('params') == params:
+            return manifest['files']
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    files = []
+    for format_index, (image_format, ext, modes) in enumerate(CORPUS_FORMATS):
+        for mode_index, mode in enumerate(modes):
+            for size in sizes:
+                if image_format == "ICO" and size > 256:
+                    continue
+                img = synthetic_image(size, mode, seed * 1000003 + format_index * 1009 + mode_index * 101 + size)
+                path = os.path.join(corpus_dir, f"{image_format.lower()}_{mode}_{size}{ext}")
+                img.save(path, format=image_format)
+                files.append({'path': path, 'format': image_format, 'mode': mode, 'size': size,
+                              'bytes': os.path.getsize(path)})
+    with open(manifest_path, 'w') as f:
+        json.dump({'params': params, 'files': files}, f, indent=2)
+    return files
+
+
+def peak_rss_kb():
+    # ru_maxrss is in KB on Linux and bytes on macOS; not available on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1024 if sys.platform == 'darwin' else 1
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    return {'self': own, 'children': children}
+
+
+def time_single(file_path, selected_size, output_format, options):
+    # Stage timings come from the engine's own instrumentation
+    results = resize_engine.resize_file(file_path, [selected_size], output_format, options)
+    result = results[0]
+    if result['error']:
+        raise RuntimeError(f"{file_path}: {result['error']}")
+    return result['timings'], result['output_bytes']
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'total': sum(samples),
+        'mean': sum(samples) / len(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def run_single(files, targets, output_format, options, repeat):
+    stage_samples = {stage: [] for stage in STAGES}
+    by_input = {}
+    images = 0
+    output_bytes = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for entry in files:
+            for target in targets:
+                timings, size = time_single(entry['path'], (target, target), output_format, options)
+                for stage in STAGES:
+                    stage_samples[stage].append(timings[stage])
+                key = f"{entry['format']}/{entry['mode']}"
+                by_input[key] = by_input.get(key, 0.0) + sum(timings.values())
+                images += 1
+                output_bytes += size
+    seconds = time.perf_counter() - start
+    return {
+        'images': images,
+        'seconds': seconds,
+        'images_per_sec': images / seconds if seconds else None,
+        'output_bytes': output_bytes,
+        'stages': {stage: summarize(stage_samples[stage]) for stage in STAGES},
+        'seconds_by_input': by_input,
+    }
+
+
+def run_batch(files, targets, output_format, options, repeat, workers):
+    paths = [entry['path'] for entry in files]
+    options = dict(options, workers=workers)
+    images = 0
+    failed = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = resize_engine.resize_batch(paths, [(target, target) for target in targets], output_format, options)
+        images += len(results)
+        failed += sum(1 for result in results if result['error'])
+    seconds = time.perf_counter() - start
+    return {
+        'workers': workers,
+        'images': images,
+        'failed': failed,
+        'seconds': seconds,
+        'images_per_sec': images / seconds if seconds else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline):
+    # Relative change of the headline numbers; positive means faster
+    rows = []
+    for section in ('single', 'batch'):
+        old = baseline.get(section, {}).get('images_per_sec')
+        new = current.get(section, {}).get('images_per_sec')
+        if old and new:
+            rows.append((f"{section} images/sec", old, new, (new - old) / old * 100))
+    for stage in STAGES:
+        old = baseline.get('single', {}).get('stages', {}).get(stage, {}).get('mean')
+        new = current.get('single', {}).get('stages', {}).get(stage, {}).get('mean')
+        if old and new:
+            rows.append((f"{stage} mean ms", old * 1000, new * 1000, (old - new) / old * 100))
+    return rows
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                     description="Benchmark the resize pipeline on a synthetic corpus.")
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'image_resizer_bench_corpus'),
+                        help="Corpus directory (generated if missing or outdated)")
+    parser.add_argument('--corpus-sizes', default=",".join(str(size) for size in DEFAULT_CORPUS_SIZES),
+                        help="Comma separated source edge lengths")
+    parser.add_argument('--targets', default=",".join(str(size) for size in DEFAULT_TARGETS),
+                        help="Comma separated target edge lengths")
+    parser.add_argument('-f', '--format', default='PNG', help="Output format")
+    parser.add_argument('-q', '--quality', choices=sorted(RESIZE_QUALITY), default=DEFAULT_QUALITY)
+    parser.add_argument('-e', '--encoder-profile', choices=ENCODER_PROFILE_NAMES, default=DEFAULT_ENCODER_PROFILE)
+    parser.add_argument('--backend', choices=['pillow', 'numpy'], default='pillow',
+                        help="Resize backend for the batch run")
+    parser.add_argument('--repeat', type=int, default=1, help="Number of passes over the corpus")
+    parser.add_argument('-j', '--workers', type=int, default=resize_engine.default_worker_count(),
+                        help="Worker processes for the batch run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help="Write the JSON report to this file")
+    parser.add_argument('--compare', default=None, help="Baseline JSON report to compare against")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    output_format = resize_engine.validate_format(args.format)
+    targets = [int(size) for size in args.targets.split(",") if size.strip()]
+    corpus_sizes = [int(size) for size in args.corpus_sizes.split(",") if size.strip()]
+
+    corpus_start = time.perf_counter()
+    files = generate_corpus(args.corpus, corpus_sizes, args.seed)
+    corpus_seconds = time.perf_counter() - corpus_start
+
+    output_dir = tempfile.mkdtemp(prefix='image_resizer_bench_')
+    try:
+        options = {'save_directory': output_dir, 'quality': args.quality, 'encoder_profile': args.encoder_profile,
+                   'backend': args.backend}
+        single = run_single(files, targets, output_format, options, args.repeat)
+        batch = run_batch(files, targets, output_format, options, args.repeat, args.workers)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'format': output_format,
+            'quality': args.quality,
+            'encoder_profile': args.encoder_profile,
+            'backend': args.backend,
+            'targets': targets,
+            'repeat': args.repeat,
+        },
+        'corpus': {
+            'directory': args.corpus,
+            'files': len(files),
+            'bytes': sum(entry['bytes'] for entry in files),
+            'setup_seconds': corpus_seconds,
+        },
+        'single': single,
+        'batch': batch,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, old, new, change in compare(report, baseline):
+            print(f"{name:<24} {old:>12.2f} -> {new:>12.2f}  ({change:+.1f}%)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
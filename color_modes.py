@@ -0,0 +1,147 @@
+from PIL import Image, ImageMode
+
+# Colour-mode planning for the resize pipeline. A source is converted once,
+# before any resizing, to the working mode its mode maps to; every resized
+# image is converted once more, to a mode its encoder writes as is.
+# - RGBA and LA are resized premultiplied (RGBa, La). Image.resize converts
+#   straight alpha to that space and back on every call (a copy at the input
+#   size and one at the output size, and reducing_gap is ignored), so doing it
+#   once per source lets every target and cascade step share it.
+# - P, PA and 1 are expanded first: Image.resize falls back to NEAREST for
+#   them. Palettes with transparency become RGBa.
+# - GIF outputs are quantized after resizing, to a palette fitted to the
+#   output pixels, the way the GIF encoder would have done it itself.
+# - 16-bit grey (I;16, and I, which holds 16-bit PNG/TIFF data) is scaled to
+#   8 bits for formats that cannot store it; convert() would clip it to white.
+# Conversions add the bytes they allocate to counters['convert_bytes'];
+# premultiply round trips skipped by resizing in the working mode add to
+# counters['convert_bytes_saved'].
+
+WORKING_MODES = {
+    'RGBA': 'RGBa',
+    'LA': 'La',
+    'PA': 'RGBa',
+    '1': 'L',
+    'CMYK': 'RGB',
+    'YCbCr': 'RGB',
+    'LAB': 'RGB',
+    'HSV': 'RGB',
+}
+
+# Premultiplied working modes and the straight-alpha modes they come from
+PREMULTIPLIED = {'RGBa': 'RGBA', 'La': 'LA'}
+
+# Conversions out of a premultiplied mode that Pillow does directly (and
+# un-premultiplies on the way); the others go through the straight mode first
+DIRECT_CONVERSIONS = {('RGBa', 'RGBA'), ('RGBa', 'RGB'), ('La', 'LA')}
+
+# Modes each encoder writes without converting internally
+ENCODER_MODES = {
+    "ICO": ('RGB', 'RGBA'),
+    "PNG": ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I', 'I;16'),
+    "JPG": ('L', 'RGB', 'CMYK'),
+    "BMP": ('1', 'L', 'P', 'RGB', 'RGBA'),
+    "TIFF": ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'CMYK', 'I', 'I;16', 'F'),
+    "GIF": ('L', 'P'),
+    "WEBP": ('RGB', 'RGBA'),
+}
+
+
+def pixel_bytes(mode):
+    # Pillow keeps 1, L and P in one byte per pixel, I;16 in two and every
+    # other mode (RGB included) in four
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+
+def count(counters, name, value):
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + value
+
+
+def working_mode(img):
+    if img.mode == 'P':
+        return 'RGBa' if img.has_transparency_data else 'RGB'
+    return WORKING_MODES.get(img.mode, img.mode)
+
+
+def output_mode(mode, output_format):
+    straight = PREMULTIPLIED.get(mode, mode)
+    modes = ENCODER_MODES[output_format]
+    if straight in modes:
+        return straight
+    if output_format == "GIF":
+        return 'P'
+    # Keep alpha where the format can store it, and grey where it can
+    base = Image.getmodebase(straight)
+    if 'A' in ImageMode.getmode(straight).bands:
+        for mode in (base + 'A', 'RGBA'):
+            if mode in modes:
+                return mode
+    return base if base in modes else 'RGB'
+
+
+def convert(img, mode, counters=None):
+    if img.mode == mode:
+        return img
+    count(counters, 'convert_bytes', pixel_bytes(mode) * img.width * img.height)
+    return img.convert(mode)
+
+
+def to_working(img, counters=None):
+    # The image to resize from; img itself when its mode needs no conversion
+    mode = working_mode(img)
+    if mode == img.mode:
+        return img
+    if mode == 'RGBa' and img.mode != 'RGBA':
+        # Palettes have no direct route to premultiplied alpha
+        img = convert(img, 'RGBA', counters)
+    return convert(img, mode, counters)
+
+
+def count_resize(counters, base, new_size):
+    # Call for every resize from a working-mode image
+    if base.mode in PREMULTIPLIED:
+        count(counters, 'convert_bytes_saved',
+              pixel_bytes(base.mode) * (base.width * base.height + new_size[0] * new_size[1]))
+
+
+def quantize(img, counters=None):
+    # Same adaptive palette the GIF encoder would build; with alpha, fully
+    # transparent palette entries become the transparent colour. Only RGB(A)
+    # can be quantized; LA goes through RGBA so it keeps its transparency.
+    if img.mode not in ('RGB', 'RGBA'):
+        img = convert(img, 'RGBA' if 'A' in img.getbands() else 'RGB', counters)
+    count(counters, 'convert_bytes', img.width * img.height)
+    paletted = img.convert('P', palette=Image.Palette.ADAPTIVE)
+    if paletted.palette.mode == 'RGBA':
+        for rgba, index in paletted.palette.colors.items():
+            if rgba[3] == 0:
+                paletted.info['transparency'] = index
+                break
+    return paletted
+
+
+def scale_to_8bit(img, counters=None):
+    # 0-65535 onto 0-255 as L
+    img = convert(img, 'I', counters)
+    count(counters, 'convert_bytes', pixel_bytes('I') * img.width * img.height)
+    return convert(img.point(lambda value: value / 257), 'L', counters)
+
+
+def to_output(img, output_format, counters=None):
+    mode = output_mode(img.mode, output_format)
+    if mode == img.mode:
+        return img
+    if img.mode == 'I' or img.mode.startswith('I;16'):
+        img = scale_to_8bit(img, counters)
+        if mode == img.mode:
+            return img
+    if img.mode in PREMULTIPLIED and (img.mode, mode) not in DIRECT_CONVERSIONS:
+        img = convert(img, PREMULTIPLIED[img.mode], counters)
+    if mode == 'P':
+        return quantize(img, counters)
+    return convert(img, mode, counters)
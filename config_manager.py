@@ -1,35 +1,128 @@
-import configparser
-import os
-
-config_file = 'config.ini'
-
-def load_settings():
-    config = configparser.ConfigParser()
-    if os.path.exists(config_file):
-        config.read(config_file)
-    return config
-
-def save_settings(config):
-    with open(config_file, 'w') as configfile:
-        config.write(configfile)
-
-def get_setting(section, option, fallback=None, data_type=str):
-    config = load_settings()
-    try:
-        if data_type == int:
-            return config.getint(section, option, fallback=fallback)
-        elif data_type == float:
-            return config.getfloat(section, option, fallback=fallback)
-        elif data_type == bool:
-            return config.getboolean(section, option, fallback=fallback)
-        else:
-            return config.get(section, option, fallback=fallback)
-    except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
-        return fallback
-
-def set_setting(section, option, value):
-    config = load_settings()
-    if section not in config:
-        config[section] = {}
-    config[section][option] = str(value)
-    save_settings(config)
+import atexit
+import configparser
+import os
+import tempfile
+import threading
+import time
+
+config_file = 'config.ini'
+
+# Settings are kept in memory for the whole process. The file is re-read only
+# when its mtime changes (checked at most every reload_check_interval seconds)
+# and writes are coalesced into one atomic replace after flush_delay seconds.
+reload_check_interval = 1.0
+flush_delay = 0.5
+
+_lock = threading.RLock()
+_config = None
+_config_mtime = None
+_last_check = 0.0
+_dirty = False
+_flush_timer = None
+
+
+def _file_mtime():
+    try:
+        return os.stat(config_file).st_mtime
+    except OSError:
+        return None
+
+
+def _read_config():
+    global _config, _config_mtime, _last_check
+    config = configparser.ConfigParser()
+    _config_mtime = _file_mtime()
+    if _config_mtime is not None:
+        config.read(config_file)
+    _config = config
+    _last_check = time.monotonic()
+
+
+def load_settings():
+    global _last_check
+    with _lock:
+        if _config is None:
+            _read_config()
+        elif not _dirty and time.monotonic() - _last_check >= reload_check_interval:
+            # Pending local changes win over edits made to the file meanwhile
+            _last_check = time.monotonic()
+            if _file_mtime() != _config_mtime:
+                _read_config()
+        return _config
+
+
+def _write_config(config):
+    global _config_mtime
+    directory = os.path.dirname(os.path.abspath(config_file))
+    fd, temp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as configfile:
+            config.write(configfile)
+        os.replace(temp_path, config_file)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _config_mtime = _file_mtime()
+
+
+def flush_settings():
+    global _dirty, _flush_timer
+    with _lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        if _dirty and _config is not None:
+            _write_config(_config)
+            _dirty = False
+
+
+def _schedule_flush():
+    global _dirty, _flush_timer
+    _dirty = True
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(flush_delay, flush_settings)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def save_settings(config=None):
+    # Writes immediately; passing a config replaces the cached one
+    global _config, _dirty
+    with _lock:
+        if config is not None:
+            _config = config
+        elif _config is None:
+            _read_config()
+        _dirty = True
+        flush_settings()
+
+
+def get_setting(section, option, fallback=None, data_type=str):
+    config = load_settings()
+    with _lock:
+        try:
+            if data_type == int:
+                return config.getint(section, option, fallback=fallback)
+            elif data_type == float:
+                return config.getfloat(section, option, fallback=fallback)
+            elif data_type == bool:
+                return config.getboolean(section, option, fallback=fallback)
+            else:
+                return config.get(section, option, fallback=fallback)
+        except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
+            return fallback
+
+
+def set_setting(section, option, value):
+    config = load_settings()
+    with _lock:
+        if section not in config:
+            config[section] = {}
+        if config[section].get(option) == str(value):
+            return
+        config[section][option] = str(value)
+        _schedule_flush()
+
+
+atexit.register(flush_settings)
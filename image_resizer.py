@@ -1,553 +1,1070 @@
-import os
-import sys
-from PIL import Image, ImageTk
-from tkinter import filedialog, Tk, Label, Button, messagebox, IntVar, Radiobutton, Frame, StringVar, OptionMenu, Entry, Checkbutton, Text, Scrollbar, Menu, Toplevel, Spinbox, TclError
-from tkinterdnd2 import DND_FILES, TkinterDnD
-from tkinter import ttk
-import logging
-from logging.handlers import RotatingFileHandler
-from collections import deque
-from config_manager import load_settings, save_settings, get_setting, set_setting
-from recent_file_manager import load_recent_files, save_recent_files
-
-# Correct logging configuration
-log_handler = RotatingFileHandler('image_resizer.log', maxBytes=5000000, backupCount=5)
-logging.basicConfig(handlers=[log_handler], level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Get the directory of the current script
-script_directory = os.path.dirname(os.path.abspath(sys.argv[0]))
-
-# Deque to store the last N saved files
-last_files = deque(maxlen=20)
-
-def load_initial_settings():
-    global save_directory, size_var, format_var, maintain_aspect_ratio_var, last_files
-    save_directory = get_setting('Settings', 'last_save_directory', script_directory)
-    print(f"Initial save directory loaded: {save_directory}")  # Debug statement
-    if save_directory:
-        save_directory_label.config(text=f"Save Directory: {save_directory}")
-    size_var.set(get_setting('Settings', 'default_size', 0, int))
-    format_var.set(get_setting('Settings', 'default_format', 'ICO'))
-    maintain_aspect_ratio_var.set(get_setting('Settings', 'maintain_aspect_ratio', 0, int))
-    last_files = deque(load_recent_files(), maxlen=get_setting('Settings', 'recent_files_limit', 20, int))
-    update_last_files_display()  # Ensure recent files are displayed on startup
-
-def load_image(file_path=None):
-    global image_path, image, photo_image
-    image_path = None
-    if file_path:
-        image_path = file_path
-    else:
-        initialdir = get_setting('Settings', 'last_load_directory', '')
-        image_path = filedialog.askopenfilename(
-            title="Select an Image",
-            initialdir=initialdir,
-            filetypes=[("All Images", "*.jpg;*.png;*.ico;*.bmp;*.tiff;*.gif"), 
-                       ("JPEG Images", "*.jpg"), ("PNG Images", "*.png"), 
-                       ("ICO Files", "*.ico"), ("BMP Files", "*.bmp"), 
-                       ("TIFF Files", "*.tiff"), ("GIF Files", "*.gif")]
-        )
-    if image_path:
-        try:
-            image = Image.open(image_path)
-            display_image()
-            set_setting('Settings', 'last_load_directory', os.path.dirname(image_path))
-            logging.info(f"Loaded image: {image_path}")
-        except (IOError, OSError) as e:
-            logging.error(f"Error loading image: {str(e)}")
-            messagebox.showerror("Error", f"Error loading image: {str(e)}")
-    else:
-        image = None
-
-def display_image():
-    global image_label, photo_image
-    if image:
-        try:
-            image.thumbnail((300, 300))
-            photo_image = ImageTk.PhotoImage(image)
-            image_label.config(image=photo_image)
-            image_label.image = photo_image
-        except (AttributeError, TclError):
-            pass
-
-def load_default_image():
-    global image, photo_image
-    image = Image.new("RGB", (300, 300), color="grey")
-    photo_image = ImageTk.PhotoImage(image)
-    image_label.config(image=photo_image)
-    image_label.image = photo_image
-
-def resize_and_save():
-    if not hasattr(image, "resize"):
-        messagebox.showerror("Error", "Please select an image.")
-        return
-
-    custom_width = custom_width_var.get()
-    custom_height = custom_height_var.get()
-
-    if custom_width.isdigit() and custom_height.isdigit():
-        selected_size = (int(custom_width), int(custom_height))
-        size_var.set(0)
-    elif size_var.get() != 0:
-        selected_size = (size_var.get(), size_var.get())
-    else:
-        messagebox.showerror("Error", "Please enter valid custom width and height or select a size.")
-        return
-
-    output_format = format_var.get()
-    if output_format not in ["ICO", "PNG", "JPG", "BMP", "TIFF", "GIF"]:
-        messagebox.showerror("Error", "Please select a valid output format.")
-        return
-
-    try:
-        if maintain_aspect_ratio_var.get() == 1 and selected_size[0] != selected_size[1]:
-            image_aspect_ratio = image.width / image.height
-            if selected_size[0] / selected_size[1] > image_aspect_ratio:
-                new_size = (int(selected_size[1] * image_aspect_ratio), selected_size[1])
-            else:
-                new_size = (selected_size[0], int(selected_size[0] / image_aspect_ratio))
-        else:
-            new_size = selected_size
-
-        resized_image = image.resize(new_size, Image.LANCZOS)
-
-        if output_format == "JPG":
-            resized_image = resized_image.convert("RGB")
-
-        filename, ext = os.path.splitext(image_path)
-        new_ext = '.' + output_format.lower()
-        new_filename = f"{os.path.basename(filename)}_{new_size[0]}x{new_size[1]}{new_ext}"
-
-        print(f"Using save directory: {save_directory}")  # Debug statement
-        if save_directory:
-            new_filepath = os.path.join(save_directory, new_filename)
-        else:
-            new_filepath = os.path.join(os.path.dirname(image_path), new_filename)
-
-        resized_image.save(new_filepath, format=output_format)
-        logging.info(f"Image resized and saved to: {new_filepath}")
-        open_folder_button.config(state="normal")
-        saved_filepath.set(new_filepath)
-        add_to_last_files(new_filepath)
-    except Exception as e:
-        logging.error(f"Failed to resize and save image: {str(e)}")
-        messagebox.showerror("Error", f"Failed to resize and save image: {str(e)}")
-
-        
-def open_folder(filepath=None):
-    if not filepath:
-        filepath = saved_filepath.get()
-        if not filepath:
-            messagebox.showinfo("Info", "No file saved yet.")
-            return
-
-    folder_path = os.path.dirname(filepath)
-    try:
-        if os.name == 'nt':
-            os.startfile(folder_path)
-        elif os.name == 'posix':
-            subprocess.Popen(['open', folder_path])
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to open folder: {str(e)}")
-
-def select_save_directory():
-    global save_directory
-    selected_directory = filedialog.askdirectory(title="Select Save Directory", initialdir=save_directory)
-    if selected_directory:
-        save_directory = selected_directory
-        save_directory_label.config(text=f"Save Directory: {save_directory}")
-        set_setting('Settings', 'last_save_directory', save_directory)
-        save_settings()
-        print(f"Save directory updated to: {save_directory}")  # Debug statement
-
-def add_to_last_files(filepath):
-    last_files.append(filepath)
-    update_last_files_display()
-    save_recent_files(last_files)
-
-def load_recent_files():
-    config = load_settings()
-    files = []
-    if 'Files' in config:
-        for key in sorted(config['Files'], key=lambda k: int(k.split('_')[1])):
-            files.append(config['Files'][key])
-    return files
-def update_last_files_display():
-    last_files_text.config(state="normal")
-    last_files_text.delete(1.0, "end")
-    for filepath in last_files:
-        last_files_text.insert("end", filepath + "\n")
-    last_files_text.config(state="disabled")
-    last_files_text.see("end")  # Scroll to the bottom
-
-def clear_last_files():
-    last_files.clear()
-    update_last_files_display()
-    clear_last_files_from_config()
-
-def clear_last_files_from_config():
-    config = load_settings()
-    if 'Files' in config:
-        config.remove_section('Files')
-    save_settings(config)    
-
-def validate_custom_size(event=None):
-    custom_width = custom_width_var.get()
-    custom_height = custom_height_var.get()
-    if custom_width.isdigit() and custom_height.isdigit():
-        size_var.set(0)
-    elif not custom_width.isdigit() or not custom_height.isdigit():
-        size_var.set(0)
-
-def clear_custom_size():
-    custom_width_var.set("")
-    custom_height_var.set("")
-    size_var.set(0)
-
-def resize_and_save_batch():
-    file_paths = filedialog.askopenfilenames(
-        title="Select Images for Batch Processing",
-        initialdir=get_setting('Settings', 'last_load_directory', ''),
-        filetypes=[("All Images", "*.jpg;*.png;*.ico;*.bmp;*.tiff;*.gif"), ("JPEG Images", "*.jpg"), ("PNG Images", "*.png"), 
-                   ("ICO Files", "*.ico"), ("BMP Files", "*.bmp"), ("TIFF Files", "*.tiff"), ("GIF Files", "*.gif")]
-    )
-
-    if not file_paths:
-        return
-
-    custom_width = custom_width_var.get()
-    custom_height = custom_height_var.get()
-
-    if custom_width.isdigit() and custom_height.isdigit():
-        selected_size = (int(custom_width), int(custom_height))
-        size_var.set(0)
-    elif size_var.get() != 0:
-        selected_size = (size_var.get(), size_var.get())
-    else:
-        messagebox.showerror("Error", "Please enter valid custom width and height or select a size.")
-        return
-
-    output_format = format_var.get()
-    if output_format not in ["ICO", "PNG", "JPG", "BMP", "TIFF", "GIF"]:
-        messagebox.showerror("Error", "Please select a valid output format.")
-        return
-
-    progress["maximum"] = len(file_paths)
-    progress["value"] = 0
-
-    for idx, file_path in enumerate(file_paths):
-        try:
-            img = Image.open(file_path)
-            if maintain_aspect_ratio_var.get() == 1 and selected_size[0] != selected_size[1]:
-                image_aspect_ratio = img.width / img.height
-                if selected_size[0] / selected_size[1] > image_aspect_ratio:
-                    new_size = (int(selected_size[1] * image_aspect_ratio), selected_size[1])
-                else:
-                    new_size = (selected_size[0], int(selected_size[0] / image_aspect_ratio))
-            else:
-                new_size = selected_size
-
-            resized_img = img.resize(new_size, Image.LANCZOS)
-
-            if output_format == "JPG":
-                resized_img = resized_img.convert("RGB")
-
-            filename, ext = os.path.splitext(file_path)
-            new_ext = '.' + output_format.lower()
-            new_filename = f"{os.path.basename(filename)}_{new_size[0]}x{new_size[1]}{new_ext}"
-
-            if save_directory:
-                new_filepath = os.path.join(save_directory, new_filename)
-            else:
-                new_filepath = os.path.join(os.path.dirname(file_path), new_filename)
-
-            resized_img.save(new_filepath, format=output_format)
-            logging.info(f"Image resized and saved to: {new_filepath}")
-            add_to_last_files(new_filepath)
-
-            progress["value"] = idx + 1
-            root.update_idletasks()
-        except Exception as e:
-            logging.error(f"Failed to resize and save image {file_path}: {str(e)}")
-
-    messagebox.showinfo("Info", "Batch processing completed.")
-    open_folder_button.config(state="normal")
-    progress["value"] = 0
-
-def show_settings():
-    settings_window = Toplevel(root)
-    settings_window.title("Settings")
-    settings_window.geometry("620x300")
-    settings_window.attributes('-topmost', True)  # Ensure the settings window stays on top
-
-    settings_frame = Frame(settings_window)
-    settings_frame.pack(fill="both", expand=True)
-
-    Label(settings_frame, text="Settings", font=("Arial", 14)).grid(row=0, column=0, columnspan=2, pady=10)
-
-    Label(settings_frame, text="Default Save Directory:").grid(row=1, column=0, sticky="e", padx=5, pady=5)
-    def_save_dir_entry = Entry(settings_frame, width=50)
-    def_save_dir_entry.grid(row=1, column=1, pady=5)
-    def_save_dir_entry.insert(0, save_directory)
-
-    def select_directory(entry_widget):
-        settings_window.attributes('-topmost', False)  # Remove always-on-top attribute before opening the dialog
-        directory = filedialog.askdirectory(title="Select Directory")
-        settings_window.attributes('-topmost', True)  # Re-enable always-on-top attribute after closing the dialog
-        if directory:
-            entry_widget.delete(0, "end")
-            entry_widget.insert(0, directory)
-            set_setting('Settings', 'last_save_directory', directory)  # Save the directory immediately
-
-    def save_def_save_dir():
-        set_setting('Settings', 'last_save_directory', def_save_dir_entry.get())
-        save_directory_label.config(text=f"Save Directory: {def_save_dir_entry.get()}")  # Update the label immediately
-
-    def_save_dir_button = Button(settings_frame, text="Browse", command=lambda: select_directory(def_save_dir_entry))
-    def_save_dir_button.grid(row=1, column=2, padx=5)
-
-    Label(settings_frame, text="Default Load Directory:").grid(row=2, column=0, sticky="e", padx=5, pady=5)
-    def_load_dir_entry = Entry(settings_frame, width=50)
-    def_load_dir_entry.grid(row=2, column=1, pady=5)
-    def_load_dir_entry.insert(0, get_setting('Settings', 'last_load_directory', ''))
-
-    def save_def_load_dir():
-        set_setting('Settings', 'last_load_directory', def_load_dir_entry.get())
-
-    def_load_dir_button = Button(settings_frame, text="Browse", command=lambda: select_directory(def_load_dir_entry))
-    def_load_dir_button.grid(row=2, column=2, padx=5)
-
-    Label(settings_frame, text="Recent Files Limit:").grid(row=3, column=0, sticky="e", padx=5, pady=5)
-    rec_files_limit_spinbox = Spinbox(settings_frame, from_=1, to=100, width=5)
-    rec_files_limit_spinbox.grid(row=3, column=1, pady=5)
-    rec_files_limit_spinbox.delete(0, "end")
-    rec_files_limit_spinbox.insert(0, int(get_setting('Settings', 'recent_files_limit', 20)))
-
-    def save_rec_files_limit():
-        global last_files
-        new_limit = int(rec_files_limit_spinbox.get())
-        last_files = deque(last_files, maxlen=new_limit)
-        set_setting('Settings', 'recent_files_limit', new_limit)
-        save_recent_files(list(last_files))
-
-    Label(settings_frame, text="Default Output Format:").grid(row=4, column=0, sticky="e", padx=5, pady=5)
-    def_output_format_var = StringVar(settings_window)
-    def_output_format_var.set(format_var.get())
-    def_output_format_dropdown = OptionMenu(settings_frame, def_output_format_var, "ICO", "PNG", "JPG", "BMP", "TIFF", "GIF")
-    def_output_format_dropdown.grid(row=4, column=1, pady=5)
-
-    def save_def_output_format():
-        format_var.set(def_output_format_var.get())
-        set_setting('Settings', 'default_format', def_output_format_var.get())
-
-    Label(settings_frame, text="Default Size Options (comma separated):").grid(row=5, column=0, sticky="e", padx=5, pady=5)
-    def_size_entry = Entry(settings_frame, width=50)
-    def_size_entry.grid(row=5, column=1, pady=5)
-    def_size_entry.insert(0, "16,32,64")
-
-    def save_def_size():
-        sizes = [int(s) for s in def_size_entry.get().split(",") if s.isdigit()]
-        if sizes:
-            global size_var
-            size_var = IntVar(value=sizes[0])
-            for widget in size_button_frame.winfo_children():
-                widget.destroy()
-            for size in sizes:
-                Radiobutton(size_button_frame, text=f"{size}x{size}", variable=size_var, value=size).pack(side="left", padx=10)
-            set_setting('Settings', 'default_size', sizes[0])
-
-    def_aspect_ratio_var = IntVar(value=maintain_aspect_ratio_var.get())
-    def_aspect_ratio_check = Checkbutton(settings_frame, text="Maintain aspect ratio by default", variable=def_aspect_ratio_var)
-    def_aspect_ratio_check.grid(row=6, column=0, columnspan=2, pady=5)
-
-    def save_def_aspect_ratio():
-        maintain_aspect_ratio_var.set(def_aspect_ratio_var.get())
-        set_setting('Settings', 'maintain_aspect_ratio', def_aspect_ratio_var.get())
-
-    def save_all_settings():
-        save_def_save_dir()
-        save_def_load_dir()
-        save_rec_files_limit()
-        save_def_output_format()
-        save_def_size()
-        save_def_aspect_ratio()
-        messagebox.showinfo("Settings", "Settings saved successfully!")
-        settings_window.destroy()
-
-    Button(settings_frame, text="Save and Close", command=save_all_settings).grid(row=7, column=0, columnspan=2, pady=10)
-
-def show_help():
-    help_window = Toplevel(root)
-    help_window.title("Help")
-    help_window.geometry("600x230")
-
-    Label(help_window, text="Help", font=("Arial", 14)).pack(pady=10)
-    help_text = Text(help_window, wrap="word", height=150, width=100)
-    help_text.pack(pady=10)
-    help_text.insert("1.0", "Instructions:\n\n1. Load an image using 'Load Image' or drag and drop an image.\n"
-                            "2. Select a size or enter custom dimensions.\n"
-                            "3. Choose an output format.\n"
-                            "4. Click 'Resize and Save' or 'Batch Resize and Save' for multiple images.\n"
-                            "5. Use 'Open Folder' to view saved images.\n"
-                            "6. Set the save directory using 'Settings' in the menu.\n"
-                            "7. Recent files are displayed below and can be cleared with 'Clear'.")
-    help_text.config(state="disabled")
-
-# Initialize Tkinter window with TkinterDnD
-root = TkinterDnD.Tk()
-root.title("Image Resizer")
-root.geometry("660x840")
-
-# Menu bar
-menu_bar = Menu(root)
-root.config(menu=menu_bar)
-
-# Adding Settings menu
-settings_menu = Menu(menu_bar, tearoff=0)
-menu_bar.add_cascade(label="Settings", menu=settings_menu)
-settings_menu.add_command(label="Settings", command=show_settings)
-
-# Adding Help menu
-help_menu = Menu(menu_bar, tearoff=0)
-menu_bar.add_cascade(label="Help", menu=help_menu)
-help_menu.add_command(label="Help", command=show_help)
-
-# Title label
-title_label = Label(root, text="Image Resizer", font=("Arial", 16, "bold"), fg="blue")
-title_label.grid(row=0, column=0, columnspan=3, pady=10)
-
-# Image preview frame
-image_frame = Frame(root, width=300, height=300, bg="grey")
-image_frame.grid(row=1, column=0, rowspan=4, padx=10, pady=10)
-image_frame.grid_propagate(False)
-
-# Image label for displaying the image
-image_label = Label(image_frame)
-image_label.pack(expand=True)
-
-# Load default image on startup
-load_default_image()
-
-# Load image button
-load_button = Button(root, text="Load Image", command=load_image)
-load_button.grid(row=1, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
-
-# Drag and drop functionality
-def on_drop(event):
-    file_path = event.data
-    file_path = file_path.replace('{', '').replace('}', '')  # Clean up path
-    load_image(file_path)
-
-root.drop_target_register(DND_FILES)
-root.dnd_bind('<<Drop>>', on_drop)
-
-# Select size label
-select_size_label = Label(root, text="Select Size:")
-select_size_label.grid(row=2, column=1, padx=10, pady=10, sticky="w")
-
-# Radio button variables and labels
-size_var = IntVar(value=0)
-
-size_button_frame = Frame(root)
-size_button_frame.grid(row=3, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
-
-size_label1 = Radiobutton(size_button_frame, text="16x16", variable=size_var, value=16)
-size_label1.pack(side="left", padx=10)
-
-size_label2 = Radiobutton(size_button_frame, text="32x32", variable=size_var, value=32)
-size_label2.pack(side="left", padx=10)
-
-size_label3 = Radiobutton(size_button_frame, text="64x64", variable=size_var, value=64)
-size_label3.pack(side="left", padx=10)
-
-# Aspect ratio maintenance checkbox
-maintain_aspect_ratio_var = IntVar(value=0)
-maintain_aspect_ratio_checkbox = Checkbutton(root, text="Maintain aspect ratio", variable=maintain_aspect_ratio_var)
-maintain_aspect_ratio_checkbox.grid(row=4, column=1, columnspan=2, pady=5, sticky="w")
-
-# Custom size entries
-custom_size_frame = Frame(root)
-custom_size_frame.grid(row=5, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
-
-custom_size_label = Label(custom_size_frame, text="Custom Size:")
-custom_size_label.pack(side="left", padx=10)
-
-custom_width_var = StringVar()
-custom_width_entry = Entry(custom_size_frame, textvariable=custom_width_var, width=5)
-custom_width_entry.pack(side="left", padx=5)
-custom_width_entry.bind("<KeyRelease>", validate_custom_size)
-
-x_label = Label(custom_size_frame, text="x")
-x_label.pack(side="left", padx=5)
-
-custom_height_var = StringVar()
-custom_height_entry = Entry(custom_size_frame, textvariable=custom_height_var, width=5)
-custom_height_entry.pack(side="left", padx=5)
-custom_height_entry.bind("<KeyRelease>", validate_custom_size)
-
-# Clear button
-clear_button = Button(custom_size_frame, text="Clear", command=clear_custom_size)
-clear_button.pack(side="left", padx=10)
-
-# Output format label and dropdown
-format_label = Label(root, text="Select Output Format:")
-format_label.grid(row=6, column=0, padx=10, pady=10, sticky="w")
-
-format_var = StringVar(root)
-format_var.set("ICO")
-
-format_dropdown = OptionMenu(root, format_var, "ICO", "PNG", "JPG", "BMP", "TIFF", "GIF")
-format_dropdown.grid(row=6, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
-
-# Resize and save button
-save_button = Button(root, text="Resize and Save", command=resize_and_save)
-save_button.grid(row=7, column=0, columnspan=1, pady=10, sticky="ew")
-
-# Resize and save batch button
-batch_button = Button(root, text="Batch Resize and Save", command=resize_and_save_batch)
-batch_button.grid(row=7, column=1, columnspan=2, pady=10, sticky="ew")
-
-# Saved file path
-saved_filepath = StringVar()
-saved_filepath_label = Label(root, textvariable=saved_filepath)
-saved_filepath_label.grid(row=8, column=0, columnspan=3, padx=10, pady=5)
-
-# Open folder button
-open_folder_button = Button(root, text="Open Folder", command=open_folder, state="disabled")
-open_folder_button.grid(row=9, column=0, columnspan=1, pady=5, sticky="ew")
-
-# Frame for displaying last saved files
-last_files_frame = Frame(root)
-last_files_frame.grid(row=10, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
-
-# Scrollable text widget to display last saved files
-scrollbar = Scrollbar(last_files_frame)
-scrollbar.pack(side="right", fill="y")
-
-last_files_text = Text(last_files_frame, height=10, width=60, state="disabled", yscrollcommand=scrollbar.set)
-last_files_text.pack(side="left", fill="both", expand=True)
-
-scrollbar.config(command=last_files_text.yview)
-
-# Clear button
-clear_files_button = Button(last_files_frame, text="Clear Recent Files", command=clear_last_files)
-clear_files_button.pack(side="right", padx=10)
-
-# Progress bar for batch processing
-progress = ttk.Progressbar(root, orient="horizontal", length=400, mode="determinate")
-progress.grid(row=11, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
-
-# Save directory label
-save_directory_label = Label(root, text="Save Directory: Not Selected", fg="green")
-save_directory_label.grid(row=12, column=0, columnspan=3, padx=10, pady=5)
-# Initialize the save directory variable
-save_directory = get_setting('Settings', 'last_save_directory', script_directory)
-if save_directory:
-    save_directory_label.config(text=f"Save Directory: {save_directory}")
-
-# Load initial settings
-load_initial_settings()
-
-# Keep the window running
-root.mainloop()
+import os
+import sys
+import time
+
+# Startup stages are timed from here; report_startup() logs them once the
+# window is up (run with -X importtime for a per-module import breakdown)
+STARTUP_STARTED = time.perf_counter()
+
+from tkinter import filedialog, Tk, Label, Button, messagebox, IntVar, Radiobutton, Frame, StringVar, OptionMenu, Entry, Checkbutton, Text, Scrollbar, Menu, Toplevel, Spinbox, TclError, Canvas
+from tkinterdnd2 import DND_FILES, TkinterDnD
+from tkinter import ttk
+import logging
+import queue
+import threading
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
+from config_manager import save_settings, get_setting, set_setting, flush_settings
+from recent_file_manager import (load_recent_files, read_recent_files, get_recent_files, add_recent_file,
+                                 set_recent_files_limit, clear_recent_files, flush_recent_files)
+# resize_engine, resamplers and thumbnail_cache import Pillow, so they are
+# imported inside the functions that use them, after the first paint
+from output_formats import SUPPORTED_FORMATS
+from instrumentation import add_sink, log_sink, stats_sink, open_trace, emit_results, format_stats, reset_stats
+
+# Correct logging configuration; the log file is opened on the first record
+log_handler = RotatingFileHandler('image_resizer.log', maxBytes=5000000, backupCount=5, delay=True)
+logging.basicConfig(handlers=[log_handler], level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Per-job stage timings go to the log and the Statistics window; set
+# trace_file in config.ini to also append them to a JSONL trace (opened by
+# finish_startup)
+add_sink(log_sink)
+add_sink(stats_sink)
+
+# Get the directory of the current script
+script_directory = os.path.dirname(os.path.abspath(sys.argv[0]))
+
+# Path of the loaded source image; preview_image is only a reduced copy for display
+image_path = None
+preview_image = None
+
+# Output cache database used when 'Skip unchanged outputs' is enabled
+OUTPUT_CACHE_FILE = os.path.join(script_directory, 'output_cache.sqlite')
+BATCH_JOURNAL_FILE = os.path.join(script_directory, 'batch_journal.jsonl')
+RESAMPLER_CALIBRATION_FILE = os.path.join(script_directory, 'resampler_calibration.json')
+
+# Previews and the recent outputs grid come from an on-disk thumbnail cache;
+# thumbnail_cache_mb in config.ini bounds its size
+THUMBNAIL_CACHE_DIR = os.path.join(script_directory, 'thumbnail_cache')
+RECENT_THUMBNAIL_SIZE = (96, 96)
+RECENT_THUMBNAIL_COLUMNS = 5
+thumbnail_executor = ThreadPoolExecutor(max_workers=2)
+
+# Interval for writing out recent files added since the last flush
+RECENT_FILES_FLUSH_MS = 5000
+
+# Resize jobs (and the startup read of the recent files list) run on
+# background threads and report back to the Tk thread only through
+# job_queue, which poll_job_queue drains with root.after
+job_executor = ThreadPoolExecutor(max_workers=1)
+job_queue = queue.Queue()
+cancel_event = threading.Event()
+pause_event = threading.Event()
+job_running = False
+
+# (stage, perf_counter) pairs recorded while the window comes up. The time to
+# first paint is checked against startup_budget_ms in config.ini.
+startup_marks = [('start', STARTUP_STARTED)]
+STARTUP_BUDGET_MS = 1000
+
+def mark_startup(stage):
+    startup_marks.append((stage, time.perf_counter()))
+
+def format_startup_timings():
+    lines = []
+    for (_, previous), (stage, at) in zip(startup_marks, startup_marks[1:]):
+        lines.append(f"{stage:<14}{(at - previous) * 1000:>9.1f} ms{(at - STARTUP_STARTED) * 1000:>10.1f} ms")
+    return "\n".join(lines)
+
+def load_initial_settings():
+    global save_directory, size_var, format_var, maintain_aspect_ratio_var
+    save_directory = get_setting('Settings', 'last_save_directory', script_directory)
+    logging.debug(f"Initial save directory loaded: {save_directory}")
+    if save_directory:
+        save_directory_label.config(text=f"Save Directory: {save_directory}")
+    size_var.set(get_setting('Settings', 'default_size', 0, int))
+    format_var.set(get_setting('Settings', 'default_format', 'ICO'))
+    maintain_aspect_ratio_var.set(get_setting('Settings', 'maintain_aspect_ratio', 0, int))
+
+def finish_startup():
+    # Runs once the window has been drawn; anything not needed for the first
+    # paint is started from here
+    mark_startup('first_paint')
+    if get_setting('Settings', 'trace_file', ''):
+        open_trace(get_setting('Settings', 'trace_file', ''))
+    threading.Thread(target=read_recent_files_in_background, daemon=True).start()
+
+def read_recent_files_in_background():
+    try:
+        files = read_recent_files()
+    except Exception as e:
+        logging.error(f"Error reading recent files: {str(e)}")
+        files = []
+    job_queue.put(('recent_files', files))
+
+def show_recent_files(files):
+    load_recent_files(get_setting('Settings', 'recent_files_limit', 20, int), files)
+    update_last_files_display()
+    # Flushing before the list is loaded would overwrite the saved one
+    flush_recent_files_periodically()
+    mark_startup('recent_files')
+    report_startup()
+
+def report_startup():
+    first_paint_ms = (dict(startup_marks)['first_paint'] - STARTUP_STARTED) * 1000
+    logging.info(f"Startup timings (stage, duration, since start):\n{format_startup_timings()}")
+    budget_ms = get_setting('Settings', 'startup_budget_ms', STARTUP_BUDGET_MS, int)
+    if first_paint_ms > budget_ms:
+        logging.warning(f"Window took {first_paint_ms:.0f} ms to appear, over the {budget_ms} ms startup budget")
+    if '--startup-report' in sys.argv[1:]:
+        print(format_startup_timings())
+        on_close()
+
+def load_image(file_path=None):
+    global image_path, preview_image, photo_image
+    image_path = None
+    if file_path:
+        image_path = file_path
+    else:
+        initialdir = get_setting('Settings', 'last_load_directory', '')
+        image_path = filedialog.askopenfilename(
+            title="Select an Image",
+            initialdir=initialdir,
+            filetypes=[("All Images", "*.jpg;*.png;*.ico;*.bmp;*.tiff;*.gif"), 
+                       ("JPEG Images", "*.jpg"), ("PNG Images", "*.png"), 
+                       ("ICO Files", "*.ico"), ("BMP Files", "*.bmp"), 
+                       ("TIFF Files", "*.tiff"), ("GIF Files", "*.gif")]
+        )
+    if image_path:
+        from resize_engine import PREVIEW_SIZE
+        try:
+            # Only a reduced preview is decoded here (or read from the thumbnail
+            # cache); saves reopen image_path at full resolution
+            preview_image = get_cached_thumbnail(image_path, PREVIEW_SIZE)
+            display_image()
+            set_setting('Settings', 'last_load_directory', os.path.dirname(image_path))
+            logging.info(f"Loaded image: {image_path}")
+        except (IOError, OSError) as e:
+            logging.error(f"Error loading image: {str(e)}")
+            messagebox.showerror("Error", f"Error loading image: {str(e)}")
+            image_path = None
+    else:
+        preview_image = None
+
+def get_cached_thumbnail(file_path, max_size):
+    from thumbnail_cache import get_thumbnail, DEFAULT_MAX_BYTES as THUMBNAIL_CACHE_MAX_BYTES
+    max_bytes = get_setting('Settings', 'thumbnail_cache_mb', THUMBNAIL_CACHE_MAX_BYTES // (1024 * 1024), int) * 1024 * 1024
+    return get_thumbnail(file_path, max_size, THUMBNAIL_CACHE_DIR, max_bytes)
+
+def display_image():
+    global image_label, photo_image
+    # ImageTk is only needed once there is something to show
+    from PIL import ImageTk
+    if preview_image:
+        try:
+            photo_image = ImageTk.PhotoImage(preview_image)
+            image_label.config(image=photo_image)
+            image_label.image = photo_image
+        except (AttributeError, TclError):
+            pass
+
+def load_default_image():
+    # The empty preview is just the grey frame behind the label
+    global preview_image, photo_image
+    preview_image = None
+    photo_image = None
+    image_label.config(image="", bg="grey")
+    image_label.image = None
+
+def get_selected_size():
+    custom_width = custom_width_var.get()
+    custom_height = custom_height_var.get()
+
+    if custom_width.isdigit() and custom_height.isdigit():
+        size_var.set(0)
+        return (int(custom_width), int(custom_height))
+    elif size_var.get() != 0:
+        return (size_var.get(), size_var.get())
+    messagebox.showerror("Error", "Please enter valid custom width and height or select a size.")
+    return None
+
+def get_output_format():
+    output_format = format_var.get()
+    if output_format not in SUPPORTED_FORMATS:
+        messagebox.showerror("Error", "Please select a valid output format.")
+        return None
+    return output_format
+
+def get_resize_quality():
+    from resize_engine import RESIZE_QUALITY, DEFAULT_QUALITY
+    quality = get_setting('Settings', 'resize_quality', DEFAULT_QUALITY)
+    return quality if quality in RESIZE_QUALITY else DEFAULT_QUALITY
+
+def get_encoder_profile():
+    from resize_engine import ENCODER_PROFILE_NAMES, DEFAULT_ENCODER_PROFILE
+    profile = get_setting('Settings', 'encoder_profile', DEFAULT_ENCODER_PROFILE)
+    return profile if profile in ENCODER_PROFILE_NAMES else DEFAULT_ENCODER_PROFILE
+
+def get_resampler():
+    from resamplers import RESAMPLER_NAMES, DEFAULT_RESAMPLER
+    resampler = get_setting('Settings', 'resampler', DEFAULT_RESAMPLER)
+    return resampler if resampler in RESAMPLER_NAMES else DEFAULT_RESAMPLER
+
+def get_icon_set_sizes():
+    from resize_engine import ICON_SET_SIZES
+    sizes = [int(s) for s in get_setting('Settings', 'icon_set_sizes', '').split(",") if s.strip().isdigit()]
+    return sizes or ICON_SET_SIZES
+
+def resize_and_save():
+    if not image_path:
+        messagebox.showerror("Error", "Please select an image.")
+        return
+
+    if icon_set_var.get() == 1:
+        sizes = get_icon_set_sizes()
+        output_format = "ICO"
+    else:
+        selected_size = get_selected_size()
+        if not selected_size:
+            return
+        output_format = get_output_format()
+        if not output_format:
+            return
+        sizes = [selected_size] + get_extra_targets(output_format)
+
+    options = {
+        'maintain_aspect_ratio': maintain_aspect_ratio_var.get() == 1,
+        'save_directory': save_directory,
+        'icon_set': icon_set_var.get() == 1,
+        'quality': get_resize_quality(),
+        'encoder_profile': get_encoder_profile(),
+        'resampler': get_resampler(),
+        'calibration': RESAMPLER_CALIBRATION_FILE,
+    }
+    start_job()
+    job_executor.submit(run_single_job, image_path, sizes, output_format, options)
+
+def run_single_job(source_path, sizes, output_format, options):
+    # The full-resolution source is only decoded here, on the job thread
+    from resize_engine import resize_file
+    results = resize_file(source_path, sizes, output_format, options)
+    emit_results(results)
+    for result in results:
+        if result['output']:
+            job_queue.put(('single_saved', result['output']))
+        else:
+            job_queue.put(('single_error', result['error']))
+    job_queue.put(('done', None))
+
+def open_folder(filepath=None):
+    if not filepath:
+        filepath = saved_filepath.get()
+        if not filepath:
+            messagebox.showinfo("Info", "No file saved yet.")
+            return
+
+    folder_path = os.path.dirname(filepath)
+    try:
+        if os.name == 'nt':
+            os.startfile(folder_path)
+        elif os.name == 'posix':
+            subprocess.Popen(['open', folder_path])
+    except Exception as e:
+        messagebox.showerror("Error", f"Failed to open folder: {str(e)}")
+
+def select_save_directory():
+    global save_directory
+    selected_directory = filedialog.askdirectory(title="Select Save Directory", initialdir=save_directory)
+    if selected_directory:
+        save_directory = selected_directory
+        save_directory_label.config(text=f"Save Directory: {save_directory}")
+        set_setting('Settings', 'last_save_directory', save_directory)
+        save_settings()
+        logging.debug(f"Save directory updated to: {save_directory}")
+
+def add_to_last_files(*filepaths):
+    # Appends are O(1); the file is written by the periodic/job-end flush
+    for filepath in filepaths:
+        add_recent_file(filepath)
+    append_to_last_files_display(filepaths)
+
+def update_last_files_display():
+    last_files_text.config(state="normal")
+    last_files_text.delete(1.0, "end")
+    for filepath in get_recent_files():
+        last_files_text.insert("end", filepath + "\n")
+    last_files_text.config(state="disabled")
+    last_files_text.see("end")  # Scroll to the bottom
+
+def append_to_last_files_display(filepaths):
+    # Insert only the new lines and drop the ones that fell out of the list
+    last_files_text.config(state="normal")
+    last_files_text.insert("end", "".join(filepath + "\n" for filepath in filepaths))
+    line_count = int(last_files_text.index("end-1c").split(".")[0]) - 1
+    excess = line_count - len(get_recent_files())
+    if excess > 0:
+        last_files_text.delete("1.0", f"{excess + 1}.0")
+    last_files_text.config(state="disabled")
+    last_files_text.see("end")  # Scroll to the bottom
+
+def load_recent_file(event):
+    # Double-clicking a recent file loads it as the current image
+    line = last_files_text.get(f"@{event.x},{event.y} linestart", f"@{event.x},{event.y} lineend").strip()
+    if line and os.path.exists(line):
+        load_image(line)
+    elif line:
+        messagebox.showerror("Error", f"File not found: {line}")
+
+def flush_recent_files_periodically():
+    flush_recent_files()
+    root.after(RECENT_FILES_FLUSH_MS, flush_recent_files_periodically)
+
+def clear_last_files():
+    clear_recent_files()
+    update_last_files_display()
+
+def validate_custom_size(event=None):
+    custom_width = custom_width_var.get()
+    custom_height = custom_height_var.get()
+    if custom_width.isdigit() and custom_height.isdigit():
+        size_var.set(0)
+    elif not custom_width.isdigit() or not custom_height.isdigit():
+        size_var.set(0)
+
+def clear_custom_size():
+    custom_width_var.set("")
+    custom_height_var.set("")
+    size_var.set(0)
+
+def resize_and_save_batch():
+    file_paths = filedialog.askopenfilenames(
+        title="Select Images for Batch Processing",
+        initialdir=get_setting('Settings', 'last_load_directory', ''),
+        filetypes=[("All Images", "*.jpg;*.png;*.ico;*.bmp;*.tiff;*.gif"), ("JPEG Images", "*.jpg"), ("PNG Images", "*.png"), 
+                   ("ICO Files", "*.ico"), ("BMP Files", "*.bmp"), ("TIFF Files", "*.tiff"), ("GIF Files", "*.gif")]
+    )
+
+    if not file_paths:
+        return
+
+    targets = get_batch_targets()
+    if not targets:
+        return
+
+    progress["maximum"] = len(file_paths)
+    progress["value"] = 0
+
+    start_job()
+    job_executor.submit(run_batch_job, file_paths, targets[0], targets[1], get_batch_options())
+
+def resize_and_save_folder():
+    # Streams the folder tree into the batch instead of listing it first and
+    # mirrors its structure under the save directory
+    folder = filedialog.askdirectory(title="Select Folder for Batch Processing",
+                                     initialdir=get_setting('Settings', 'last_load_directory', ''))
+    if not folder:
+        return
+
+    targets = get_batch_targets()
+    if not targets:
+        return
+
+    from resize_engine import iter_tree
+    options = get_batch_options()
+    options['source_root'] = folder
+    # Planning would walk and hash the whole tree before the first resize, so
+    # only batches of selected files are deduplicated
+    options['dedupe'] = None
+    include = [p.strip() for p in get_setting('Settings', 'folder_include', '').split(";") if p.strip()]
+    exclude = [p.strip() for p in get_setting('Settings', 'folder_exclude', '').split(";") if p.strip()]
+
+    # The total is unknown until the walk finishes
+    progress.config(mode="indeterminate")
+    start_job()
+    job_executor.submit(run_batch_job, iter_tree(folder, include, exclude, modified_before=time.time()),
+                        targets[0], targets[1], options)
+
+def get_batch_targets():
+    # Returns (sizes, output_format), or None after telling the user what is missing
+    if icon_set_var.get() == 1:
+        return get_icon_set_sizes(), "ICO"
+    selected_size = get_selected_size()
+    if not selected_size:
+        return None
+    output_format = get_output_format()
+    if not output_format:
+        return None
+    return [selected_size] + get_extra_targets(output_format), output_format
+
+def get_extra_targets(output_format):
+    # Extra outputs made from the same decode, e.g. "256:JPG; 64:PNG"
+    from resize_engine import parse_target
+    targets = []
+    for text in get_setting('Settings', 'extra_targets', '').split(";"):
+        if text.strip():
+            try:
+                targets.append(parse_target(text.strip(), output_format))
+            except ValueError as e:
+                logging.warning(f"Ignoring extra target '{text.strip()}': {str(e)}")
+    return targets
+
+def get_batch_options():
+    from resize_engine import default_worker_count
+    return {
+        'maintain_aspect_ratio': maintain_aspect_ratio_var.get() == 1,
+        'save_directory': save_directory,
+        'workers': get_setting('Settings', 'batch_workers', default_worker_count(), int),
+        'icon_set': icon_set_var.get() == 1,
+        'quality': get_resize_quality(),
+        'encoder_profile': get_encoder_profile(),
+        'resampler': get_resampler(),
+        'calibration': RESAMPLER_CALIBRATION_FILE,
+        'memory_budget': get_setting('Settings', 'memory_budget_mb', 0, int) * 1024 * 1024 or None,
+        'backend': get_setting('Settings', 'resize_backend', 'pillow'),
+        'cache': OUTPUT_CACHE_FILE if get_setting('Settings', 'output_cache', False, bool) else None,
+        'journal': BATCH_JOURNAL_FILE if get_setting('Settings', 'resume_batches', False, bool) else None,
+        'dedupe': 'link' if get_setting('Settings', 'dedupe_batches', False, bool) else None,
+    }
+
+def run_batch_job(file_paths, sizes, output_format, options):
+    from resize_engine import iter_resize_batch
+    errors = []
+    processed = 0
+    cached = 0
+    try:
+        # Results arrive in order of completion when running on several workers
+        for file_results in iter_resize_batch(file_paths, sizes, output_format, options,
+                                              cancel_event=cancel_event, pause_event=pause_event):
+            for result in file_results:
+                if result['cached']:
+                    cached += 1
+                elif result['output']:
+                    job_queue.put(('saved', result['output']))
+                else:
+                    errors.append(result)
+            processed += 1
+            job_queue.put(('progress', processed))
+    except Exception as e:
+        logging.error(f"Batch processing failed: {str(e)}")
+        errors.append({'source': '', 'size': None, 'output': None, 'error': str(e)})
+    job_queue.put(('batch_done', (processed, errors, cancel_event.is_set(), cached)))
+    job_queue.put(('done', None))
+
+def start_job():
+    global job_running
+    job_running = True
+    cancel_event.clear()
+    pause_event.clear()
+    save_button.config(state="disabled")
+    batch_button.config(state="disabled")
+    folder_batch_button.config(state="disabled")
+    pause_button.config(state="normal", text="Pause")
+    cancel_button.config(state="normal")
+
+def finish_job():
+    global job_running
+    job_running = False
+    save_button.config(state="normal")
+    batch_button.config(state="normal")
+    folder_batch_button.config(state="normal")
+    pause_button.config(state="disabled", text="Pause")
+    cancel_button.config(state="disabled")
+    progress.config(mode="determinate")
+    progress["value"] = 0
+
+def toggle_pause():
+    if pause_event.is_set():
+        pause_event.clear()
+        pause_button.config(text="Pause")
+    else:
+        pause_event.set()
+        pause_button.config(text="Resume")
+
+def cancel_job():
+    cancel_event.set()
+    cancel_button.config(state="disabled")
+
+def report_batch_done(processed, errors, cancelled, cached=0):
+    skipped = f" {cached} unchanged output(s) were skipped." if cached else ""
+    if cancelled:
+        messagebox.showinfo("Info", f"Batch processing cancelled after {processed} file(s).")
+    elif errors:
+        details = "\n".join(f"{os.path.basename(result['source'])}: {result['error']}" for result in errors[:10])
+        if len(errors) > 10:
+            details += f"\n... and {len(errors) - 10} more (see image_resizer.log)"
+        messagebox.showwarning("Info", f"Batch processing completed with {len(errors)} error(s).{skipped}\n{details}")
+    else:
+        messagebox.showinfo("Info", f"Batch processing completed.{skipped}")
+    open_folder_button.config(state="normal")
+
+def poll_job_queue():
+    # Handle a bounded number of messages per tick so a fast batch cannot starve the UI;
+    # saved paths are collected and added to the recent files list in one go
+    saved = []
+    job_done = False
+    try:
+        for _ in range(200):
+            kind, payload = job_queue.get_nowait()
+            if kind == 'saved':
+                saved.append(payload)
+            elif kind == 'progress':
+                if progress["mode"] == "indeterminate":
+                    progress.step()
+                    saved_filepath.set(f"Processed {payload} file(s)")
+                else:
+                    progress["value"] = payload
+            elif kind == 'single_saved':
+                open_folder_button.config(state="normal")
+                saved_filepath.set(payload)
+                saved.append(payload)
+            elif kind == 'single_error':
+                messagebox.showerror("Error", f"Failed to resize and save image: {payload}")
+            elif kind == 'batch_done':
+                report_batch_done(*payload)
+            elif kind == 'done':
+                job_done = True
+            elif kind == 'recent_files':
+                show_recent_files(payload)
+    except queue.Empty:
+        pass
+    if saved:
+        add_to_last_files(*saved)
+    if job_done:
+        finish_job()
+        flush_recent_files()
+    root.after(100, poll_job_queue)
+
+def on_close():
+    cancel_event.set()
+    job_executor.shutdown(wait=False)
+    thumbnail_executor.shutdown(wait=False, cancel_futures=True)
+    root.destroy()
+
+def show_settings():
+    from resize_engine import RESIZE_QUALITY, ENCODER_PROFILE_NAMES, default_worker_count
+    from resamplers import RESAMPLER_NAMES
+    settings_window = Toplevel(root)
+    settings_window.title("Settings")
+    settings_window.geometry("680x660")
+    settings_window.attributes('-topmost', True)  # Ensure the settings window stays on top
+
+    settings_frame = Frame(settings_window)
+    settings_frame.pack(fill="both", expand=True)
+
+    Label(settings_frame, text="Settings", font=("Arial", 14)).grid(row=0, column=0, columnspan=2, pady=10)
+
+    Label(settings_frame, text="Default Save Directory:").grid(row=1, column=0, sticky="e", padx=5, pady=5)
+    def_save_dir_entry = Entry(settings_frame, width=50)
+    def_save_dir_entry.grid(row=1, column=1, pady=5)
+    def_save_dir_entry.insert(0, save_directory)
+
+    def select_directory(entry_widget):
+        settings_window.attributes('-topmost', False)  # Remove always-on-top attribute before opening the dialog
+        directory = filedialog.askdirectory(title="Select Directory")
+        settings_window.attributes('-topmost', True)  # Re-enable always-on-top attribute after closing the dialog
+        if directory:
+            entry_widget.delete(0, "end")
+            entry_widget.insert(0, directory)
+            set_setting('Settings', 'last_save_directory', directory)  # Save the directory immediately
+
+    def save_def_save_dir():
+        set_setting('Settings', 'last_save_directory', def_save_dir_entry.get())
+        save_directory_label.config(text=f"Save Directory: {def_save_dir_entry.get()}")  # Update the label immediately
+
+    def_save_dir_button = Button(settings_frame, text="Browse", command=lambda: select_directory(def_save_dir_entry))
+    def_save_dir_button.grid(row=1, column=2, padx=5)
+
+    Label(settings_frame, text="Default Load Directory:").grid(row=2, column=0, sticky="e", padx=5, pady=5)
+    def_load_dir_entry = Entry(settings_frame, width=50)
+    def_load_dir_entry.grid(row=2, column=1, pady=5)
+    def_load_dir_entry.insert(0, get_setting('Settings', 'last_load_directory', ''))
+
+    def save_def_load_dir():
+        set_setting('Settings', 'last_load_directory', def_load_dir_entry.get())
+
+    def_load_dir_button = Button(settings_frame, text="Browse", command=lambda: select_directory(def_load_dir_entry))
+    def_load_dir_button.grid(row=2, column=2, padx=5)
+
+    Label(settings_frame, text="Recent Files Limit:").grid(row=3, column=0, sticky="e", padx=5, pady=5)
+    rec_files_limit_spinbox = Spinbox(settings_frame, from_=1, to=100, width=5)
+    rec_files_limit_spinbox.grid(row=3, column=1, pady=5)
+    rec_files_limit_spinbox.delete(0, "end")
+    rec_files_limit_spinbox.insert(0, int(get_setting('Settings', 'recent_files_limit', 20)))
+
+    def save_rec_files_limit():
+        new_limit = int(rec_files_limit_spinbox.get())
+        set_recent_files_limit(new_limit)
+        set_setting('Settings', 'recent_files_limit', new_limit)
+        flush_recent_files()
+        update_last_files_display()
+
+    Label(settings_frame, text="Default Output Format:").grid(row=4, column=0, sticky="e", padx=5, pady=5)
+    def_output_format_var = StringVar(settings_window)
+    def_output_format_var.set(format_var.get())
+    def_output_format_dropdown = OptionMenu(settings_frame, def_output_format_var, *SUPPORTED_FORMATS)
+    def_output_format_dropdown.grid(row=4, column=1, pady=5)
+
+    def save_def_output_format():
+        format_var.set(def_output_format_var.get())
+        set_setting('Settings', 'default_format', def_output_format_var.get())
+
+    Label(settings_frame, text="Default Size Options (comma separated):").grid(row=5, column=0, sticky="e", padx=5, pady=5)
+    def_size_entry = Entry(settings_frame, width=50)
+    def_size_entry.grid(row=5, column=1, pady=5)
+    def_size_entry.insert(0, "16,32,64")
+
+    def save_def_size():
+        sizes = [int(s) for s in def_size_entry.get().split(",") if s.isdigit()]
+        if sizes:
+            global size_var
+            size_var = IntVar(value=sizes[0])
+            for widget in size_button_frame.winfo_children():
+                widget.destroy()
+            for size in sizes:
+                Radiobutton(size_button_frame, text=f"{size}x{size}", variable=size_var, value=size).pack(side="left", padx=10)
+            set_setting('Settings', 'default_size', sizes[0])
+
+    def_aspect_ratio_var = IntVar(value=maintain_aspect_ratio_var.get())
+    def_aspect_ratio_check = Checkbutton(settings_frame, text="Maintain aspect ratio by default", variable=def_aspect_ratio_var)
+    def_aspect_ratio_check.grid(row=6, column=0, columnspan=2, pady=5)
+
+    def save_def_aspect_ratio():
+        maintain_aspect_ratio_var.set(def_aspect_ratio_var.get())
+        set_setting('Settings', 'maintain_aspect_ratio', def_aspect_ratio_var.get())
+
+    # Batch planning: identical sources are resized once and hardlinked, and
+    # sources whose outputs would overwrite each other are renamed
+    dedupe_batches_var = IntVar(value=1 if get_setting('Settings', 'dedupe_batches', False, bool) else 0)
+    dedupe_batches_check = Checkbutton(settings_frame, text="Link duplicate sources, rename collisions",
+                                       variable=dedupe_batches_var)
+    dedupe_batches_check.grid(row=6, column=2, padx=5, pady=5)
+
+    def save_dedupe_batches():
+        set_setting('Settings', 'dedupe_batches', dedupe_batches_var.get() == 1)
+
+    Label(settings_frame, text="Batch Worker Processes:").grid(row=7, column=0, sticky="e", padx=5, pady=5)
+    batch_workers_spinbox = Spinbox(settings_frame, from_=1, to=max(64, default_worker_count()), width=5)
+    batch_workers_spinbox.grid(row=7, column=1, pady=5)
+    batch_workers_spinbox.delete(0, "end")
+    batch_workers_spinbox.insert(0, get_setting('Settings', 'batch_workers', default_worker_count(), int))
+
+    def save_batch_workers():
+        if batch_workers_spinbox.get().isdigit():
+            set_setting('Settings', 'batch_workers', max(1, int(batch_workers_spinbox.get())))
+
+    Label(settings_frame, text="Icon Set Sizes (comma separated):").grid(row=8, column=0, sticky="e", padx=5, pady=5)
+    icon_set_sizes_entry = Entry(settings_frame, width=50)
+    icon_set_sizes_entry.grid(row=8, column=1, pady=5)
+    icon_set_sizes_entry.insert(0, ",".join(str(size) for size in get_icon_set_sizes()))
+
+    def save_icon_set_sizes():
+        sizes = [s.strip() for s in icon_set_sizes_entry.get().split(",") if s.strip().isdigit() and int(s) > 0]
+        if sizes:
+            set_setting('Settings', 'icon_set_sizes', ",".join(sizes))
+
+    def save_all_settings():
+        save_def_save_dir()
+        save_def_load_dir()
+        save_rec_files_limit()
+        save_def_output_format()
+        save_def_size()
+        save_def_aspect_ratio()
+        save_batch_workers()
+        save_icon_set_sizes()
+        save_output_cache()
+        save_resume_batches()
+        save_dedupe_batches()
+        save_resize_quality()
+        save_resize_backend()
+        save_encoder_profile()
+        save_resampler()
+        save_memory_budget()
+        save_folder_patterns()
+        save_extra_targets()
+        flush_settings()
+        messagebox.showinfo("Settings", "Settings saved successfully!")
+        settings_window.destroy()
+
+    output_cache_var = IntVar(value=1 if get_setting('Settings', 'output_cache', False, bool) else 0)
+    output_cache_check = Checkbutton(settings_frame, text="Skip unchanged outputs in batches (output cache)",
+                                     variable=output_cache_var)
+    output_cache_check.grid(row=9, column=0, columnspan=2, pady=5)
+
+    def save_output_cache():
+        set_setting('Settings', 'output_cache', output_cache_var.get() == 1)
+
+    resume_batches_var = IntVar(value=1 if get_setting('Settings', 'resume_batches', False, bool) else 0)
+    resume_batches_check = Checkbutton(settings_frame, text="Resume interrupted batches",
+                                       variable=resume_batches_var)
+    resume_batches_check.grid(row=9, column=2, padx=5, pady=5)
+
+    def save_resume_batches():
+        set_setting('Settings', 'resume_batches', resume_batches_var.get() == 1)
+
+    Label(settings_frame, text="Downscale Quality:").grid(row=10, column=0, sticky="e", padx=5, pady=5)
+    resize_quality_var = StringVar(settings_window)
+    resize_quality_var.set(get_resize_quality())
+    resize_quality_dropdown = OptionMenu(settings_frame, resize_quality_var, *RESIZE_QUALITY)
+    resize_quality_dropdown.grid(row=10, column=1, pady=5)
+
+    def save_resize_quality():
+        set_setting('Settings', 'resize_quality', resize_quality_var.get())
+
+    # NumPy backend: same-size sources in a batch are resized together
+    resize_backend_var = StringVar(settings_window)
+    resize_backend_var.set(get_setting('Settings', 'resize_backend', 'pillow'))
+    resize_backend_dropdown = OptionMenu(settings_frame, resize_backend_var, 'pillow', 'numpy')
+    resize_backend_dropdown.grid(row=10, column=2, padx=5, pady=5)
+
+    def save_resize_backend():
+        set_setting('Settings', 'resize_backend', resize_backend_var.get())
+
+    Label(settings_frame, text="Folder Batch Include (; separated):").grid(row=11, column=0, sticky="e", padx=5, pady=5)
+    folder_include_entry = Entry(settings_frame, width=50)
+    folder_include_entry.grid(row=11, column=1, pady=5)
+    folder_include_entry.insert(0, get_setting('Settings', 'folder_include', ''))
+
+    Label(settings_frame, text="Folder Batch Exclude (; separated):").grid(row=12, column=0, sticky="e", padx=5, pady=5)
+    folder_exclude_entry = Entry(settings_frame, width=50)
+    folder_exclude_entry.grid(row=12, column=1, pady=5)
+    folder_exclude_entry.insert(0, get_setting('Settings', 'folder_exclude', ''))
+
+    Label(settings_frame, text="Extra Output Targets (e.g. 256:JPG; 64:PNG):").grid(row=13, column=0, sticky="e", padx=5, pady=5)
+    extra_targets_entry = Entry(settings_frame, width=50)
+    extra_targets_entry.grid(row=13, column=1, pady=5)
+    extra_targets_entry.insert(0, get_setting('Settings', 'extra_targets', ''))
+
+    Label(settings_frame, text="Encoder Profile:").grid(row=14, column=0, sticky="e", padx=5, pady=5)
+    encoder_profile_var = StringVar(settings_window)
+    encoder_profile_var.set(get_encoder_profile())
+    encoder_profile_dropdown = OptionMenu(settings_frame, encoder_profile_var, *ENCODER_PROFILE_NAMES)
+    encoder_profile_dropdown.grid(row=14, column=1, pady=5)
+
+    def save_encoder_profile():
+        set_setting('Settings', 'encoder_profile', encoder_profile_var.get())
+
+    # Resize backend; 'auto' picks Pillow or OpenCV per mode and scale after a one-off calibration
+    resampler_var = StringVar(settings_window)
+    resampler_var.set(get_resampler())
+    resampler_dropdown = OptionMenu(settings_frame, resampler_var, *RESAMPLER_NAMES)
+    resampler_dropdown.grid(row=14, column=2, padx=5, pady=5)
+
+    def save_resampler():
+        set_setting('Settings', 'resampler', resampler_var.get())
+
+    Label(settings_frame, text="Batch Memory Budget (MB, 0 = no limit):").grid(row=15, column=0, sticky="e", padx=5, pady=5)
+    memory_budget_spinbox = Spinbox(settings_frame, from_=0, to=1048576, increment=256, width=10)
+    memory_budget_spinbox.grid(row=15, column=1, pady=5)
+    memory_budget_spinbox.delete(0, "end")
+    memory_budget_spinbox.insert(0, get_setting('Settings', 'memory_budget_mb', 0, int))
+
+    def save_memory_budget():
+        value = memory_budget_spinbox.get().strip()
+        if value.isdigit():
+            set_setting('Settings', 'memory_budget_mb', int(value))
+
+    def save_extra_targets():
+        set_setting('Settings', 'extra_targets', extra_targets_entry.get().strip())
+
+    def save_folder_patterns():
+        set_setting('Settings', 'folder_include', folder_include_entry.get().strip())
+        set_setting('Settings', 'folder_exclude', folder_exclude_entry.get().strip())
+
+    Button(settings_frame, text="Save and Close", command=save_all_settings).grid(row=16, column=0, columnspan=2, pady=10)
+
+def show_statistics():
+    stats_window = Toplevel(root)
+    stats_window.title("Statistics")
+    stats_window.geometry("480x440")
+
+    Label(stats_window, text="Resize Statistics", font=("Arial", 14)).pack(pady=10)
+    stats_text = Text(stats_window, wrap="none", height=20, width=60, font=("Courier", 10))
+    stats_text.pack(padx=10, pady=5)
+
+    def refresh_stats():
+        if not stats_window.winfo_exists():
+            return
+        stats_text.config(state="normal")
+        stats_text.delete(1.0, "end")
+        stats_text.insert("1.0", format_stats() + "\n\nStartup:\n" + format_startup_timings())
+        stats_text.config(state="disabled")
+        stats_window.after(1000, refresh_stats)
+
+    def clear_stats():
+        reset_stats()
+        refresh_stats()
+
+    Button(stats_window, text="Reset", command=clear_stats).pack(pady=5)
+    refresh_stats()
+
+def show_recent_outputs():
+    # Grid of recent outputs, newest first. Thumbnails are read or built on
+    # thumbnail_executor and handed to the Tk thread through a queue
+    from PIL import Image, ImageTk
+    thumbs_window = Toplevel(root)
+    thumbs_window.title("Recent Outputs")
+    thumbs_window.geometry("600x500")
+
+    canvas = Canvas(thumbs_window)
+    thumbs_scrollbar = Scrollbar(thumbs_window, command=canvas.yview)
+    canvas.config(yscrollcommand=thumbs_scrollbar.set)
+    thumbs_scrollbar.pack(side="right", fill="y")
+    canvas.pack(side="left", fill="both", expand=True)
+    grid_frame = Frame(canvas)
+    canvas.create_window((0, 0), window=grid_frame, anchor="nw")
+    grid_frame.bind("<Configure>", lambda event: canvas.config(scrollregion=canvas.bbox("all")))
+
+    thumbs_queue = queue.Queue()
+    labels = []
+    photos = []
+    futures = []
+    placeholder = ImageTk.PhotoImage(Image.new("RGB", RECENT_THUMBNAIL_SIZE, color="grey"))
+    photos.append(placeholder)
+
+    def build_thumbnail(index, file_path):
+        try:
+            thumbs_queue.put((index, get_cached_thumbnail(file_path, RECENT_THUMBNAIL_SIZE)))
+        except Exception as e:
+            logging.warning(f"No thumbnail for {file_path}: {str(e)}")
+
+    for index, file_path in enumerate(reversed(list(get_recent_files()))):
+        cell = Frame(grid_frame)
+        cell.grid(row=index // RECENT_THUMBNAIL_COLUMNS, column=index % RECENT_THUMBNAIL_COLUMNS, padx=5, pady=5)
+        label = Label(cell, image=placeholder, cursor="hand2")
+        label.pack()
+        label.bind("<Button-1>", lambda event, path=file_path: load_image(path) if os.path.exists(path) else None)
+        Label(cell, text=os.path.basename(file_path)[:16]).pack()
+        labels.append(label)
+        futures.append(thumbnail_executor.submit(build_thumbnail, index, file_path))
+
+    def poll_thumbnails():
+        if not thumbs_window.winfo_exists():
+            return
+        try:
+            for _ in range(20):
+                index, thumb = thumbs_queue.get_nowait()
+                photo = ImageTk.PhotoImage(thumb)
+                photos.append(photo)
+                labels[index].config(image=photo)
+        except queue.Empty:
+            pass
+        thumbs_window.after(50, poll_thumbnails)
+
+    def close_thumbs_window():
+        for future in futures:
+            future.cancel()
+        thumbs_window.destroy()
+
+    thumbs_window.protocol("WM_DELETE_WINDOW", close_thumbs_window)
+    poll_thumbnails()
+
+def show_help():
+    help_window = Toplevel(root)
+    help_window.title("Help")
+    help_window.geometry("600x300")
+
+    Label(help_window, text="Help", font=("Arial", 14)).pack(pady=10)
+    help_text = Text(help_window, wrap="word", height=150, width=100)
+    help_text.pack(pady=10)
+    help_text.insert("1.0", "Instructions:\n\n1. Load an image using 'Load Image' or drag and drop an image.\n"
+                            "2. Select a size or enter custom dimensions.\n"
+                            "3. Choose an output format. Extra sizes/formats made from the same decode can be\n"
+                            "   set under 'Extra Output Targets' in Settings.\n"
+                            "4. Click 'Resize and Save' or 'Batch Resize and Save' for multiple images.\n"
+                            "   Tick 'Multi-size ICO' to write one .ico with all icon set sizes instead.\n"
+                            "   'Batch Resize Folder' walks a whole folder tree and mirrors it in the save directory.\n"
+                            "5. Use 'Open Folder' to view saved images.\n"
+                            "6. Set the save directory using 'Settings' in the menu.\n"
+                            "7. Recent files are displayed below and can be cleared with 'Clear'.\n"
+                            "   Double-click one to load it, or open Settings > Recent Outputs for thumbnails.")
+    help_text.config(state="disabled")
+
+if __name__ == "__main__":
+    # Initialize Tkinter window with TkinterDnD
+    mark_startup('imports')
+    root = TkinterDnD.Tk()
+    root.title("Image Resizer")
+    root.geometry("660x840")
+    mark_startup('window')
+
+    # Menu bar
+    menu_bar = Menu(root)
+    root.config(menu=menu_bar)
+
+    # Adding Settings menu
+    settings_menu = Menu(menu_bar, tearoff=0)
+    menu_bar.add_cascade(label="Settings", menu=settings_menu)
+    settings_menu.add_command(label="Settings", command=show_settings)
+    settings_menu.add_command(label="Statistics", command=show_statistics)
+    settings_menu.add_command(label="Recent Outputs", command=show_recent_outputs)
+
+    # Adding Help menu
+    help_menu = Menu(menu_bar, tearoff=0)
+    menu_bar.add_cascade(label="Help", menu=help_menu)
+    help_menu.add_command(label="Help", command=show_help)
+
+    # Title label
+    title_label = Label(root, text="Image Resizer", font=("Arial", 16, "bold"), fg="blue")
+    title_label.grid(row=0, column=0, columnspan=3, pady=10)
+
+    # Image preview frame
+    image_frame = Frame(root, width=300, height=300, bg="grey")
+    image_frame.grid(row=1, column=0, rowspan=4, padx=10, pady=10)
+    image_frame.grid_propagate(False)
+
+    # Image label for displaying the image
+    image_label = Label(image_frame)
+    image_label.pack(expand=True)
+
+    # Load default image on startup
+    load_default_image()
+
+    # Load image button
+    load_button = Button(root, text="Load Image", command=load_image)
+    load_button.grid(row=1, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
+
+    # Drag and drop functionality
+    def on_drop(event):
+        file_path = event.data
+        file_path = file_path.replace('{', '').replace('}', '')  # Clean up path
+        load_image(file_path)
+
+    root.drop_target_register(DND_FILES)
+    root.dnd_bind('<<Drop>>', on_drop)
+
+    # Select size label
+    select_size_label = Label(root, text="Select Size:")
+    select_size_label.grid(row=2, column=1, padx=10, pady=10, sticky="w")
+
+    # Radio button variables and labels
+    size_var = IntVar(value=0)
+
+    size_button_frame = Frame(root)
+    size_button_frame.grid(row=3, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
+
+    size_label1 = Radiobutton(size_button_frame, text="16x16", variable=size_var, value=16)
+    size_label1.pack(side="left", padx=10)
+
+    size_label2 = Radiobutton(size_button_frame, text="32x32", variable=size_var, value=32)
+    size_label2.pack(side="left", padx=10)
+
+    size_label3 = Radiobutton(size_button_frame, text="64x64", variable=size_var, value=64)
+    size_label3.pack(side="left", padx=10)
+
+    # Aspect ratio maintenance checkbox
+    maintain_aspect_ratio_var = IntVar(value=0)
+    maintain_aspect_ratio_checkbox = Checkbutton(root, text="Maintain aspect ratio", variable=maintain_aspect_ratio_var)
+    maintain_aspect_ratio_checkbox.grid(row=4, column=1, columnspan=1, pady=5, sticky="w")
+
+    # Icon set checkbox: one ICO containing every size from the settings
+    icon_set_var = IntVar(value=0)
+    icon_set_checkbox = Checkbutton(root, text="Multi-size ICO (icon set)", variable=icon_set_var)
+    icon_set_checkbox.grid(row=4, column=2, columnspan=1, pady=5, sticky="w")
+
+    # Custom size entries
+    custom_size_frame = Frame(root)
+    custom_size_frame.grid(row=5, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
+
+    custom_size_label = Label(custom_size_frame, text="Custom Size:")
+    custom_size_label.pack(side="left", padx=10)
+
+    custom_width_var = StringVar()
+    custom_width_entry = Entry(custom_size_frame, textvariable=custom_width_var, width=5)
+    custom_width_entry.pack(side="left", padx=5)
+    custom_width_entry.bind("<KeyRelease>", validate_custom_size)
+
+    x_label = Label(custom_size_frame, text="x")
+    x_label.pack(side="left", padx=5)
+
+    custom_height_var = StringVar()
+    custom_height_entry = Entry(custom_size_frame, textvariable=custom_height_var, width=5)
+    custom_height_entry.pack(side="left", padx=5)
+    custom_height_entry.bind("<KeyRelease>", validate_custom_size)
+
+    # Clear button
+    clear_button = Button(custom_size_frame, text="Clear", command=clear_custom_size)
+    clear_button.pack(side="left", padx=10)
+
+    # Output format label and dropdown
+    format_label = Label(root, text="Select Output Format:")
+    format_label.grid(row=6, column=0, padx=10, pady=10, sticky="w")
+
+    format_var = StringVar(root)
+    format_var.set("ICO")
+
+    format_dropdown = OptionMenu(root, format_var, *SUPPORTED_FORMATS)
+    format_dropdown.grid(row=6, column=1, columnspan=2, padx=10, pady=10, sticky="ew")
+
+    # Resize and save button
+    save_button = Button(root, text="Resize and Save", command=resize_and_save)
+    save_button.grid(row=7, column=0, columnspan=1, pady=10, sticky="ew")
+
+    # Resize and save batch button
+    batch_button = Button(root, text="Batch Resize and Save", command=resize_and_save_batch)
+    batch_button.grid(row=7, column=1, columnspan=2, pady=10, sticky="ew")
+
+    # Saved file path
+    saved_filepath = StringVar()
+    saved_filepath_label = Label(root, textvariable=saved_filepath)
+    saved_filepath_label.grid(row=8, column=0, columnspan=3, padx=10, pady=5)
+
+    # Open folder button
+    open_folder_button = Button(root, text="Open Folder", command=open_folder, state="disabled")
+    open_folder_button.grid(row=9, column=0, columnspan=1, pady=5, sticky="ew")
+
+    # Resize a whole folder tree
+    folder_batch_button = Button(root, text="Batch Resize Folder", command=resize_and_save_folder)
+    folder_batch_button.grid(row=9, column=1, columnspan=2, pady=5, sticky="ew")
+
+    # Frame for displaying last saved files
+    last_files_frame = Frame(root)
+    last_files_frame.grid(row=10, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
+
+    # Scrollable text widget to display last saved files
+    scrollbar = Scrollbar(last_files_frame)
+    scrollbar.pack(side="right", fill="y")
+
+    last_files_text = Text(last_files_frame, height=10, width=60, state="disabled", yscrollcommand=scrollbar.set)
+    last_files_text.pack(side="left", fill="both", expand=True)
+
+    scrollbar.config(command=last_files_text.yview)
+    last_files_text.bind("<Double-Button-1>", load_recent_file)
+
+    # Clear button
+    clear_files_button = Button(last_files_frame, text="Clear Recent Files", command=clear_last_files)
+    clear_files_button.pack(side="right", padx=10)
+
+    # Progress bar for batch processing
+    progress = ttk.Progressbar(root, orient="horizontal", length=400, mode="determinate")
+    progress.grid(row=11, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+
+    # Pause and cancel controls for the running job
+    job_controls_frame = Frame(root)
+    job_controls_frame.grid(row=11, column=2, padx=10, pady=10, sticky="e")
+
+    pause_button = Button(job_controls_frame, text="Pause", command=toggle_pause, state="disabled")
+    pause_button.pack(side="left", padx=5)
+
+    cancel_button = Button(job_controls_frame, text="Cancel", command=cancel_job, state="disabled")
+    cancel_button.pack(side="left", padx=5)
+
+    # Save directory label
+    save_directory_label = Label(root, text="Save Directory: Not Selected", fg="green")
+    save_directory_label.grid(row=12, column=0, columnspan=3, padx=10, pady=5)
+    mark_startup('widgets')
+
+    # Load initial settings
+    load_initial_settings()
+    mark_startup('settings')
+
+    # Start listening for background job updates
+    poll_job_queue()
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    # Idle callbacks run in order, so this one comes after the redraws queued
+    # while the widgets were built
+    root.after_idle(finish_startup)
+
+    # Keep the window running
+    root.mainloop()
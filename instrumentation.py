@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Per-job timing events for the resize pipeline. The engine records stage
+# timings on every result (also inside worker processes); the process that
+# drives the batch turns each source's results into one job event and hands
+# it to every registered sink.
+
+STAGES = ['decode', 'resize', 'convert', 'encode', 'write']
+
+# Number of recent jobs kept for the p50/p95 statistics
+STATS_WINDOW = 5000
+
+_sinks = []
+_lock = threading.Lock()
+_stage_samples = {stage: deque(maxlen=STATS_WINDOW) for stage in STAGES + ['total']}
+_totals = {'jobs': 0, 'outputs': 0, 'errors': 0, 'cached': 0, 'input_bytes': 0, 'output_bytes': 0,
+           'convert_bytes': 0, 'convert_bytes_saved': 0}
+_trace_file = None
+
+
+def new_timings():
+    return {stage: 0.0 for stage in STAGES}
+
+
+@contextmanager
+def stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] += time.perf_counter() - start
+
+
+def job_event(file_results):
+    # One event per source file, summed over all outputs made from it
+    first = file_results[0]
+    stages = new_timings()
+    for result in file_results:
+        for name, seconds in result.get('timings', {}).items():
+            stages[name] += seconds
+    return {
+        'timestamp': time.time(),
+        'source': first['source'],
+        'outputs': [result['output'] for result in file_results if result['output']],
+        'errors': [result['error'] for result in file_results if result['error']],
+        'cached': sum(1 for result in file_results if result.get('cached')),
+        'stages': stages,
+        'total': sum(stages.values()),
+        'input_bytes': first.get('input_bytes', 0),
+        'input_pixels': first.get('input_pixels', 0),
+        'output_bytes': sum(result.get('output_bytes', 0) for result in file_results),
+        'output_pixels': sum(result.get('output_pixels', 0) for result in file_results),
+        # Pixel buffers allocated by colour-mode conversions, and those the
+        # working modes avoided (see color_modes)
+        'convert_bytes': sum(result.get('convert_bytes', 0) for result in file_results),
+        'convert_bytes_saved': sum(result.get('convert_bytes_saved', 0) for result in file_results),
+    }
+
+
+def add_sink(sink):
+    with _lock:
+        if sink not in _sinks:
+            _sinks.append(sink)
+
+
+def remove_sink(sink):
+    with _lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def emit(event):
+    with _lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        try:
+            sink(event)
+        except Exception as e:
+            logging.error(f"Instrumentation sink failed: {str(e)}")
+
+
+def emit_results(file_results):
+    if _sinks and file_results:
+        emit(job_event(file_results))
+
+
+def log_sink(event):
+    # Goes to whatever handler the application configured (the rotating log in the GUI)
+    stages = " ".join(f"{name}={event['stages'][name] * 1000:.1f}ms" for name in STAGES)
+    logging.info(f"Job {event['source']}: {stages} in={event['input_bytes']}B out={event['output_bytes']}B "
+                 f"px_in={event['input_pixels']} px_out={event['output_pixels']} cached={event['cached']} "
+                 f"convert={event['convert_bytes']}B saved={event['convert_bytes_saved']}B")
+
+
+def open_trace(path):
+    # JSONL trace: one job event per line
+    global _trace_file
+    close_trace()
+    _trace_file = open(path, 'a', buffering=1)
+    add_sink(trace_sink)
+
+
+def close_trace():
+    global _trace_file
+    remove_sink(trace_sink)
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+
+def trace_sink(event):
+    if _trace_file is not None:
+        _trace_file.write(json.dumps(event) + "\n")
+
+
+def stats_sink(event):
+    with _lock:
+        _totals['jobs'] += 1
+        _totals['outputs'] += len(event['outputs'])
+        _totals['errors'] += len(event['errors'])
+        _totals['cached'] += event['cached']
+        _totals['input_bytes'] += event['input_bytes']
+        _totals['output_bytes'] += event['output_bytes']
+        _totals['convert_bytes'] += event['convert_bytes']
+        _totals['convert_bytes_saved'] += event['convert_bytes_saved']
+        if event['cached'] and not event['total']:
+            return
+        for name in STAGES:
+            _stage_samples[name].append(event['stages'][name])
+        _stage_samples['total'].append(event['total'])
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def stage_stats():
+    # p50/p95 in seconds per stage over the last STATS_WINDOW jobs, plus running totals
+    with _lock:
+        samples = {name: list(values) for name, values in _stage_samples.items()}
+        totals = dict(_totals)
+    stats = {name: {'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95), 'count': len(values)}
+             for name, values in samples.items()}
+    return {'stages': stats, 'totals': totals}
+
+
+def reset_stats():
+    with _lock:
+        for values in _stage_samples.values():
+            values.clear()
+        for key in _totals:
+            _totals[key] = 0
+
+
+def format_stats(stats=None):
+    stats = stats or stage_stats()
+    lines = [f"{'Stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'jobs':>8}"]
+    for name in STAGES + ['total']:
+        entry = stats['stages'][name]
+        if entry['count']:
+            lines.append(f"{name:<10}{entry['p50'] * 1000:>10.1f}{entry['p95'] * 1000:>10.1f}{entry['count']:>8}")
+    totals = stats['totals']
+    lines.append("")
+    lines.append(f"Jobs: {totals['jobs']}  outputs: {totals['outputs']}  cached: {totals['cached']}  "
+                 f"errors: {totals['errors']}")
+    lines.append(f"Read: {totals['input_bytes']} bytes  written: {totals['output_bytes']} bytes")
+    lines.append(f"Mode conversions: {totals['convert_bytes']} bytes allocated, "
+                 f"{totals['convert_bytes_saved']} bytes avoided")
+    return "\n".join(lines)
+
+
+def profiled(call, profile_path=None, trace_memory=False, top=25):
+    # Runs call() under cProfile and/or tracemalloc. Only work done in this
+    # process is captured, so profile batches with a single worker.
+    # The profilers are imported here; they are not needed on normal runs.
+    import cProfile
+    import pstats
+    import tracemalloc
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        return call()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            with open(os.path.splitext(profile_path)[0] + '.txt', 'w') as f:
+                pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(top)
+            logging.info(f"Profile written to {profile_path}")
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            logging.info(f"tracemalloc: current={current} peak={peak} bytes")
+            for statistic in snapshot.statistics('lineno')[:top]:
+                logging.info(f"tracemalloc: {statistic}")
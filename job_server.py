@@ -0,0 +1,552 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import signal
+import stat
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+import instrumentation
+import resamplers
+import resize_engine
+
+# Headless resize service: the engine behind a small HTTP/1.1 server on a
+# local TCP port or a Unix socket. asyncio handles the connections and the
+# pixel work runs on a bounded process pool whose workers stay warm, so a
+# request does not pay for interpreter and Pillow startup.
+#
+#   POST /resize with a JSON body resizes files on this machine:
+#       {"sources": ["/in/a.png"], "sizes": ["16", "32x32", "256:JPG"], "format": "PNG",
+#        "options": {"save_directory": "/out", "maintain_aspect_ratio": true}}
+#     One JSON line per source is streamed back as it finishes, then a summary line.
+#   POST /resize?size=64&format=PNG with the image bytes as the body resizes
+#     an upload and streams the image back. With several size= parameters the
+#     response is one JSON line per size with base64 data.
+#   GET /status returns queue depth, jobs in flight and counters.
+#
+# A worker that dies (killed, out of memory) breaks the whole pool. Its jobs
+# fail, the pool is replaced and later requests run on the new one. Over TCP
+# path jobs must set a save_directory inside an --allow-dir folder.
+#
+# Backpressure: at most workers * 2 jobs are on the pool at once. Requests
+# waiting for a slot are queued up to max_queue; past that they get 503 with
+# Retry-After. Responses are written with drain(), so a slow client only
+# holds back its own request.
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_MAX_UPLOAD = 64 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+STREAM_CHUNK = 64 * 1024
+
+# Window for the processing rate counter
+RATE_WINDOW = 60.0
+
+# Options a request may set; the rest are fixed on the command line
+REQUEST_OPTIONS = ('maintain_aspect_ratio', 'save_directory', 'quality', 'encoder_profile', 'resampler', 'frames',
+                   'icon_set')
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+CONTENT_TYPES = {
+    "ICO": 'image/x-icon',
+    "PNG": 'image/png',
+    "JPG": 'image/jpeg',
+    "BMP": 'image/bmp',
+    "TIFF": 'image/tiff',
+    "GIF": 'image/gif',
+    "WEBP": 'image/webp',
+}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def new_state(workers, max_queue, max_upload, options, allowed_dirs=None):
+    # allowed_dirs None lets requests write anywhere (Unix socket, owner only)
+    return {
+        'pool': ProcessPoolExecutor(max_workers=workers),
+        'allowed_dirs': allowed_dirs,
+        'workers': workers,
+        'slots': asyncio.Semaphore(workers * 2),
+        'max_queue': max_queue,
+        'max_upload': max_upload,
+        'options': resize_engine.merge_options(options),
+        'started': time.time(),
+        'queued': 0,
+        'running': 0,
+        'requests': 0,
+        'rejected': 0,
+        'jobs': 0,
+        'failed': 0,
+        'pool_restarts': 0,
+        'done_times': deque(),
+    }
+
+
+def status(state):
+    now = time.monotonic()
+    while state['done_times'] and now - state['done_times'][0] > RATE_WINDOW:
+        state['done_times'].popleft()
+    return {
+        'workers': state['workers'],
+        'max_in_flight': state['workers'] * 2,
+        'queued': state['queued'],
+        'running': state['running'],
+        'requests': state['requests'],
+        'rejected': state['rejected'],
+        'jobs': state['jobs'],
+        'failed': state['failed'],
+        'pool_restarts': state['pool_restarts'],
+        'rate_per_minute': len(state['done_times']) * 60.0 / RATE_WINDOW,
+        'uptime_seconds': round(time.time() - state['started'], 1),
+    }
+
+
+def warm_up_worker(options):
+    # Imports the engine (and loads the 'auto' calibration) in a pool worker;
+    # the short sleep keeps it busy so the next call starts another worker
+    resize_engine.prepare_resampler(resize_engine.merge_options(options))
+    time.sleep(0.05)
+    return os.getpid()
+
+
+async def warm_up(state):
+    loop = asyncio.get_running_loop()
+    pids = await asyncio.gather(*[loop.run_in_executor(state['pool'], warm_up_worker, state['options'])
+                                  for _ in range(state['workers'])])
+    logging.info(f"Started {len(set(pids))} worker process(es)")
+
+
+async def submit(state, func, *args):
+    # Waits for a pool slot, then returns the job's future. Callers check
+    # admit() first, so at most max_queue requests wait here.
+    state['queued'] += 1
+    try:
+        await state['slots'].acquire()
+    finally:
+        state['queued'] -= 1
+    state['running'] += 1
+    pool = state['pool']
+
+    def release(future):
+        state['running'] -= 1
+        state['jobs'] += 1
+        state['done_times'].append(time.monotonic())
+        state['slots'].release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            replace_pool(state, pool)
+
+    try:
+        future = asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    except Exception as e:
+        # Usually BrokenProcessPool, when a worker died since the last job
+        state['running'] -= 1
+        state['slots'].release()
+        if isinstance(e, BrokenProcessPool):
+            replace_pool(state, pool)
+        raise RequestError(503, f"No worker available: {str(e) or type(e).__name__}")
+    future.add_done_callback(release)
+    return future
+
+
+def replace_pool(state, broken):
+    # Jobs still on the broken pool fail with BrokenProcessPool; only the
+    # first of them starts a new pool
+    if state['pool'] is not broken:
+        return
+    logging.error("A worker process died; starting a new pool")
+    state['pool'] = ProcessPoolExecutor(max_workers=state['workers'])
+    state['pool_restarts'] += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def admit(state):
+    if state['queued'] >= state['max_queue']:
+        state['rejected'] += 1
+        raise RequestError(503, f"{state['queued']} requests are already waiting; try again shortly")
+
+
+async def read_request(reader):
+    # (method, target, version, headers), or None when the client closed the connection
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise RequestError(400, "Incomplete request headers")
+    except asyncio.LimitOverrunError:
+        raise RequestError(400, "Request headers too large")
+    lines = head.decode('latin-1').split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise RequestError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+async def read_body(reader, headers, max_bytes):
+    if 'transfer-encoding' in headers:
+        raise RequestError(411, "Chunked request bodies are not supported; send a Content-Length")
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError(400, "Invalid Content-Length")
+    if length > max_bytes:
+        raise RequestError(413, f"Request body over the {max_bytes} byte limit")
+    return await reader.readexactly(length)
+
+
+def response_head(status_code, headers):
+    lines = [f"HTTP/1.1 {status_code} {STATUS_TEXT[status_code]}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+
+async def send_body(writer, status_code, body, content_type, keep_alive=True, headers=None):
+    head = {'Content-Type': content_type, 'Content-Length': len(body),
+            'Connection': 'keep-alive' if keep_alive else 'close'}
+    head.update(headers or {})
+    writer.write(response_head(status_code, head))
+    for offset in range(0, len(body), STREAM_CHUNK):
+        writer.write(body[offset:offset + STREAM_CHUNK])
+        await writer.drain()
+    await writer.drain()
+
+
+async def send_json(writer, status_code, payload, keep_alive=True, headers=None):
+    body = json.dumps(payload, default=str).encode('utf-8')
+    await send_body(writer, status_code, body, 'application/json', keep_alive, headers)
+
+
+async def start_stream(writer):
+    writer.write(response_head(200, {'Content-Type': 'application/x-ndjson', 'Transfer-Encoding': 'chunked',
+                                     'Connection': 'keep-alive'}))
+
+
+async def send_line(writer, payload):
+    data = (json.dumps(payload, default=str) + "\n").encode('utf-8')
+    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+    await writer.drain()
+
+
+async def end_stream(writer):
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+def request_options(state, requested):
+    unknown = set(requested) - set(REQUEST_OPTIONS)
+    if unknown:
+        raise RequestError(400, f"Unknown option(s): {', '.join(sorted(unknown))}")
+    if requested.get('save_directory') and state['allowed_dirs'] is not None:
+        check_save_directory(state, requested['save_directory'])
+    options = dict(state['options'], **requested)
+    if options['quality'] not in resize_engine.RESIZE_QUALITY:
+        raise RequestError(400, f"Unknown quality: {options['quality']}")
+    if options['encoder_profile'] not in resize_engine.ENCODER_PROFILE_NAMES:
+        raise RequestError(400, f"Unknown encoder profile: {options['encoder_profile']}")
+    if options['resampler'] not in resamplers.RESAMPLER_NAMES:
+        raise RequestError(400, f"Unknown resampler: {options['resampler']}")
+    if options['frames'] not in ('all', 'first'):
+        raise RequestError(400, "frames must be 'all' or 'first'")
+    return options
+
+
+def check_save_directory(state, save_directory):
+    # Resolved first, so '..' and symlinks cannot leave the allowed folders
+    path = os.path.realpath(save_directory)
+    for allowed in state['allowed_dirs']:
+        if path == allowed or path.startswith(allowed.rstrip(os.sep) + os.sep):
+            return
+    if not state['allowed_dirs']:
+        raise RequestError(400, "save_directory is not allowed; start the server with --allow-dir")
+    raise RequestError(400, f"save_directory must be inside {', '.join(state['allowed_dirs'])}")
+
+
+def parse_sizes(sizes, output_format, allow_targets=True):
+    if not sizes:
+        raise RequestError(400, "At least one size is required")
+    try:
+        return [resize_engine.parse_target(str(size), output_format) if allow_targets and ':' in str(size)
+                else resize_engine.parse_size(str(size)) for size in sizes]
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+
+def parse_format(output_format, options):
+    if options['icon_set']:
+        return "ICO"
+    try:
+        return resize_engine.validate_format(output_format or "PNG")
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+
+async def resize_paths(state, writer, body):
+    # Files on this machine, written where the batch commands would put them
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError as e:
+        raise RequestError(400, f"Invalid JSON: {str(e)}")
+    sources = request.get('sources') or ([request['source']] if request.get('source') else [])
+    if not sources or not all(isinstance(source, str) for source in sources):
+        raise RequestError(400, "'sources' must be a list of file paths")
+    options = request_options(state, request.get('options') or {})
+    if state['allowed_dirs'] is not None and not options['save_directory']:
+        # Outputs would otherwise go next to whatever sources the client names
+        raise RequestError(400, "save_directory is required; it must be inside an --allow-dir folder")
+    output_format = parse_format(request.get('format'), options)
+    sizes = parse_sizes(request.get('sizes'), output_format)
+    admit(state)
+
+    await start_stream(writer)
+    failed = 0
+    pending = set()
+
+    async def report(done):
+        nonlocal failed
+        for future in done:
+            try:
+                file_results = future.result()
+            except Exception as e:
+                # The worker process itself died, not just the resize
+                file_results = resize_engine.failed_results(pending_sources.pop(future), sizes, str(e))
+            else:
+                pending_sources.pop(future)
+            instrumentation.emit_results(file_results)
+            if any(result['error'] for result in file_results):
+                failed += 1
+                state['failed'] += 1
+            await send_line(writer, {'source': file_results[0]['source'], 'results': file_results})
+
+    pending_sources = {}
+    for source in sources:
+        try:
+            future = await submit(state, resize_engine.resize_file, source, sizes, output_format, options)
+        except RequestError as e:
+            # The response has started, so the source is reported as failed
+            file_results = resize_engine.failed_results(source, sizes, str(e))
+            failed += 1
+            state['failed'] += 1
+            await send_line(writer, {'source': source, 'results': file_results})
+            continue
+        pending.add(future)
+        pending_sources[future] = source
+        done = {future for future in pending if future.done()}
+        pending -= done
+        await report(done)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        await report(done)
+    await send_line(writer, {'done': True, 'sources': len(sources), 'failed': failed})
+    await end_stream(writer)
+
+
+async def resize_upload(state, writer, query, body, keep_alive):
+    # An uploaded image; nothing is written on the server
+    if not body:
+        raise RequestError(400, "Empty upload")
+    requested = {}
+    for name in REQUEST_OPTIONS:
+        if name in query and name not in ('save_directory', 'icon_set'):
+            value = query[name][-1]
+            requested[name] = value.lower() in ('1', 'true', 'yes') if name == 'maintain_aspect_ratio' else value
+    options = request_options(state, requested)
+    output_format = parse_format(query.get('format', ["PNG"])[-1], options)
+    sizes = parse_sizes(query.get('size'), output_format, allow_targets=False)
+    admit(state)
+
+    futures = [await submit(state, resize_engine.resize_bytes, body, size, output_format, options) for size in sizes]
+    if len(sizes) == 1:
+        try:
+            data, new_size = await futures[0]
+        except BrokenProcessPool as e:
+            state['failed'] += 1
+            raise RequestError(500, f"The worker process died: {str(e)}")
+        except Exception as e:
+            state['failed'] += 1
+            raise RequestError(400, f"Cannot resize the upload: {str(e)}")
+        await send_body(writer, 200, data, CONTENT_TYPES[output_format], keep_alive,
+                        {'X-Image-Size': f"{new_size[0]}x{new_size[1]}"})
+        return
+    await start_stream(writer)
+    for future in asyncio.as_completed(futures):
+        try:
+            data, new_size = await future
+            line = {'size': new_size, 'format': output_format, 'data': base64.b64encode(data).decode('ascii')}
+        except Exception as e:
+            state['failed'] += 1
+            line = {'error': str(e)}
+        await send_line(writer, line)
+    await end_stream(writer)
+
+
+async def dispatch(state, reader, writer, method, target, headers, keep_alive):
+    url = urlsplit(target)
+    if url.path == '/status' or url.path == '/health':
+        if method != 'GET':
+            raise RequestError(405, "Use GET")
+        await send_json(writer, 200, status(state) if url.path == '/status' else {'ok': True}, keep_alive)
+        return
+    if url.path != '/resize':
+        raise RequestError(404, f"No such endpoint: {url.path}")
+    if method != 'POST':
+        raise RequestError(405, "Use POST")
+    body = await read_body(reader, headers, state['max_upload'])
+    if headers.get('content-type', '').split(';')[0].strip() == 'application/json':
+        await resize_paths(state, writer, body)
+    else:
+        await resize_upload(state, writer, parse_qs(url.query), body, keep_alive)
+
+
+async def handle_connection(state, reader, writer):
+    # Keep-alive loop; after an error the connection is closed, since the
+    # request body may not have been read
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+                state['requests'] += 1
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await dispatch(state, reader, writer, method, target, headers, keep_alive)
+                if not keep_alive:
+                    break
+            except RequestError as e:
+                retry = {'Retry-After': 1} if e.status == 503 else None
+                await send_json(writer, e.status, {'error': str(e)}, keep_alive=False, headers=retry)
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except Exception as e:
+        logging.error(f"Request failed: {str(e)}")
+    finally:
+        writer.close()
+
+
+async def serve(args, options):
+    # The Unix socket is only open to its owner; TCP clients may only write
+    # inside --allow-dir
+    allowed_dirs = None if args.unix else [os.path.realpath(path) for path in args.allow_dir]
+    state = new_state(args.workers, args.max_queue, args.max_upload_mb * 1024 * 1024, options, allowed_dirs)
+    await warm_up(state)
+
+    async def handler(reader, writer):
+        await handle_connection(state, reader, writer)
+
+    if args.unix:
+        if os.path.exists(args.unix) and stat.S_ISSOCK(os.stat(args.unix).st_mode):
+            os.remove(args.unix)
+        server = await asyncio.start_unix_server(handler, path=args.unix, limit=MAX_HEADER_BYTES)
+        os.chmod(args.unix, 0o600)
+        where = args.unix
+    else:
+        server = await asyncio.start_server(handler, args.host, args.port, limit=MAX_HEADER_BYTES)
+        where = f"http://{args.host}:{args.port}"
+    print(f"Serving on {where} with {args.workers} worker(s)", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, AttributeError):
+            # Windows: Ctrl+C raises KeyboardInterrupt instead
+            pass
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        state['pool'].shutdown(wait=True, cancel_futures=True)
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Serve the resize engine over local HTTP or a Unix socket")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument('--unix', default=None, metavar='PATH', help="Listen on a Unix socket instead of TCP")
+    parser.add_argument('--allow-dir', action='append', default=[], metavar='DIR',
+                        help="Folder TCP requests may set as save_directory (repeatable)")
+    parser.add_argument('-j', '--workers', type=int, default=resize_engine.default_worker_count(),
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help="Requests that may wait for a worker before new ones get 503")
+    parser.add_argument('--max-upload-mb', type=int, default=DEFAULT_MAX_UPLOAD // (1024 * 1024),
+                        help="Largest accepted request body")
+    parser.add_argument('-q', '--quality', choices=sorted(resize_engine.RESIZE_QUALITY),
+                        default=resize_engine.DEFAULT_QUALITY, help="Default downscale trade-off")
+    parser.add_argument('-e', '--encoder-profile', choices=resize_engine.ENCODER_PROFILE_NAMES,
+                        default=resize_engine.DEFAULT_ENCODER_PROFILE, help="Default encoder settings")
+    parser.add_argument('--resampler', choices=resamplers.RESAMPLER_NAMES, default=resamplers.DEFAULT_RESAMPLER,
+                        help="Default resize backend")
+    parser.add_argument('--calibration', default=None, metavar='FILE', help="Calibration table for --resampler auto")
+    parser.add_argument('--memory-budget', default=None, metavar='BYTES',
+                        help="Per job: read larger raw sources in strips (e.g. 512M)")
+    parser.add_argument('--cache', default=None, metavar='PATH', help="Output cache database for path jobs")
+    parser.add_argument('--trace', default=None, metavar='FILE', help="Append a JSON line per path job")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every saved file")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        memory_budget = resize_engine.parse_bytes(args.memory_budget) if args.memory_budget else None
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 2
+    options = {
+        'quality': args.quality,
+        'encoder_profile': args.encoder_profile,
+        'resampler': args.resampler,
+        'calibration': args.calibration,
+        'memory_budget': memory_budget,
+        'cache': args.cache,
+        # Jobs already run on the server's pool
+        'workers': 1,
+    }
+    if args.trace:
+        instrumentation.open_trace(args.trace)
+    if args.verbose:
+        instrumentation.add_sink(instrumentation.log_sink)
+    try:
+        asyncio.run(serve(args, options))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        instrumentation.close_trace()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
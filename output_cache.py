@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Persistent cache of resize outputs. Entries are keyed by the source content
+# hash plus everything that affects the output (target size, filter, aspect
+# flag, format, save directory, ...). Content hashes are themselves cached
+# per (path, size, mtime) so unchanged files are never re-read.
+# The cache only remembers outputs; evicting an entry never deletes a file.
+
+DEFAULT_MAX_ENTRIES = 100000
+CACHE_VERSION = 1
+
+# Evicting needs a count over the whole table, so only do it every N stores
+EVICT_EVERY = 500
+
+_connections = {}
+_stores_since_evict = 0
+
+
+def _connect(cache_path):
+    # sqlite connections cannot be shared between threads or forked processes
+    key = (cache_path, os.getpid(), threading.get_ident())
+    conn = _connections.get(key)
+    if conn is None:
+        conn = sqlite3.connect(cache_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sources ("
+                     "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS outputs ("
+                     "key TEXT PRIMARY KEY, output_path TEXT, output_size INTEGER, "
+                     "output_mtime_ns INTEGER, width INTEGER, height INTEGER, last_used REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS outputs_last_used ON outputs (last_used)")
+        conn.commit()
+        _connections[key] = conn
+    return conn
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_digest(cache_path, file_path):
+    # Fast path: same size and mtime as last time means the stored hash is still valid
+    conn = _connect(cache_path)
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    row = conn.execute("SELECT size, mtime_ns, digest FROM sources WHERE path = ?", (path,)).fetchone()
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        return row[2]
+    digest = file_digest(path)
+    conn.execute("INSERT OR REPLACE INTO sources (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                 (path, stat.st_size, stat.st_mtime_ns, digest))
+    conn.commit()
+    return digest
+
+
+def make_key(digest, target, output_format, params):
+    # params holds every other option that changes the output bytes
+    payload = json.dumps([CACHE_VERSION, digest, target, output_format, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def lookup(cache_path, key):
+    # Returns (output_path, (width, height)) only if the recorded output is still on disk unchanged
+    conn = _connect(cache_path)
+    row = conn.execute("SELECT output_path, output_size, output_mtime_ns, width, height FROM outputs WHERE key = ?",
+                       (key,)).fetchone()
+    if not row:
+        return None
+    try:
+        stat = os.stat(row[0])
+    except OSError:
+        stat = None
+    if stat is None or stat.st_size != row[1] or stat.st_mtime_ns != row[2]:
+        conn.execute("DELETE FROM outputs WHERE key = ?", (key,))
+        conn.commit()
+        return None
+    conn.execute("UPDATE outputs SET last_used = ? WHERE key = ?", (time.time(), key))
+    conn.commit()
+    return row[0], (row[3], row[4])
+
+
+def store(cache_path, key, output_path, output_size, max_entries=DEFAULT_MAX_ENTRIES):
+    global _stores_since_evict
+    conn = _connect(cache_path)
+    stat = os.stat(output_path)
+    conn.execute("INSERT OR REPLACE INTO outputs (key, output_path, output_size, output_mtime_ns, width, height, "
+                 "last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (key, os.path.abspath(output_path), stat.st_size, stat.st_mtime_ns,
+                  output_size[0], output_size[1], time.time()))
+    conn.commit()
+    _stores_since_evict += 1
+    if _stores_since_evict >= EVICT_EVERY:
+        _stores_since_evict = 0
+        evict(cache_path, max_entries)
+
+
+def evict(cache_path, max_entries=DEFAULT_MAX_ENTRIES):
+    # Least recently used entries go first
+    conn = _connect(cache_path)
+    count = conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+    removed = 0
+    if count > max_entries:
+        removed = count - max_entries
+        conn.execute("DELETE FROM outputs WHERE key IN (SELECT key FROM outputs ORDER BY last_used LIMIT ?)",
+                     (removed,))
+        conn.execute("DELETE FROM sources WHERE path NOT IN (SELECT path FROM sources ORDER BY rowid DESC LIMIT ?)",
+                     (max_entries,))
+        conn.commit()
+    return removed
+
+
+def cache_stats(cache_path):
+    conn = _connect(cache_path)
+    entries, output_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(output_size), 0) FROM outputs").fetchone()
+    sources = conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+    return {'entries': entries, 'output_bytes': output_bytes, 'sources': sources}
+
+
+def summarize_results(results):
+    # Hit/miss counts for a list of resize results
+    hits = sum(1 for result in results if result.get('cached'))
+    misses = sum(1 for result in results if not result.get('cached') and result.get('output'))
+    return {'hits': hits, 'misses': misses}
@@ -0,0 +1,4 @@
+# Output formats offered by the engine. Kept out of resize_engine so the GUI
+# can fill its format menu without importing Pillow before the first paint.
+
+SUPPORTED_FORMATS = ["ICO", "PNG", "JPG", "BMP", "TIFF", "GIF", "WEBP"]
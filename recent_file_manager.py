@@ -1,23 +1,92 @@
-import os
-import configparser
-
-recent_files_file = 'recent_files.ini'
-
-def load_recent_files():
-    config = configparser.ConfigParser()
-    if os.path.exists(recent_files_file):
-        config.read(recent_files_file)
-    files = []
-    if 'Files' in config:
-        for key in sorted(config['Files'], key=lambda k: int(k.split('_')[1])):
-            files.append(config['Files'][key])
-    return files
-
-def save_recent_files(files):
-    config = configparser.ConfigParser()
-    if 'Files' not in config:
-        config['Files'] = {}
-    for i, filepath in enumerate(files):
-        config['Files'][f'file_{i}'] = filepath
-    with open(recent_files_file, 'w') as configfile:
-        config.write(configfile)
+import atexit
+import os
+import configparser
+import tempfile
+from collections import deque
+
+recent_files_file = 'recent_files.ini'
+
+# Process-wide recent files list. Appends only touch the deque; the file is
+# rewritten by flush_recent_files, which callers run at the end of a batch or
+# on a timer, so a long batch does not rewrite recent_files.ini per output.
+_recent_files = deque(maxlen=20)
+_dirty = False
+
+
+def read_recent_files():
+    # Only reads the file, so it can run on a background thread
+    config = configparser.ConfigParser()
+    if os.path.exists(recent_files_file):
+        config.read(recent_files_file)
+    files = []
+    if 'Files' in config:
+        for key in sorted(config['Files'], key=lambda k: int(k.split('_')[1])):
+            files.append(config['Files'][key])
+    return files
+
+
+def load_recent_files(limit=None, files=None):
+    # files is a list from an earlier read_recent_files() call; entries added
+    # since then are unsaved and stay at the end of the list
+    global _recent_files, _dirty
+    if files is None:
+        files = read_recent_files()
+        added = []
+    else:
+        added = list(_recent_files) if _dirty else []
+    _recent_files = deque(files + added, maxlen=limit or _recent_files.maxlen)
+    _dirty = bool(added)
+    return list(_recent_files)
+
+
+def save_recent_files(files):
+    config = configparser.ConfigParser()
+    config['Files'] = {}
+    for i, filepath in enumerate(files):
+        config['Files'][f'file_{i}'] = filepath
+    # Write to a temp file next to the target and swap it in, so a crash never
+    # leaves a half-written list behind
+    directory = os.path.dirname(os.path.abspath(recent_files_file))
+    fd, temp_path = tempfile.mkstemp(prefix='.recent_files-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as configfile:
+            config.write(configfile)
+        os.replace(temp_path, recent_files_file)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def get_recent_files():
+    return _recent_files
+
+
+def add_recent_file(filepath):
+    global _dirty
+    _recent_files.append(filepath)
+    _dirty = True
+
+
+def set_recent_files_limit(limit):
+    global _recent_files, _dirty
+    if limit != _recent_files.maxlen:
+        _recent_files = deque(_recent_files, maxlen=limit)
+        _dirty = True
+
+
+def clear_recent_files():
+    global _dirty
+    _recent_files.clear()
+    _dirty = True
+    flush_recent_files()
+
+
+def flush_recent_files():
+    global _dirty
+    if _dirty:
+        save_recent_files(list(_recent_files))
+        _dirty = False
+
+
+atexit.register(flush_recent_files)
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import platform
+import time
+import PIL
+from PIL import Image
+
+# NumPy and OpenCV are imported by load_optional_resamplers() the first time
+# a backend other than "pillow" is asked for; importing them costs more than
+# the rest of the engine put together
+np = None
+cv2 = None
+_optional_loaded = False
+
+# Resampling backends behind one call: resize(img, new_size, reducing_gap, name).
+# "pillow" is Image.resize with LANCZOS and is what every output has used so far.
+# "opencv" runs cv2.resize on a NumPy view of the image: INTER_AREA when
+# shrinking, INTER_LANCZOS4 when enlarging. INTER_AREA is an area average, not
+# LANCZOS, so outputs differ slightly from the Pillow ones and the "quality"
+# bounds in resize_engine only hold for "pillow".
+# "auto" uses a calibration table that records which backend was faster on
+# this machine for each (mode, scale factor) bucket.
+
+RESAMPLER_NAMES = ['pillow', 'opencv', 'auto']
+DEFAULT_RESAMPLER = 'pillow'
+
+# Downscale factors measured by calibrate(); 1 stands for enlarging
+SCALE_BUCKETS = [1, 2, 4, 8, 16, 32]
+CALIBRATION_MODES = ['L', 'RGB', 'RGBA']
+CALIBRATION_EDGE = 1024
+CALIBRATION_REPEAT = 3
+CALIBRATION_VERSION = 1
+
+_resamplers = {}
+_calibration = {}
+
+
+def register_resampler(name, resize, modes=None):
+    # resize(img, new_size, reducing_gap) -> Image; modes=None accepts any mode
+    _resamplers[name] = (resize, modes)
+
+
+def load_optional_resamplers():
+    global np, cv2, _optional_loaded
+    if _optional_loaded:
+        return
+    _optional_loaded = True
+    try:
+        import numpy
+        import cv2 as opencv
+    except ImportError:
+        return
+    np, cv2 = numpy, opencv
+    register_resampler('opencv', opencv_resize, ('L', 'RGB', 'RGBA', 'RGBa'))
+
+
+def available_resamplers():
+    load_optional_resamplers()
+    return list(_resamplers)
+
+
+def pillow_resize(img, new_size, reducing_gap=None):
+    if img.mode.startswith('I;16'):
+        # Image.reduce() has no 16-bit integer support; resize in one pass
+        reducing_gap = None
+    return img.resize(new_size, Image.LANCZOS, reducing_gap=reducing_gap)
+
+
+def opencv_resize(img, new_size, reducing_gap=None):
+    # np.asarray copies the pixels out once; Image.fromarray wraps the result
+    # buffer without another copy. RGBa (the engine's working mode for RGBA,
+    # see color_modes) is already premultiplied and resizes as plain uint8.
+    interpolation = cv2.INTER_AREA if new_size[0] <= img.width and new_size[1] <= img.height else cv2.INTER_LANCZOS4
+    pixels = np.asarray(img)
+    if img.mode == 'RGBA':
+        # Premultiply so transparent pixels do not bleed colour, as Pillow does
+        pixels = pixels.astype(np.float32)
+        pixels[..., :3] *= pixels[..., 3:4] / 255.0
+        resized = cv2.resize(pixels, new_size, interpolation=interpolation)
+        alpha = np.clip(resized[..., 3:4], 0, 255)
+        np.divide(resized[..., :3] * 255.0, alpha, out=resized[..., :3], where=alpha > 0)
+        resized = np.clip(np.rint(resized), 0, 255).astype(np.uint8)
+    else:
+        resized = cv2.resize(pixels, new_size, interpolation=interpolation)
+    return Image.fromarray(resized, img.mode)
+
+
+register_resampler('pillow', pillow_resize)
+
+
+def scale_bucket(source_size, new_size):
+    scale = max(source_size[0] / new_size[0], source_size[1] / new_size[1])
+    for bucket in SCALE_BUCKETS:
+        if scale <= bucket:
+            return bucket
+    return SCALE_BUCKETS[-1]
+
+
+def choose(img, new_size, name):
+    # Falls back to Pillow for modes or backends that are not available
+    if name == DEFAULT_RESAMPLER:
+        return name
+    load_optional_resamplers()
+    if name == 'auto':
+        # Premultiplied RGBa costs no more than the RGBA that was calibrated
+        mode = 'RGBA' if img.mode == 'RGBa' else img.mode
+        name = _calibration.get(f"{mode}:{scale_bucket(img.size, new_size)}", 'pillow')
+    if name not in _resamplers:
+        return 'pillow'
+    modes = _resamplers[name][1]
+    if modes is not None and img.mode not in modes:
+        return 'pillow'
+    return name
+
+
+def resize(img, new_size, reducing_gap=None, name=DEFAULT_RESAMPLER):
+    return _resamplers[choose(img, new_size, name)][0](img, new_size, reducing_gap)
+
+
+def host_signature():
+    # A calibration is only reused on the same machine and library versions
+    load_optional_resamplers()
+    return {
+        'version': CALIBRATION_VERSION,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'pillow': PIL.__version__,
+        'opencv': cv2.__version__ if cv2 is not None else None,
+    }
+
+
+def sample_image(mode, edge):
+    gradient = Image.merge("RGB", [Image.linear_gradient("L").resize((edge, edge)),
+                                   Image.radial_gradient("L").resize((edge, edge)),
+                                   Image.effect_noise((edge, edge), 64)])
+    if mode == 'RGBA':
+        gradient.putalpha(Image.radial_gradient("L").resize((edge, edge)))
+        return gradient
+    return gradient.convert(mode)
+
+
+def best_time(resize_call, img, new_size, reducing_gap):
+    best = None
+    for _ in range(CALIBRATION_REPEAT):
+        start = time.perf_counter()
+        resize_call(img, new_size, reducing_gap)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(reducing_gap=None):
+    # Times every registered backend on synthetic images for each mode and
+    # scale bucket; returns {"MODE:BUCKET": {"winner": name, "seconds": {...}}}
+    load_optional_resamplers()
+    results = {}
+    for mode in CALIBRATION_MODES:
+        source = sample_image(mode, CALIBRATION_EDGE)
+        for bucket in SCALE_BUCKETS:
+            if bucket == 1:
+                img = source.resize((CALIBRATION_EDGE // 4, CALIBRATION_EDGE // 4))
+                new_size = (CALIBRATION_EDGE // 2, CALIBRATION_EDGE // 2)
+            else:
+                img = source
+                new_size = (CALIBRATION_EDGE // bucket, CALIBRATION_EDGE // bucket)
+            seconds = {}
+            for name, (resize_call, modes) in _resamplers.items():
+                if modes is None or mode in modes:
+                    seconds[name] = best_time(resize_call, img, new_size, reducing_gap)
+            results[f"{mode}:{bucket}"] = {'winner': min(seconds, key=seconds.get), 'seconds': seconds}
+    return results
+
+
+def load_calibration(calibration_path=None, reducing_gap=None):
+    # Uses the saved table when it was measured on this host, otherwise
+    # calibrates now and saves the result. Must run in every process that
+    # resizes with "auto"; with a file only the first one pays for it.
+    global _calibration
+    signature = dict(host_signature(), reducing_gap=reducing_gap)
+    if calibration_path and os.path.exists(calibration_path):
+        try:
+            with open(calibration_path, 'r') as f:
+                saved = json.load(f)
+            if saved.get('host') == signature:
+                _calibration = {key: entry['winner'] for key, entry in saved['results'].items()}
+                return saved['results']
+        except (ValueError, KeyError, OSError) as e:
+            logging.warning(f"Ignoring calibration file {calibration_path}: {str(e)}")
+    results = calibrate(reducing_gap)
+    _calibration = {key: entry['winner'] for key, entry in results.items()}
+    if calibration_path:
+        save_calibration(calibration_path, results, reducing_gap)
+    return results
+
+
+def save_calibration(calibration_path, results, reducing_gap=None):
+    temp_path = f"{calibration_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({'host': dict(host_signature(), reducing_gap=reducing_gap), 'results': results}, f, indent=2)
+    os.replace(temp_path, calibration_path)
+
+
+def calibration_loaded():
+    return bool(_calibration)
+
+
+def format_calibration(results):
+    names = sorted({name for entry in results.values() for name in entry['seconds']})
+    lines = [f"{'mode:scale':<12}" + "".join(f"{name + ' ms':>12}" for name in names) + f"{'winner':>10}"]
+    for key, entry in results.items():
+        times = "".join(f"{entry['seconds'][name] * 1000:>12.2f}" if name in entry['seconds'] else f"{'-':>12}"
+                        for name in names)
+        lines.append(f"{key:<12}{times}{entry['winner']:>10}")
+    return "\n".join(lines)
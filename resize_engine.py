@@ -0,0 +1,1253 @@
+import argparse
+import contextlib
+import fnmatch
+import io
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image, ImageSequence
+import instrumentation
+from output_formats import SUPPORTED_FORMATS
+import batch_journal
+import batch_planner
+import color_modes
+import output_cache
+import resamplers
+import strip_resize
+import vector_resize
+
+# Headless resize engine shared by the Tk GUI and the command line.
+# Nothing in here may import tkinter so it can run on machines without a display.
+
+INPUT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ico', '.bmp', '.tiff', '.tif', '.gif', '.webp')
+
+# Frame sizes written by the multi-resolution ICO ("icon set") mode
+ICON_SET_SIZES = [16, 32, 48, 64, 128, 256]
+
+# Quality/speed trade-off for downscaling: (JPEG shrink-on-load, reducing_gap).
+# "exact" decodes at full size and runs a plain LANCZOS resize.
+# "balanced" lets the JPEG decoder scale down by 1/2..1/8 (DCT scaling) and
+# Image.reduce() by whole factors first, but always keeps at least 3x the
+# target size for the final LANCZOS pass. Pillow documents a gap of 3.0 as
+# indistinguishable from a full resize in most cases; measured against
+# "exact" on a 24MP JPEG it differs by at most 2 levels (of 255) per channel
+# and is 4-8x faster for icon-sized targets.
+# "fast" keeps only 2x the target size. It is faster for mid-sized targets, but
+# tiny targets can differ from "exact" by up to ~16 levels per channel.
+RESIZE_QUALITY = {
+    'exact': (False, None),
+    'balanced': (True, 3.0),
+    'fast': (True, 2.0),
+}
+DEFAULT_QUALITY = 'balanced'
+
+# Bounding box of the GUI preview
+PREVIEW_SIZE = (300, 300)
+
+# Pillow registers JPEG under its full name only
+PILLOW_FORMATS = {"JPG": "JPEG"}
+
+# Output formats that keep every frame of an animated GIF or multi-page TIFF;
+# the others get the first frame
+MULTI_FRAME_FORMATS = ("GIF", "WEBP", "TIFF")
+# Milliseconds per frame for sources without timing (multi-page TIFF)
+DEFAULT_FRAME_DURATION = 100
+
+# Encoder settings per output format: "fast" spends the least time encoding,
+# "smallest" the fewest bytes. Formats missing here (ICO, BMP) have nothing to
+# tune and ignore the profile. WEBP stays lossy: lossless is smaller for
+# flat-colour icons but several times larger for photographic sources.
+ENCODER_PROFILES = {
+    "PNG": {
+        'fast': {'compress_level': 1},
+        'balanced': {'compress_level': 6},
+        'smallest': {'compress_level': 9, 'optimize': True},
+    },
+    "JPG": {
+        'fast': {'quality': 85},
+        'balanced': {'quality': 85, 'optimize': True},
+        'smallest': {'quality': 75, 'optimize': True, 'progressive': True},
+    },
+    "WEBP": {
+        'fast': {'quality': 80, 'method': 0},
+        'balanced': {'quality': 80, 'method': 4},
+        'smallest': {'quality': 75, 'method': 6},
+    },
+    "TIFF": {
+        'fast': {'compression': 'raw'},
+        'balanced': {'compression': 'tiff_lzw'},
+        'smallest': {'compression': 'tiff_adobe_deflate'},
+    },
+    "GIF": {
+        'fast': {},
+        'balanced': {},
+        'smallest': {'optimize': True},
+    },
+}
+ENCODER_PROFILE_NAMES = ['fast', 'balanced', 'smallest']
+DEFAULT_ENCODER_PROFILE = 'balanced'
+
+DEFAULT_OPTIONS = {
+    'maintain_aspect_ratio': False,
+    'save_directory': None,
+    'workers': 1,
+    # Threads encoding one source's outputs; None picks a value from 'workers'
+    'encode_threads': None,
+    # 'numpy' stacks same-shaped sources and resizes them together (needs NumPy)
+    'backend': 'pillow',
+    'vector_chunk': vector_resize.DEFAULT_CHUNK,
+    'icon_set': False,
+    # Set to the walked folder to mirror its structure under save_directory
+    'source_root': None,
+    'quality': DEFAULT_QUALITY,
+    'encoder_profile': DEFAULT_ENCODER_PROFILE,
+    # Path of the output cache database, or None to always resize
+    'cache': None,
+    'cache_max_entries': output_cache.DEFAULT_MAX_ENTRIES,
+    # 'pillow', 'opencv' or 'auto' (per mode/scale winner of a calibration run, see resamplers)
+    'resampler': resamplers.DEFAULT_RESAMPLER,
+    # Where 'auto' keeps its calibration; None recalibrates in every process
+    'calibration': None,
+    # Journal file for resuming interrupted batches (see batch_journal)
+    'journal': None,
+    # 'link' or 'copy' plans the batch first (see batch_planner): identical
+    # sources are resized once and output name collisions are renamed
+    'dedupe': None,
+    # {absolute source path: output stem} for renamed sources, set by the planner
+    'output_stems': None,
+    # 'all' resizes every frame of multi-frame sources, 'first' only the first
+    'frames': 'all',
+    # Bytes of decoded pixels all workers together may hold; None means no limit.
+    # Larger sources are read in strips (see strip_resize) and run alone.
+    'memory_budget': None,
+}
+
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+
+def load_preview(file_path, max_size=PREVIEW_SIZE):
+    # draft() lets the JPEG decoder scale by 1/2..1/8 while decoding, and the
+    # reducing_gap does a cheap reduce() before the final resample, so large
+    # sources never get decoded at full size just to be displayed
+    img = Image.open(file_path)
+    img.draft(None, max_size)
+    img.thumbnail(max_size, reducing_gap=2.0)
+    return img
+
+
+def merge_options(options=None):
+    merged = dict(DEFAULT_OPTIONS)
+    if options:
+        merged.update(options)
+    return merged
+
+
+def prepare_resampler(options):
+    # 'auto' needs this process's calibration table before the first resize
+    if options['resampler'] == 'auto' and not resamplers.calibration_loaded():
+        resamplers.load_calibration(options['calibration'], RESIZE_QUALITY[options['quality']][1])
+
+
+def parse_bytes(text):
+    # Accepts "512M", "2G", "65536" ...
+    text = str(text).strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_size(text):
+    # Accepts "64" or "64x32"
+    text = str(text).lower().strip()
+    if 'x' in text:
+        width, height = text.split('x', 1)
+    else:
+        width = height = text
+    if not (width.isdigit() and height.isdigit()) or int(width) == 0 or int(height) == 0:
+        raise ValueError(f"Invalid size: {text}")
+    return (int(width), int(height))
+
+
+def validate_format(output_format):
+    output_format = output_format.upper()
+    if output_format == "JPEG":
+        output_format = "JPG"
+    if output_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    return output_format
+
+
+def compute_new_size(source_size, selected_size, maintain_aspect_ratio=False):
+    if maintain_aspect_ratio and selected_size[0] != selected_size[1]:
+        image_aspect_ratio = source_size[0] / source_size[1]
+        if selected_size[0] / selected_size[1] > image_aspect_ratio:
+            return (max(1, int(selected_size[1] * image_aspect_ratio)), selected_size[1])
+        return (selected_size[0], max(1, int(selected_size[0] / image_aspect_ratio)))
+    return selected_size
+
+
+def output_directory(file_path, options, create=True):
+    # Folder an output for file_path goes to, creating mirrored subfolders as needed
+    save_directory = options['save_directory']
+    if not save_directory:
+        return os.path.dirname(file_path)
+    if options['source_root']:
+        relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(file_path)),
+                                       os.path.abspath(options['source_root']))
+        if relative_dir != '.' and not relative_dir.startswith('..'):
+            save_directory = os.path.join(save_directory, relative_dir)
+            if create:
+                os.makedirs(save_directory, exist_ok=True)
+    return save_directory
+
+
+def output_stem(file_path, options):
+    # Output names start with the source name unless the planner renamed it
+    stems = options['output_stems']
+    if stems:
+        stem = stems.get(os.path.abspath(file_path))
+        if stem:
+            return stem
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def build_output_path(file_path, new_size, output_format, save_directory=None, stem=None):
+    stem = stem or os.path.splitext(os.path.basename(file_path))[0]
+    new_ext = '.' + output_format.lower()
+    new_filename = f"{stem}_{new_size[0]}x{new_size[1]}{new_ext}"
+    if save_directory:
+        return os.path.join(save_directory, new_filename)
+    return os.path.join(os.path.dirname(file_path), new_filename)
+
+
+def shrink_on_load(img, target_sizes, quality=DEFAULT_QUALITY):
+    # Must run before img.load(). For JPEG sources the decoder then produces a
+    # reduced image that is still at least reducing_gap times the largest
+    # target, instead of the full raster. Returns the reducing_gap for resize().
+    use_draft, reducing_gap = RESIZE_QUALITY[quality]
+    if use_draft and img.format == "JPEG" and target_sizes:
+        width = max(size[0] for size in target_sizes)
+        height = max(size[1] for size in target_sizes)
+        img.draft(None, (int(width * reducing_gap), int(height * reducing_gap)))
+    return reducing_gap
+
+
+def open_for_resize(file_path, selected_sizes, quality=DEFAULT_QUALITY, maintain_aspect_ratio=False, load=True,
+                    memory_budget=None):
+    # Returns (img, source_size, reducing_gap); source_size is the size before
+    # any shrink-on-load so aspect ratio math matches a full decode
+    img = strip_resize.open_within_budget(file_path) if memory_budget else Image.open(file_path)
+    source_size = img.size
+    new_sizes = [compute_new_size(source_size, selected_size, maintain_aspect_ratio)
+                 for selected_size in selected_sizes]
+    reducing_gap = shrink_on_load(img, new_sizes, quality)
+    if load:
+        img.load()
+    return img, source_size, reducing_gap
+
+
+def decode_source(file_path, selected_sizes, options):
+    # Like open_for_resize, plus whether the source is too big for the memory
+    # budget and has to be resized in strips; such images are left unloaded
+    img, source_size, reducing_gap = open_for_resize(file_path, selected_sizes, options['quality'],
+                                                     options['maintain_aspect_ratio'], load=False,
+                                                     memory_budget=options['memory_budget'])
+    try:
+        streamed = strip_resize.needs_strips(img, options['memory_budget'])
+        if not streamed:
+            with strip_resize.bomb_limit_lifted() if options['memory_budget'] else contextlib.nullcontext():
+                img.load()
+    except Exception:
+        img.close()
+        raise
+    return img, source_size, reducing_gap, streamed
+
+
+def resize_source(img, new_size, reducing_gap, streamed, options, counters=None):
+    # img is in its working mode (see color_modes) unless streamed; strips
+    # come back in the source mode and are converted at the output size
+    if streamed:
+        resized_img = strip_resize.resize_in_strips(img, new_size, strip_resize.band_bytes(options['memory_budget']))
+        return color_modes.to_working(resized_img, counters)
+    return resize_working(img, new_size, reducing_gap, options['resampler'], counters)
+
+
+def resize_working(img, new_size, reducing_gap=None, resampler=resamplers.DEFAULT_RESAMPLER, counters=None):
+    color_modes.count_resize(counters, img, new_size)
+    return resamplers.resize(img, new_size, reducing_gap, resampler)
+
+
+def resize_image(img, selected_size, output_format, maintain_aspect_ratio=False, reducing_gap=None,
+                 source_size=None, resampler=resamplers.DEFAULT_RESAMPLER, counters=None):
+    new_size = compute_new_size(source_size or img.size, selected_size, maintain_aspect_ratio)
+    resized_img = resize_working(color_modes.to_working(img, counters), new_size, reducing_gap, resampler, counters)
+    return convert_for_format(resized_img, output_format, counters)
+
+
+def convert_for_format(img, output_format, counters=None):
+    return color_modes.to_output(img, output_format, counters)
+
+
+def encoder_settings(output_format, profile=DEFAULT_ENCODER_PROFILE):
+    if profile not in ENCODER_PROFILE_NAMES:
+        raise ValueError(f"Unknown encoder profile: {profile}")
+    return ENCODER_PROFILES.get(output_format, {}).get(profile, {})
+
+
+def encode_image(img, output_format, profile=DEFAULT_ENCODER_PROFILE):
+    buffer = io.BytesIO()
+    img.save(buffer, format=PILLOW_FORMATS.get(output_format, output_format),
+             **encoder_settings(output_format, profile))
+    return buffer.getvalue()
+
+
+def write_output(new_filepath, data):
+    # Written next to the target under a temporary name, synced and renamed
+    # into place, so a crash or cancel never leaves a truncated output behind
+    directory, name = os.path.split(new_filepath)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, new_filepath)
+        batch_journal.fsync_directory(directory)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def save_image(img, new_filepath, output_format, profile=DEFAULT_ENCODER_PROFILE):
+    # Encoding to memory first keeps encode and disk write separately measurable
+    write_output(new_filepath, encode_image(img, output_format, profile))
+
+
+def build_icon_set_path(file_path, save_directory=None, stem=None):
+    new_filename = f"{stem or os.path.basename(os.path.splitext(file_path)[0])}_icon.ico"
+    if save_directory:
+        return os.path.join(save_directory, new_filename)
+    return os.path.join(os.path.dirname(file_path), new_filename)
+
+
+def icon_set_sizes(sizes):
+    # Square frame sizes, largest first
+    return sorted({size[0] if isinstance(size, tuple) else int(size) for size in sizes}, reverse=True)
+
+
+def build_icon_frames(img, sizes=ICON_SET_SIZES, reducing_gap=None, resampler=resamplers.DEFAULT_RESAMPLER,
+                      counters=None):
+    # One LANCZOS pass from the source to the largest frame, then every smaller
+    # frame is built from that intermediate instead of the full-size source.
+    # All of it stays in the working mode; only the frames are converted back.
+    sizes = icon_set_sizes(sizes)
+    img = color_modes.to_working(img, counters)
+    largest = resize_working(img, (sizes[0], sizes[0]), reducing_gap, resampler, counters)
+    frames = [largest] + [resize_working(largest, (size, size), None, resampler, counters) for size in sizes[1:]]
+    return [convert_for_format(frame, "ICO", counters) for frame in frames]
+
+
+def encode_icon_set(frames):
+    # frames must be ordered largest first, as returned by build_icon_frames
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format="ICO", sizes=[frame.size for frame in frames], append_images=frames[1:])
+    return buffer.getvalue()
+
+
+def save_icon_set(frames, new_filepath):
+    write_output(new_filepath, encode_icon_set(frames))
+
+
+def new_result(file_path, selected_size):
+    return {'source': file_path, 'size': selected_size, 'output': None, 'error': None, 'cached': False}
+
+
+def cache_key_params(file_path, options):
+    # Everything besides the source bytes, size and format that changes an output
+    return {
+        'filter': 'LANCZOS',
+        'quality': options['quality'],
+        'encoder_profile': options['encoder_profile'],
+        'resampler': options['resampler'],
+        # The NumPy stack backend gives slightly different pixels than Pillow
+        'backend': options['backend'],
+        'frames': options['frames'],
+        'maintain_aspect_ratio': bool(options['maintain_aspect_ratio']),
+        'icon_set': bool(options['icon_set']),
+        'save_directory': os.path.abspath(output_directory(file_path, options)),
+        # Identical sources with different names must not share an output
+        'output_stem': output_stem(file_path, options),
+    }
+
+
+def cached_output(file_path, selected_size, output_format, options):
+    # Returns (cache key, hit) where hit is (output_path, size) or None; the key is None without a cache
+    if not options['cache']:
+        return None, None
+    digest = output_cache.source_digest(options['cache'], file_path)
+    key = output_cache.make_key(digest, selected_size, output_format, cache_key_params(file_path, options))
+    return key, output_cache.lookup(options['cache'], key)
+
+
+def remember_output(key, new_filepath, new_size, options):
+    if key:
+        output_cache.store(options['cache'], key, new_filepath, new_size, options['cache_max_entries'])
+
+
+def record_source(result, file_path, source_size):
+    result['input_bytes'] = os.path.getsize(file_path)
+    result['input_pixels'] = source_size[0] * source_size[1]
+
+
+def record_output(result, new_size, data):
+    result['output_bytes'] = len(data)
+    result['output_pixels'] = new_size[0] * new_size[1]
+
+
+def release_source(img, working):
+    # Frees the decoded source once its working copy exists, so the two are
+    # not both held through every resize
+    if working is not img:
+        img.close()
+    return working
+
+
+def resize_icon_file(file_path, sizes=ICON_SET_SIZES, options=None):
+    # Decodes the source once and writes a single ICO holding every size
+    options = merge_options(options)
+    prepare_resampler(options)
+    result = new_result(file_path, None)
+    timings = result['timings'] = instrumentation.new_timings()
+    try:
+        key, hit = cached_output(file_path, icon_set_sizes(sizes), "ICO", options)
+        if hit:
+            result['output'], result['size'] = hit
+            result['cached'] = True
+            return result
+        largest = icon_set_sizes(sizes)[0]
+        with instrumentation.stage(timings, 'decode'):
+            img, source_size, reducing_gap, streamed = decode_source(file_path, [(largest, largest)], options)
+        record_source(result, file_path, source_size)
+        with img:
+            if streamed:
+                with instrumentation.stage(timings, 'resize'):
+                    frames = build_icon_frames(resize_source(img, (largest, largest), None, True, options, result),
+                                               sizes, None, options['resampler'], result)
+            else:
+                with instrumentation.stage(timings, 'convert'):
+                    working = release_source(img, color_modes.to_working(img, result))
+                with instrumentation.stage(timings, 'resize'):
+                    frames = build_icon_frames(working, sizes, reducing_gap, options['resampler'], result)
+        with instrumentation.stage(timings, 'encode'):
+            data = encode_icon_set(frames)
+        new_filepath = build_icon_set_path(file_path, output_directory(file_path, options),
+                                           output_stem(file_path, options))
+        with instrumentation.stage(timings, 'write'):
+            write_output(new_filepath, data)
+        remember_output(key, new_filepath, frames[0].size, options)
+        record_output(result, frames[0].size, data)
+        result['output_pixels'] = sum(frame.width * frame.height for frame in frames)
+        result['size'] = frames[0].size
+        result['output'] = new_filepath
+        logging.info(f"Icon set saved to: {new_filepath}")
+    except Exception as e:
+        result['error'] = str(e)
+        logging.error(f"Failed to build icon set for {file_path}: {str(e)}")
+    return result
+
+
+def normalize_size(size):
+    if isinstance(size, (str, int)):
+        return parse_size(size)
+    return tuple(size)
+
+
+def parse_target(text, output_format=None):
+    # "64", "64x32", "64:PNG" or "64x32:webp"
+    size, _, target_format = str(text).partition(':')
+    return {'size': parse_size(size), 'format': validate_format(target_format or output_format or "PNG")}
+
+
+def make_targets(sizes, output_format):
+    # Sizes may be plain sizes (written in output_format) or target dicts with
+    # their own 'size' and 'format'; duplicates are dropped
+    targets = []
+    seen = set()
+    for item in sizes:
+        if isinstance(item, dict):
+            target = {'size': normalize_size(item['size']),
+                      'format': validate_format(item.get('format') or output_format)}
+        else:
+            target = {'size': normalize_size(item), 'format': output_format}
+        if (target['size'], target['format']) not in seen:
+            seen.add((target['size'], target['format']))
+            targets.append(target)
+    return targets
+
+
+def encode_threads(options):
+    # Encoders release the GIL, so one source's outputs can be encoded in
+    # parallel; not worth it when a process pool already keeps every core busy
+    if options['encode_threads']:
+        return max(1, int(options['encode_threads']))
+    if int(options['workers'] or 1) > 1:
+        return 1
+    return min(4, default_worker_count())
+
+
+def pick_intermediate(intermediates, new_size, reducing_gap):
+    # Smallest already resized image that is still reducing_gap times the
+    # target in both directions; LANCZOS from there matches resizing from the
+    # source as closely as the reducing_gap shortcut itself does
+    if not reducing_gap:
+        return None
+    best = None
+    for intermediate in intermediates:
+        if intermediate.width >= new_size[0] * reducing_gap and intermediate.height >= new_size[1] * reducing_gap:
+            if best is None or intermediate.width * intermediate.height < best.width * best.height:
+                best = intermediate
+    return best
+
+
+def prepare_results(file_path, sizes, output_format, options):
+    # Results for every target, plus the (result, cache key) pairs that still need work
+    results = []
+    pending = []
+    for target in make_targets(sizes, output_format):
+        result = new_result(file_path, target['size'])
+        result['format'] = target['format']
+        result['timings'] = instrumentation.new_timings()
+        key, hit = cached_output(file_path, target['size'], target['format'], options)
+        if hit:
+            result['output'] = hit[0]
+            result['cached'] = True
+        else:
+            pending.append((result, key))
+        results.append(result)
+    return results, pending
+
+
+def resize_file(file_path, sizes, output_format, options=None):
+    # Decodes the source once and fans it out into every target (size and
+    # format). Targets are resized largest first so smaller ones can cascade
+    # from an intermediate instead of the full source, and encodes run on a
+    # small thread pool. Targets whose output is already in the cache are
+    # skipped, and the source is not decoded at all when every target is a hit.
+    # Every result carries per-stage timings; decode is booked on the first
+    # result that needed the decoded image.
+    options = merge_options(options)
+    if options['icon_set']:
+        return [resize_icon_file(file_path, sizes, options)]
+    prepare_resampler(options)
+    results = []
+    try:
+        results, pending = prepare_results(file_path, sizes, output_format, options)
+        if not pending:
+            return results
+
+        with instrumentation.stage(pending[0][0]['timings'], 'decode'):
+            img, source_size, reducing_gap, streamed = decode_source(
+                file_path, [result['size'] for result, key in pending], options)
+        record_source(pending[0][0], file_path, source_size)
+        for result, key in pending:
+            result['new_size'] = compute_new_size(source_size, result['size'], options['maintain_aspect_ratio'])
+        pending.sort(key=lambda item: item[0]['new_size'][0] * item[0]['new_size'][1], reverse=True)
+        animated = []
+        if options['frames'] == 'all' and getattr(img, 'n_frames', 1) > 1:
+            animated = [item for item in pending if item[0]['format'] in MULTI_FRAME_FORMATS]
+            pending = [item for item in pending if item[0]['format'] not in MULTI_FRAME_FORMATS]
+
+        threads = encode_threads(options)
+        executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 and len(pending) > 1 else None
+        futures = []
+        intermediates = []
+        with img:
+            working = img
+            if pending and not streamed:
+                with instrumentation.stage(pending[0][0]['timings'], 'convert'):
+                    working = color_modes.to_working(img, pending[0][0])
+                    if not animated:
+                        release_source(img, working)
+            for result, key in pending:
+                try:
+                    with instrumentation.stage(result['timings'], 'resize'):
+                        new_size = result['new_size']
+                        base = pick_intermediate(intermediates, new_size, reducing_gap)
+                        if base is None:
+                            resized_img = resize_source(working, new_size, reducing_gap, streamed, options, result)
+                        else:
+                            resized_img = resize_working(base, new_size, None, options['resampler'], result)
+                        intermediates.append(resized_img)
+                    if executor:
+                        futures.append(executor.submit(finish_output, file_path, resized_img, result, key, options))
+                    else:
+                        finish_output(file_path, resized_img, result, key, options)
+                except Exception as e:
+                    result['error'] = str(e)
+                    logging.error(f"Failed to resize and save image {file_path}: {str(e)}")
+            if executor:
+                for future in futures:
+                    future.result()
+                executor.shutdown()
+            if animated:
+                resize_frames(file_path, img, animated, options, streamed)
+        for result in results:
+            result.pop('new_size', None)
+    except Exception as e:
+        logging.error(f"Failed to open image {file_path}: {str(e)}")
+        results = failed_results(file_path, sizes, str(e))
+    return results
+
+
+def resize_frames(file_path, img, animated, options, streamed=False):
+    # Every frame of a multi-frame source, one at a time: only the current
+    # source frame and the (small) resized frames are held in memory. When the
+    # source is over the memory budget, each page that is too is resized in
+    # strips like the first one.
+    frames = [[] for _ in animated]
+    durations = []
+    for frame in ImageSequence.Iterator(img):
+        page_streamed = streamed and strip_resize.needs_strips(frame, options['memory_budget'])
+        with instrumentation.stage(animated[0][0]['timings'], 'decode'):
+            if page_streamed:
+                working = frame
+                duration = frame.info.get('duration', DEFAULT_FRAME_DURATION)
+            else:
+                with strip_resize.bomb_limit_lifted() if options['memory_budget'] else contextlib.nullcontext():
+                    working, duration = load_frame(frame, animated[0][0])
+            durations.append(duration)
+        for index, (result, key) in enumerate(animated):
+            with instrumentation.stage(result['timings'], 'resize'):
+                frames[index].append(resize_source(working, result['new_size'], None, page_streamed, options, result))
+    loop = img.info.get('loop', 0)
+    for index, (result, key) in enumerate(animated):
+        try:
+            finish_frames(file_path, frames[index], durations, loop, result, key, options)
+        except Exception as e:
+            result['error'] = str(e)
+            logging.error(f"Failed to resize and save frames of {file_path}: {str(e)}")
+
+
+def load_frame(frame, counters=None):
+    # Returns the frame in its working mode and its duration. GIF frames after
+    # the first come back as RGB(A) while the first is a palette image.
+    frame.load()
+    return color_modes.to_working(frame, counters), frame.info.get('duration', DEFAULT_FRAME_DURATION)
+
+
+def resize_bytes(data, selected_size, output_format, options=None):
+    # Resizes an in-memory source to one target without touching the disk
+    # (uploads to job_server). Returns (encoded bytes, new size).
+    options = merge_options(options)
+    output_format = validate_format(output_format)
+    selected_size = normalize_size(selected_size)
+    prepare_resampler(options)
+    with Image.open(io.BytesIO(data)) as img:
+        source_size = img.size
+        new_size = compute_new_size(source_size, selected_size, options['maintain_aspect_ratio'])
+        if options['frames'] == 'all' and output_format in MULTI_FRAME_FORMATS and getattr(img, 'n_frames', 1) > 1:
+            frames = []
+            durations = []
+            for frame in ImageSequence.Iterator(img):
+                working, duration = load_frame(frame)
+                frames.append(convert_for_format(resize_working(working, new_size, None, options['resampler']),
+                                                 output_format))
+                durations.append(duration)
+            return encode_frames(frames, output_format, durations, img.info.get('loop', 0),
+                                 options['encoder_profile']), new_size
+        reducing_gap = shrink_on_load(img, [new_size], options['quality'])
+        img.load()
+        resized_img = resize_image(img, selected_size, output_format, options['maintain_aspect_ratio'],
+                                   reducing_gap, source_size, options['resampler'])
+        return encode_image(resized_img, output_format, options['encoder_profile']), new_size
+
+
+def encode_frames(frames, output_format, durations, loop=0, profile=DEFAULT_ENCODER_PROFILE):
+    settings = dict(encoder_settings(output_format, profile))
+    if output_format in ("GIF", "WEBP"):
+        settings.update(duration=durations, loop=loop)
+    if output_format == "GIF":
+        # Frames are complete pictures, so each one replaces the previous
+        settings['disposal'] = 2
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format=PILLOW_FORMATS.get(output_format, output_format), save_all=True,
+                   append_images=frames[1:], **settings)
+    return buffer.getvalue()
+
+
+def finish_frames(file_path, frames, durations, loop, result, key, options):
+    timings = result['timings']
+    new_size = result['new_size']
+    with instrumentation.stage(timings, 'convert'):
+        frames = [convert_for_format(frame, result['format'], result) for frame in frames]
+    with instrumentation.stage(timings, 'encode'):
+        data = encode_frames(frames, result['format'], durations, loop, options['encoder_profile'])
+    new_filepath = build_output_path(file_path, new_size, result['format'], output_directory(file_path, options),
+                                     output_stem(file_path, options))
+    with instrumentation.stage(timings, 'write'):
+        write_output(new_filepath, data)
+    remember_output(key, new_filepath, new_size, options)
+    record_output(result, new_size, data)
+    result['output_pixels'] *= len(frames)
+    result['frames'] = len(frames)
+    result['output'] = new_filepath
+    logging.info(f"Animated image with {len(frames)} frames saved to: {new_filepath}")
+
+
+def resize_stack_files(file_paths, sizes, output_format, options=None):
+    # NumPy backend for sources that share size and mode (see vector_resize):
+    # every target size is computed for the whole stack at once. Files that
+    # turn out not to match the stack go through resize_file instead.
+    # Returns one result list per file, like resize_file.
+    options = merge_options(options)
+    all_results = []
+    stacked = []
+    images = []
+    stack_key = None
+    for file_path in file_paths:
+        # Entries before this index belong to earlier files
+        index = len(all_results)
+        img = None
+        try:
+            results, pending = prepare_results(file_path, sizes, output_format, options)
+            all_results.append(results)
+            if not pending:
+                continue
+            with instrumentation.stage(pending[0][0]['timings'], 'decode'):
+                img = Image.open(file_path)
+                img.load()
+            if stack_key is None:
+                stack_key = (img.size, img.mode)
+            if (img.size, img.mode) != stack_key:
+                img.close()
+                all_results[index] = resize_file(file_path, sizes, output_format, options)
+                continue
+            record_source(pending[0][0], file_path, img.size)
+            for result, key in pending:
+                result['new_size'] = compute_new_size(img.size, result['size'], options['maintain_aspect_ratio'])
+            stacked.append(pending)
+            images.append(img)
+        except Exception as e:
+            logging.error(f"Failed to open image {file_path}: {str(e)}")
+            if img is not None:
+                img.close()
+            del all_results[index:]
+            all_results.append(failed_results(file_path, sizes, str(e)))
+    if not images:
+        return all_results
+
+    stack = vector_resize.stack_images(images)
+    mode = stack_key[1]
+    for img in images:
+        img.close()
+    del images
+    new_sizes = sorted({result['new_size'] for pending in stacked for result, key in pending},
+                       key=lambda size: size[0] * size[1], reverse=True)
+    for new_size in new_sizes:
+        start = time.perf_counter()
+        resized_stack = vector_resize.resize_stack(stack, new_size, mode)
+        share = (time.perf_counter() - start) / len(stacked)
+        for index, pending in enumerate(stacked):
+            for result, key in pending:
+                if result['new_size'] == new_size:
+                    result['timings']['resize'] += share
+                    resized_img = vector_resize.unstack_image(resized_stack[index], mode)
+                    finish_output(result['source'], resized_img, result, key, options)
+    for results in all_results:
+        for result in results:
+            result.pop('new_size', None)
+    return all_results
+
+
+def resize_file_job(file_paths, sizes, output_format, options):
+    return [resize_file(file_path, sizes, output_format, options) for file_path in file_paths]
+
+
+def plan_jobs(paths, options):
+    # Splits the source stream into units of work: (function, file_paths)
+    if options['backend'] == 'numpy' and not options['icon_set']:
+        if vector_resize.available():
+            for kind, group in vector_resize.plan_groups(paths, options['vector_chunk']):
+                if kind == 'stack':
+                    yield resize_stack_files, group
+                else:
+                    yield resize_file_job, [group]
+            return
+        logging.warning("NumPy is not installed; falling back to the Pillow backend")
+    for file_path in paths:
+        yield resize_file_job, [file_path]
+
+
+def finish_output(file_path, resized_img, result, key, options):
+    # Convert, encode and write one target; safe to run on a worker thread
+    timings = result['timings']
+    output_format = result['format']
+    new_size = result['new_size']
+    try:
+        with instrumentation.stage(timings, 'convert'):
+            resized_img = convert_for_format(resized_img, output_format, result)
+        with instrumentation.stage(timings, 'encode'):
+            data = encode_image(resized_img, output_format, options['encoder_profile'])
+        new_filepath = build_output_path(file_path, new_size, output_format, output_directory(file_path, options),
+                                         output_stem(file_path, options))
+        with instrumentation.stage(timings, 'write'):
+            write_output(new_filepath, data)
+        remember_output(key, new_filepath, new_size, options)
+        record_output(result, new_size, data)
+        result['output'] = new_filepath
+        logging.info(f"Image resized and saved to: {new_filepath}")
+    except Exception as e:
+        result['error'] = str(e)
+        logging.error(f"Failed to resize and save image {file_path}: {str(e)}")
+
+
+def wait_while_paused(cancel_event=None, pause_event=None):
+    # pause_event set means "paused"; returns False once the batch is cancelled
+    while pause_event is not None and pause_event.is_set():
+        if cancel_event is not None and cancel_event.is_set():
+            return False
+        time.sleep(0.1)
+    return not (cancel_event is not None and cancel_event.is_set())
+
+
+def failed_results(file_path, sizes, error):
+    results = [new_result(file_path, size['size'] if isinstance(size, dict) else size) for size in sizes]
+    for result in results:
+        result['error'] = error
+    return results
+
+
+def iter_resize_batch(paths, sizes, output_format, options=None, cancel_event=None, pause_event=None):
+    # Yields one list of results per source file so callers can report progress.
+    # With more than one worker the files are spread over a process pool and
+    # results arrive in order of completion rather than input order.
+    # cancel_event/pause_event are threading.Event objects checked between files.
+    options = merge_options(options)
+    output_format = "ICO" if options['icon_set'] else validate_format(output_format)
+    sizes = [size if isinstance(size, dict) else normalize_size(size) for size in sizes]
+    # Calibrate once here so pool workers find the saved table
+    prepare_resampler(options)
+    if options['dedupe']:
+        yield from iter_planned_batch(paths, sizes, output_format, options, cancel_event, pause_event)
+    elif options['journal']:
+        yield from iter_journaled_batch(paths, sizes, output_format, options, cancel_event, pause_event)
+    else:
+        yield from run_batch_jobs(paths, sizes, output_format, options, cancel_event, pause_event)
+
+
+def plan_batch(paths, options):
+    # Dry run of the planning stage: nothing is created or written
+    return batch_planner.make_plan(paths, lambda file_path: output_directory(file_path, options, create=False))
+
+
+def iter_planned_batch(paths, sizes, output_format, options, cancel_event, pause_event):
+    # Only unique sources are resized, with the planner's output names; the
+    # outputs of each one are then linked for its duplicates
+    plan = plan_batch(paths, options)
+    logging.info(f"Batch plan: {len(plan['primaries'])} unique source(s), {len(plan['duplicates'])} duplicate(s), "
+                 f"{len(plan['stems'])} renamed")
+    copies = batch_planner.duplicates_by_primary(plan)
+    mode = options['dedupe']
+    options = dict(options, dedupe=None, output_stems=plan['stems'])
+    if options['journal']:
+        batches = iter_journaled_batch(plan['primaries'], sizes, output_format, options, cancel_event, pause_event)
+    else:
+        batches = run_batch_jobs(plan['primaries'], sizes, output_format, options, cancel_event, pause_event)
+    for file_results in batches:
+        yield file_results
+        for duplicate in copies.get(file_results[0]['source'], []):
+            yield emit_resumed(link_duplicate(file_results, duplicate, mode, options))
+
+
+def link_duplicate(file_results, duplicate, mode, options):
+    # Results for duplicate, whose outputs are links or copies of the primary's
+    primary = file_results[0]['source']
+    primary_stem = output_stem(primary, options)
+    stem = output_stem(duplicate, options)
+    results = []
+    for primary_result in file_results:
+        result = new_result(duplicate, primary_result['size'])
+        result['format'] = primary_result.get('format')
+        result['timings'] = instrumentation.new_timings()
+        result['duplicate_of'] = primary
+        results.append(result)
+        if not primary_result['output']:
+            result['error'] = primary_result['error'] or f"No output from identical source {primary}"
+            continue
+        name = stem + os.path.basename(primary_result['output'])[len(primary_stem):]
+        new_filepath = os.path.join(output_directory(duplicate, options), name)
+        try:
+            with instrumentation.stage(result['timings'], 'write'):
+                batch_planner.link_output(primary_result['output'], new_filepath, mode)
+            result['output'] = new_filepath
+        except OSError as e:
+            result['error'] = str(e)
+            logging.error(f"Failed to link {new_filepath} to {primary_result['output']}: {str(e)}")
+    return results
+
+
+def journal_signature(file_path, sizes, output_format, options):
+    return batch_journal.make_signature(sizes, output_format, cache_key_params(file_path, options))
+
+
+def resumed_results(entry):
+    results = []
+    for output in entry['outputs']:
+        result = new_result(entry['source'], output['size'])
+        result['output'] = output['path']
+        result['format'] = output['format']
+        result['cached'] = True
+        results.append(result)
+    return results
+
+
+def iter_journaled_batch(paths, sizes, output_format, options, cancel_event, pause_event):
+    # Sources the journal shows as finished are reported as cached without
+    # being opened; everything else runs as usual and is journaled on success
+    journal = batch_journal.open_journal(options['journal'])
+    resumed = []
+
+    def unfinished():
+        for file_path in paths:
+            entry = batch_journal.completed(journal, file_path,
+                                            journal_signature(file_path, sizes, output_format, options))
+            if entry:
+                resumed.append(resumed_results(entry))
+            else:
+                yield file_path
+
+    try:
+        for file_results in run_batch_jobs(unfinished(), sizes, output_format, options, cancel_event, pause_event):
+            while resumed:
+                yield emit_resumed(resumed.pop(0))
+            signature = journal_signature(file_results[0]['source'], sizes, output_format, options)
+            batch_journal.record(journal, file_results, signature)
+            yield file_results
+        while resumed:
+            yield emit_resumed(resumed.pop(0))
+    finally:
+        batch_journal.close_journal(journal)
+
+
+def emit_resumed(file_results):
+    instrumentation.emit_results(file_results)
+    return file_results
+
+
+def run_batch_jobs(paths, sizes, output_format, options, cancel_event, pause_event):
+    workers = max(1, int(options['workers'] or 1))
+    jobs = plan_jobs(paths, options)
+    if workers == 1:
+        for job, file_paths in jobs:
+            if not wait_while_paused(cancel_event, pause_event):
+                return
+            for file_results in job(file_paths, sizes, output_format, options):
+                instrumentation.emit_results(file_results)
+                yield file_results
+        return
+
+    # Only a few jobs per worker are submitted at a time so pause and cancel
+    # take effect quickly and huge batches do not queue every path up front.
+    # With a memory budget, a job also waits until the decoded size of the
+    # jobs already running leaves room for it; the first job always runs.
+    # The process pool pulls in multiprocessing, so it is imported only by
+    # batches that use it rather than by every importer of this module.
+    from concurrent.futures import ProcessPoolExecutor
+    max_in_flight = workers * 2
+    budget = options['memory_budget']
+    in_flight_cost = 0
+    held = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        while True:
+            while len(futures) < max_in_flight and wait_while_paused(cancel_event, pause_event):
+                job, held = held or next(jobs, None), None
+                if job is None:
+                    break
+                job, file_paths = job
+                cost = strip_resize.job_cost(file_paths, budget) if budget else 0
+                if budget and futures and in_flight_cost + cost > budget:
+                    held = (job, file_paths)
+                    break
+                in_flight_cost += cost
+                futures[executor.submit(job, file_paths, sizes, output_format, options)] = (file_paths, cost)
+            if not futures:
+                return
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_paths, cost = futures.pop(future)
+                in_flight_cost -= cost
+                try:
+                    job_results = future.result()
+                except Exception as e:
+                    # The worker process itself died, not just the resize
+                    logging.error(f"Worker failed for {', '.join(file_paths)}: {str(e)}")
+                    job_results = [failed_results(file_path, sizes, str(e)) for file_path in file_paths]
+                for file_results in job_results:
+                    instrumentation.emit_results(file_results)
+                    yield file_results
+
+
+def resize_batch(paths, sizes, output_format, options=None):
+    results = []
+    for file_results in iter_resize_batch(paths, sizes, output_format, options):
+        results.extend(file_results)
+    return results
+
+
+def matches_any(name, relative_path, patterns):
+    name = name.lower()
+    relative_path = relative_path.lower()
+    return any(fnmatch.fnmatch(name, pattern.lower()) or fnmatch.fnmatch(relative_path, pattern.lower())
+               for pattern in patterns)
+
+
+def iter_tree(root, include=None, exclude=None, recursive=True, modified_before=None):
+    # Lazily walks root with os.scandir and yields image paths as they are
+    # found, so a batch can start on the first file without listing the whole
+    # tree. Patterns are globs matched against the name or the path relative
+    # to root (with forward slashes); excluded directories are not entered.
+    # modified_before skips files written after the walk started, so outputs
+    # saved inside the tree are not picked up as new sources.
+    include = include or ['*' + ext for ext in INPUT_EXTENSIONS]
+    exclude = exclude or []
+    pending_dirs = [root]
+    while pending_dirs:
+        directory = pending_dirs.pop()
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative_path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                    if matches_any(entry.name, relative_path, exclude):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                subdirs.append(entry.path)
+                        elif entry.is_file() and matches_any(entry.name, relative_path, include):
+                            if modified_before is None or entry.stat().st_mtime < modified_before:
+                                yield entry.path
+                    except OSError as e:
+                        logging.warning(f"Skipping {entry.path}: {str(e)}")
+        except OSError as e:
+            logging.warning(f"Cannot read directory {directory}: {str(e)}")
+        # Depth first keeps the number of pending directories small
+        pending_dirs.extend(sorted(subdirs, reverse=True))
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="python -m resize_engine",
+                                     description="Resize images without starting the GUI.")
+    parser.add_argument('inputs', nargs='*', help="Image files or directories to resize")
+    parser.add_argument('-s', '--size', action='append', dest='sizes',
+                        help="Target size, e.g. 64 or 64x32 (repeatable)")
+    parser.add_argument('-t', '--target', action='append', dest='targets', default=[],
+                        help="Extra target as SIZE:FORMAT, e.g. 256:JPG or 64x32:PNG (repeatable)")
+    parser.add_argument('-f', '--format', default='PNG', help="Output format: " + ", ".join(SUPPORTED_FORMATS))
+    parser.add_argument('-o', '--output-dir', default=None, help="Save directory (defaults to the source folder)")
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help="Walk input directories recursively and mirror their structure under --output-dir")
+    parser.add_argument('--include', action='append', default=None, metavar='GLOB',
+                        help="Only process files matching GLOB (repeatable; default: all supported images)")
+    parser.add_argument('--exclude', action='append', default=None, metavar='GLOB',
+                        help="Skip files and folders matching GLOB (repeatable)")
+    parser.add_argument('-a', '--maintain-aspect-ratio', action='store_true', help="Keep the source aspect ratio")
+    parser.add_argument('--icon-set', action='store_true',
+                        help="Write one multi-resolution ICO per source (sizes default to "
+                             + ",".join(str(size) for size in ICON_SET_SIZES) + ")")
+    parser.add_argument('-q', '--quality', choices=sorted(RESIZE_QUALITY), default=DEFAULT_QUALITY,
+                        help="Downscale quality/speed trade-off (default: %(default)s)")
+    parser.add_argument('-e', '--encoder-profile', choices=ENCODER_PROFILE_NAMES, default=DEFAULT_ENCODER_PROFILE,
+                        help="Encoder settings: fast, balanced or smallest output (default: %(default)s)")
+    parser.add_argument('--resampler', choices=resamplers.RESAMPLER_NAMES, default=resamplers.DEFAULT_RESAMPLER,
+                        help="Resize with Pillow, OpenCV, or whichever calibrated faster per mode and scale")
+    parser.add_argument('--calibration', default=None, metavar='FILE',
+                        help="Calibration file for --resampler auto (measured and written if missing)")
+    parser.add_argument('--calibrate', action='store_true',
+                        help="Measure the resamplers on this machine, print the table and exit")
+    parser.add_argument('--memory-budget', default=None, metavar='BYTES',
+                        help="Limit decoded pixels held by all workers, e.g. 512M; larger sources are read in strips")
+    parser.add_argument('--first-frame-only', action='store_true',
+                        help="Only resize the first frame of animated GIFs and multi-page TIFFs")
+    parser.add_argument('--backend', choices=['pillow', 'numpy'], default='pillow',
+                        help="Resampling backend; 'numpy' resizes same-shaped sources as one stack")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and resize new or changed files in the input directories")
+    parser.add_argument('--settle', type=float, default=2.0, metavar='SECONDS',
+                        help="With --watch, wait until a file has not changed for this long")
+    parser.add_argument('--poll-interval', type=float, default=5.0, metavar='SECONDS',
+                        help="With --watch, rescan interval when inotify is not available")
+    parser.add_argument('--no-inotify', action='store_true', help="With --watch, always poll")
+    parser.add_argument('--status-file', default=None, metavar='FILE',
+                        help="With --watch, keep queue depth and processing rate in this JSON file")
+    parser.add_argument('--status-interval', type=float, default=30.0, metavar='SECONDS',
+                        help="With --watch, how often to log (with -v) and write the status")
+    parser.add_argument('--dedupe', choices=batch_planner.DEDUPE_MODES, default=None,
+                        help="Plan the batch first: resize identical sources once and hardlink (or copy) their "
+                             "outputs, and rename sources whose outputs would collide")
+    parser.add_argument('--plan', action='store_true',
+                        help="Print the batch plan and estimated work without resizing anything")
+    parser.add_argument('--journal', default=None,
+                        help="Journal file; re-running with the same journal skips sources already finished")
+    parser.add_argument('--cache', default=None, metavar='PATH',
+                        help="Output cache database; unchanged sources with existing outputs are skipped")
+    parser.add_argument('--cache-max-entries', type=int, default=output_cache.DEFAULT_MAX_ENTRIES,
+                        help="Maximum number of cached outputs before least recently used ones are dropped")
+    parser.add_argument('--trace', default=None, metavar='FILE',
+                        help="Append one JSON line with stage timings per source to FILE")
+    parser.add_argument('--stats', action='store_true', help="Print p50/p95 stage timings at the end")
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help="Run under cProfile and write stats to FILE (implies --workers 1)")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Log the top allocation sites for the batch (implies --workers 1)")
+    parser.add_argument('-j', '--workers', type=int, default=default_worker_count(),
+                        help="Number of worker processes (default: CPU count)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every saved file")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.calibrate:
+        reducing_gap = RESIZE_QUALITY[args.quality][1]
+        results = resamplers.calibrate(reducing_gap)
+        if args.calibration:
+            resamplers.save_calibration(args.calibration, results, reducing_gap)
+        print(resamplers.format_calibration(results))
+        return 0
+    if not args.inputs:
+        print("Error: no input files or directories given", file=sys.stderr)
+        return 2
+    if not args.sizes and not args.targets and not args.icon_set:
+        print("Error: at least one --size or --target is required", file=sys.stderr)
+        return 2
+    try:
+        output_format = validate_format(args.format)
+        if args.icon_set:
+            sizes = [parse_size(size) for size in (args.sizes or ICON_SET_SIZES)]
+        else:
+            sizes = [parse_size(size) for size in args.sizes or []]
+            sizes += [parse_target(target, output_format) for target in args.targets]
+        memory_budget = parse_bytes(args.memory_budget) if args.memory_budget else None
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 2
+
+    if args.output_dir and not args.plan:
+        os.makedirs(args.output_dir, exist_ok=True)
+    options = {
+        'maintain_aspect_ratio': args.maintain_aspect_ratio,
+        'save_directory': args.output_dir,
+        'workers': args.workers,
+        'icon_set': args.icon_set,
+        'quality': args.quality,
+        'encoder_profile': args.encoder_profile,
+        'backend': args.backend,
+        'resampler': args.resampler,
+        'calibration': args.calibration,
+        'journal': args.journal,
+        'dedupe': args.dedupe or ('link' if args.plan else None),
+        'frames': 'first' if args.first_frame_only else 'all',
+        'memory_budget': memory_budget,
+        'cache': args.cache,
+        'cache_max_entries': args.cache_max_entries,
+    }
+    if args.profile or args.tracemalloc:
+        # Profilers only see this process
+        options['workers'] = 1
+    if args.trace:
+        instrumentation.open_trace(args.trace)
+    if args.stats:
+        instrumentation.add_sink(instrumentation.stats_sink)
+    if args.verbose:
+        instrumentation.add_sink(instrumentation.log_sink)
+    if args.watch:
+        return watch_inputs(args, sizes, output_format, options)
+    # Loose files form one batch; each directory is streamed as its own batch
+    # so its structure can be mirrored. Only failures are kept in memory.
+    batches = []
+    loose_files = [path for path in args.inputs if not os.path.isdir(path)]
+    if loose_files:
+        batches.append((loose_files, None))
+    for path in args.inputs:
+        if os.path.isdir(path):
+            batches.append((iter_tree(path, args.include, args.exclude, args.recursive, time.time()),
+                            path if args.recursive else None))
+    if options['dedupe']:
+        # One plan over every input, so duplicates and collisions are found
+        # across folders. Several recursive folders are mirrored from their
+        # common parent.
+        roots = [source_root for paths, source_root in batches if source_root]
+        if len(roots) > 1:
+            source_root = os.path.commonpath([os.path.abspath(root) for root in roots])
+        else:
+            source_root = roots[0] if roots else None
+        batches = [(itertools.chain.from_iterable(paths for paths, _ in batches), source_root)]
+    if args.plan:
+        paths, source_root = batches[0]
+        plan = plan_batch(paths, merge_options(dict(options, source_root=source_root)))
+        outputs_per_source = 1 if args.icon_set else len(make_targets(sizes, output_format))
+        print(batch_planner.format_plan(plan, batch_planner.estimate_work(plan, outputs_per_source), args.verbose))
+        return 0
+
+    counts = {'saved': 0, 'hits': 0, 'misses': 0}
+    failed = []
+
+    def run_batches():
+        for paths, source_root in batches:
+            for file_results in iter_resize_batch(paths, sizes, output_format, dict(options, source_root=source_root)):
+                for result in file_results:
+                    if result['error']:
+                        failed.append(result)
+                        continue
+                    counts['saved'] += 1
+                    counts['hits' if result['cached'] else 'misses'] += 1
+
+    try:
+        instrumentation.profiled(run_batches, args.profile, args.tracemalloc)
+    finally:
+        instrumentation.close_trace()
+    for result in failed:
+        print(f"Failed: {result['source']}: {result['error']}", file=sys.stderr)
+    print(f"Saved {counts['saved']} file(s), {len(failed)} failed.")
+    if args.stats:
+        print(instrumentation.format_stats())
+    if args.cache:
+        stats = output_cache.cache_stats(args.cache)
+        print(f"Cache: {counts['hits']} hit(s), {counts['misses']} miss(es), "
+              f"{stats['entries']} entries ({stats['output_bytes']} bytes of outputs).")
+    return 1 if failed else 0
+
+
+def watch_inputs(args, sizes, output_format, options):
+    import watch_folder
+    not_dirs = [path for path in args.inputs if not os.path.isdir(path)]
+    if not_dirs:
+        print(f"Error: --watch needs directories, got {', '.join(not_dirs)}", file=sys.stderr)
+        return 2
+    try:
+        stats = watch_folder.watch(args.inputs, sizes, output_format, options, args.include, args.exclude,
+                                   args.recursive, settle=args.settle, poll_interval=args.poll_interval,
+                                   use_inotify=not args.no_inotify, status_interval=args.status_interval,
+                                   status_file=args.status_file)
+    finally:
+        instrumentation.close_trace()
+    print(f"Watched: {watch_folder.format_status(stats)}")
+    if args.stats:
+        print(instrumentation.format_stats())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import logging
+import math
+import threading
+from contextlib import contextmanager
+from PIL import Image
+import color_modes
+
+# Memory-bounded resizing of huge rasters. Sources stored as raw rows
+# (uncompressed TIFF, BMP, PPM, ...) can be decoded a band of rows at a time:
+# each band is loaded on its own by rewriting the image's tile list, resized
+# into its strip of the output with Image.resize(box=...) and dropped. The
+# band overlaps its neighbours by the LANCZOS support, so the result matches
+# resizing the whole image at once up to rounding.
+# Compressed formats (PNG, JPEG, LZW/deflate TIFF) decode as one stream and
+# cannot be read this way; when they do not fit the budget needs_strips()
+# refuses them rather than risking an out-of-memory kill.
+
+STREAMABLE_MODES = ('L', 'RGB', 'RGBA')
+LANCZOS_SUPPORT = 3.0
+
+# One band of source rows may use this share of the memory budget; the rest
+# covers the output image and Pillow's intermediate buffers
+BAND_SHARE = 0.25
+
+# Held while Pillow's decompression bomb limit is lifted (open_within_budget)
+_bomb_limit_lock = threading.Lock()
+
+
+@contextmanager
+def bomb_limit_lifted():
+    # Pillow's decompression bomb limit is process-wide. It is lifted only
+    # while a source is opened or decoded under a memory budget, which
+    # needs_strips() checks the decoded size against instead.
+    with _bomb_limit_lock:
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            yield
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+def open_within_budget(file_path):
+    with bomb_limit_lifted():
+        return Image.open(file_path)
+
+
+def decoded_bytes(img):
+    # Bytes Pillow holds for the decoded raster at the size the decoder will
+    # produce (after any draft()), plus the working-mode copy made from it
+    pixels = img.width * img.height
+    total = pixels * color_modes.pixel_bytes(img.mode)
+    mode = color_modes.working_mode(img)
+    if mode != img.mode:
+        if mode == 'RGBa' and img.mode != 'RGBA':
+            # Palettes go through RGBA on the way (color_modes.to_working)
+            total += pixels * color_modes.pixel_bytes('RGBA')
+        total += pixels * color_modes.pixel_bytes(mode)
+    return total
+
+
+def band_bytes(memory_budget):
+    return max(1, int(memory_budget * BAND_SHARE))
+
+
+def raw_tile_layout(tile):
+    # (rawmode, stride, orientation, row_bytes) for a raw tile, or None if
+    # its rows cannot be located in the file by simple arithmetic
+    codec, extents, offset, args = tile
+    if codec != 'raw':
+        return None
+    if isinstance(args, str):
+        args = (args,)
+    rawmode = args[0]
+    stride = args[1] if len(args) > 1 else 0
+    orientation = args[2] if len(args) > 2 else 1
+    if ';' in rawmode or not set(rawmode) <= set('RGBAXL'):
+        # Packed or sub-byte layouts
+        return None
+    row_bytes = stride or (extents[2] - extents[0]) * len(rawmode)
+    return rawmode, stride, orientation, row_bytes
+
+
+def can_stream(img):
+    return (img.mode in STREAMABLE_MODES and bool(getattr(img, 'tile', None))
+            and all(raw_tile_layout(tile) for tile in img.tile))
+
+
+def needs_strips(img, memory_budget):
+    # True when img has to be resized in strips to stay within the budget.
+    # Raises ValueError for sources over the budget that cannot be streamed.
+    if not memory_budget or decoded_bytes(img) <= memory_budget:
+        return False
+    if can_stream(img):
+        return True
+    raise ValueError(f"Decoding {img.width}x{img.height} {img.mode} needs {decoded_bytes(img)} bytes, "
+                     f"over the memory budget of {memory_budget} bytes, and the file cannot be read in strips")
+
+
+def band_tile(tile, top, bottom):
+    # The part of one raw tile that covers image rows [top, bottom), with
+    # extents relative to the band, or None if the tile lies outside it
+    codec, (x0, y0, x1, y1), offset, args = tile
+    rawmode, stride, orientation, row_bytes = raw_tile_layout(tile)
+    row_top = max(y0, top)
+    row_bottom = min(y1, bottom)
+    if row_top >= row_bottom:
+        return None
+    if orientation < 0:
+        # Stored bottom-up: the band's lowest row comes first in the file
+        offset += (y1 - row_bottom) * row_bytes
+    else:
+        offset += (row_top - y0) * row_bytes
+    return (codec, (x0, row_top - top, x1, row_bottom - top), offset, (rawmode, stride, orientation))
+
+
+def load_band(img, top, bottom):
+    with bomb_limit_lifted():
+        band = Image.open(img.filename)
+        if img.tell():
+            # A later page of a multi-page file
+            band.seek(img.tell())
+    band.tile = [tile for tile in (band_tile(tile, top, bottom) for tile in img.tile) if tile]
+    # There is no public way to open part of an image; the decoder only
+    # needs the size to match the rewritten tiles (TIFF keeps its own copy)
+    band._size = (img.width, bottom - top)
+    if hasattr(band, '_tile_size'):
+        band._tile_size = band._size
+    with bomb_limit_lifted():
+        band.load()
+    return band
+
+
+def resize_in_strips(img, new_size, max_band_bytes):
+    # img must be opened but not loaded, and pass can_stream()
+    width, height = img.size
+    scale = height / new_size[1]
+    margin = math.ceil(LANCZOS_SUPPORT * max(scale, 1.0)) + 1
+    row_bytes = width * color_modes.pixel_bytes(img.mode)
+    band_rows = max(2 * margin + math.ceil(scale), max_band_bytes // row_bytes)
+    out_rows = max(1, int((band_rows - 2 * margin) / scale))
+    logging.debug(f"Resizing {img.filename} in strips of {out_rows} output rows")
+    output = Image.new(img.mode, new_size)
+    for out_top in range(0, new_size[1], out_rows):
+        out_bottom = min(new_size[1], out_top + out_rows)
+        top = max(0, int(out_top * scale) - margin)
+        bottom = min(height, math.ceil(out_bottom * scale) + margin)
+        with load_band(img, top, bottom) as band:
+            strip = band.resize((new_size[0], out_bottom - out_top), Image.LANCZOS,
+                                box=(0, out_top * scale - top, width, out_bottom * scale - top))
+        output.paste(strip, (0, out_top))
+    return output
+
+
+def file_cost(file_path, memory_budget):
+    # Decoded bytes one source ties up while it is processed, capped at the
+    # budget (larger sources run in strips, alone)
+    try:
+        with open_within_budget(file_path) as img:
+            cost = decoded_bytes(img)
+    except Exception:
+        return 0
+    return min(cost, memory_budget)
+
+
+def job_cost(file_paths, memory_budget):
+    return min(memory_budget, sum(file_cost(file_path, memory_budget) for file_path in file_paths))
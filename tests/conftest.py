@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+from PIL import Image
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_image(tmp_path):
+    # Writes a small gradient image and returns its path
+    def make(name='source.png', size=(120, 80), mode='RGB', **save_args):
+        img = Image.linear_gradient('L').resize(size)
+        if mode == 'I;16':
+            img = img.convert('I').point(lambda value: value * 256).convert('I;16')
+        elif mode != 'L':
+            img = img.convert(mode)
+        path = tmp_path / name
+        img.save(path, **save_args)
+        return str(path)
+    return make
@@ -0,0 +1,29 @@
+import os
+import pytest
+from PIL import Image
+import resize_engine
+
+
+def test_multi_worker_batch_without_memory_budget(make_image, tmp_path):
+    sources = [make_image(f"source{index}.png") for index in range(4)]
+    results = resize_engine.resize_batch(sources, [16, 32], 'PNG',
+                                         {'workers': 2, 'save_directory': str(tmp_path)})
+    assert len(results) == 8
+    assert all(result['error'] is None and os.path.exists(result['output']) for result in results)
+
+
+def test_memory_budget_leaves_the_bomb_limit_alone(make_image, tmp_path, monkeypatch):
+    source = make_image('large.tiff', size=(400, 300), compression='raw')
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 10000)
+    options = {'save_directory': str(tmp_path), 'memory_budget': 64 * 1024}
+
+    # Over the bomb limit but readable in strips within the budget
+    results = resize_engine.resize_file(source, [32], 'PNG', options)
+    assert [result['error'] for result in results] == [None]
+    assert Image.MAX_IMAGE_PIXELS == 10000
+
+    # Without a budget Pillow's limit still applies
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(source)
+    results = resize_engine.resize_file(source, [32], 'PNG', {'save_directory': str(tmp_path)})
+    assert 'decompression bomb' in results[0]['error']
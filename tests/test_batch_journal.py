@@ -0,0 +1,31 @@
+import json
+import os
+import resize_engine
+
+
+def run(sources, journal, tmp_path):
+    return resize_engine.resize_batch(sources, [16], 'PNG', {'journal': journal, 'save_directory': str(tmp_path)})
+
+
+def test_resume_after_a_journal_line_was_cut_short(make_image, tmp_path):
+    sources = [make_image('a.png'), make_image('b.png')]
+    journal = str(tmp_path / 'batch.journal')
+    assert all(result['error'] is None for result in run(sources, journal, tmp_path))
+
+    # A crash in the middle of the last line
+    with open(journal, 'rb') as f:
+        data = f.read()
+    with open(journal, 'wb') as f:
+        f.write(data[:-20])
+
+    results = {os.path.basename(result['source']): result for result in run(sources, journal, tmp_path)}
+    assert results['a.png']['cached'] and not results['b.png']['cached']
+    assert results['b.png']['error'] is None
+
+    # The re-recorded entry starts on its own line and is read back
+    with open(journal, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    entries = [json.loads(line) for line in lines[:1] + lines[2:]]
+    assert [os.path.basename(entry['source']) for entry in entries] == ['a.png', 'b.png']
+    results = run(sources, journal, tmp_path)
+    assert all(result['cached'] for result in results)
@@ -0,0 +1,54 @@
+import os
+import batch_planner
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_identical_sources_link_to_the_first(tmp_path):
+    big = os.urandom(batch_planner.PREFIX_BYTES + 100)
+    # Same size and prefix as big, different tail
+    near = big[:-1] + bytes([big[-1] ^ 1])
+    paths = [write(tmp_path / 'b' / 'x.png', big), write(tmp_path / 'a' / 'x.png', big),
+             write(tmp_path / 'near.png', near), write(tmp_path / 'small1.png', b'tiny'),
+             write(tmp_path / 'small2.png', b'tiny'), write(tmp_path / 'unique.png', b'unique size')]
+    plan = batch_planner.make_plan(paths, lambda file_path: str(tmp_path / 'out'))
+
+    assert plan['duplicates'] == {paths[0]: paths[1], paths[4]: paths[3]}
+    assert plan['primaries'] == [paths[1], paths[2], paths[3], paths[5]]
+    # The unique size is never read
+    assert plan['hashed_bytes'] == 3 * batch_planner.PREFIX_BYTES + 3 * len(big) + 2 * 4
+    # a/x.png keeps its name in the shared output folder, b/x.png is renamed
+    assert plan['stems'] == {os.path.abspath(paths[0]): 'x-2'}
+
+
+def test_renamed_stems_skip_taken_names(tmp_path):
+    paths = [write(tmp_path / 'x.png', b'1'), write(tmp_path / 'x.jpg', b'22'), write(tmp_path / 'x-2.gif', b'333')]
+    stems = batch_planner.resolve_stems(paths, lambda file_path: str(tmp_path))
+    assert stems == {os.path.abspath(paths[0]): 'x-3'}
+
+
+def test_link_output_hardlinks_or_copies(tmp_path):
+    source = write(tmp_path / 'out.png', b'pixels')
+    linked = str(tmp_path / 'linked.png')
+    assert batch_planner.link_output(source, linked, 'link') == 'link'
+    assert os.path.samefile(source, linked)
+
+    copied = str(tmp_path / 'copied.png')
+    assert batch_planner.link_output(source, copied, 'copy') == 'copy'
+    assert not os.path.samefile(source, copied)
+    assert open(copied, 'rb').read() == b'pixels'
+
+
+def test_link_output_falls_back_to_copy(tmp_path, monkeypatch):
+    def no_links(source, target):
+        raise OSError("Invalid cross-device link")
+    monkeypatch.setattr(os, 'link', no_links)
+    source = write(tmp_path / 'out.png', b'pixels')
+    target = str(tmp_path / 'dup.png')
+    assert batch_planner.link_output(source, target, 'link') == 'copy'
+    assert open(target, 'rb').read() == b'pixels'
+    assert sorted(os.listdir(tmp_path)) == ['dup.png', 'out.png']
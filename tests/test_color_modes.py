@@ -0,0 +1,15 @@
+import pytest
+from PIL import Image
+import color_modes
+
+
+@pytest.mark.parametrize('mode', ['I;16', 'I'])
+@pytest.mark.parametrize('output_format', ["JPG", "BMP", "ICO", "GIF", "WEBP"])
+def test_16_bit_grey_is_scaled_to_8_bits(mode, output_format):
+    deep = Image.linear_gradient('L').convert('I').point(lambda value: value * 257).convert(mode)
+    output = color_modes.to_output(deep, output_format)
+    assert output.mode == color_modes.output_mode(mode, output_format)
+    low, high = output.convert('L').getextrema()
+    assert low <= 1 and high >= 254
+    # The middle of the gradient stays mid-grey instead of clipping to white
+    assert 120 <= output.convert('L').getpixel((0, 128)) <= 136
@@ -0,0 +1,111 @@
+import asyncio
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import pytest
+import job_server
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="finds workers through /proc")
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__('localhost', timeout=30)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def request(sock_path, method, url, body=None, headers=None):
+    connection = UnixConnection(sock_path)
+    try:
+        connection.request(method, url, body, headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[1]) == pid:
+                found.append(int(entry))
+    return found
+
+
+@pytest.fixture
+def server(tmp_path):
+    sock_path = str(tmp_path / 'server.sock')
+    process = subprocess.Popen([sys.executable, '-m', 'job_server', '--unix', sock_path, '-j', '1'],
+                               cwd=REPO, stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().startswith('Serving on')
+        yield process, sock_path
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def test_next_request_is_answered_after_a_worker_is_killed(server, make_image):
+    process, sock_path = server
+    with open(make_image(), 'rb') as f:
+        upload = f.read()
+    assert request(sock_path, 'POST', '/resize?size=16', upload)[0] == 200
+
+    for pid in children(process.pid):
+        os.kill(pid, signal.SIGKILL)
+
+    # Jobs caught by the broken pool get an error; later ones run on a new pool
+    statuses = []
+    for _ in range(3):
+        status, body = request(sock_path, 'POST', '/resize?size=16', upload)
+        statuses.append(status)
+        if status == 200:
+            break
+        assert status in (500, 503) and 'error' in json.loads(body)
+    assert statuses[-1] == 200
+
+    status = json.loads(request(sock_path, 'GET', '/status')[1])
+    assert status['running'] == 0
+    assert status['pool_restarts'] == 1
+
+
+def test_save_directory_must_be_inside_an_allowed_folder(tmp_path):
+    allowed = tmp_path / 'out'
+    allowed.mkdir()
+    state = {'allowed_dirs': [os.path.realpath(allowed)], 'options': job_server.resize_engine.merge_options({})}
+    assert job_server.request_options(state, {'save_directory': str(allowed / 'icons')})['save_directory']
+    for outside in (str(tmp_path), str(allowed / '..' / 'elsewhere'), '/etc'):
+        with pytest.raises(job_server.RequestError):
+            job_server.request_options(state, {'save_directory': outside})
+
+    state['allowed_dirs'] = []
+    with pytest.raises(job_server.RequestError):
+        job_server.request_options(state, {'save_directory': str(allowed)})
+
+
+def test_path_job_without_save_directory_is_refused_over_tcp(tmp_path, make_image):
+    allowed = tmp_path / 'out'
+    allowed.mkdir()
+    source = make_image()
+    state = {'allowed_dirs': [os.path.realpath(allowed)], 'options': job_server.resize_engine.merge_options({})}
+    body = json.dumps({'sources': [source], 'sizes': ['16']}).encode()
+    with pytest.raises(job_server.RequestError) as error:
+        asyncio.run(job_server.resize_paths(state, None, body))
+    assert error.value.status == 400
+    assert sorted(os.listdir(tmp_path)) == ['out', 'source.png']
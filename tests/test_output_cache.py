@@ -0,0 +1,15 @@
+import resize_engine
+
+
+def test_backend_is_part_of_the_cache_key(make_image, tmp_path):
+    source = make_image()
+    cache = str(tmp_path / 'cache.db')
+    pillow = resize_engine.merge_options({'cache': cache, 'save_directory': str(tmp_path)})
+    numpy = dict(pillow, backend='numpy')
+    assert resize_engine.cache_key_params(source, pillow) != resize_engine.cache_key_params(source, numpy)
+
+    resize_engine.resize_file(source, [32], 'PNG', pillow)
+    key, hit = resize_engine.cached_output(source, (32, 32), 'PNG', numpy)
+    assert hit is None
+    key, hit = resize_engine.cached_output(source, (32, 32), 'PNG', pillow)
+    assert hit is not None
@@ -0,0 +1,87 @@
+import os
+import pytest
+from PIL import Image, ImageChops
+import resize_engine
+
+
+@pytest.mark.parametrize('output_format', resize_engine.SUPPORTED_FORMATS)
+@pytest.mark.parametrize('quality', sorted(resize_engine.RESIZE_QUALITY))
+def test_16_bit_grayscale_source(make_image, tmp_path, output_format, quality):
+    source = make_image('deep.png', size=(400, 300), mode='I;16')
+    with Image.open(source) as img:
+        assert img.mode == 'I;16'
+    results = resize_engine.resize_file(source, [32], output_format,
+                                        {'quality': quality, 'save_directory': str(tmp_path)})
+    assert [result['error'] for result in results] == [None]
+    with Image.open(results[0]['output']) as img:
+        assert img.size == (32, 32)
+        # The source runs from black to nearly full scale top to bottom; the
+        # output must too, as 16 or 8 bits, rather than clip to white
+        if img.mode in ('I', 'I;16'):
+            scale = 65535
+        else:
+            img = img.convert('L')
+            scale = 255
+        low, high = img.getextrema()
+        assert low / scale < 0.05 and high / scale > 0.9
+        assert 0.35 < img.getpixel((16, 16)) / scale < 0.65
+
+
+def textured_source(path, size=(1024, 768)):
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    img.paste(Image.effect_noise((size[0] // 2, size[1] // 2), 60).convert('RGB'), (size[0] // 4, size[1] // 4))
+    img.save(path)
+    return str(path)
+
+
+def max_difference(first, second):
+    with Image.open(first) as a, Image.open(second) as b:
+        difference = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    return max(band.getextrema()[1] for band in difference.split())
+
+
+@pytest.mark.parametrize('encode_threads', [1, 3])
+def test_cascaded_outputs_match_direct_resizes(tmp_path, monkeypatch, encode_threads):
+    source = textured_source(tmp_path / 'source.png')
+    cascaded = []
+    pick = resize_engine.pick_intermediate
+
+    def spy(intermediates, new_size, reducing_gap):
+        base = pick(intermediates, new_size, reducing_gap)
+        if base is not None:
+            cascaded.append(new_size)
+        return base
+    monkeypatch.setattr(resize_engine, 'pick_intermediate', spy)
+
+    (tmp_path / 'fan').mkdir()
+    options = {'save_directory': str(tmp_path / 'fan'), 'encode_threads': encode_threads}
+    fanned = resize_engine.resize_file(source, [256, 64, 16], 'PNG', options)
+    assert [result['error'] for result in fanned] == [None, None, None]
+    # 64 comes from the 256 output and 16 from the 64 one
+    assert cascaded == [(64, 64), (16, 16)]
+
+    for result in fanned:
+        direct_dir = tmp_path / f"direct{result['size'][0]}"
+        direct_dir.mkdir()
+        direct = resize_engine.resize_file(source, [result['size']], 'PNG',
+                                           {'save_directory': str(direct_dir), 'quality': 'exact'})
+        # "balanced" promises 2 levels per channel of "exact"
+        assert max_difference(result['output'], direct[0]['output']) <= 2
+
+
+@pytest.mark.parametrize('encode_threads', [1, 3])
+def test_each_target_is_written_once(tmp_path, monkeypatch, encode_threads):
+    source = textured_source(tmp_path / 'source.png', (300, 200))
+    written = []
+    write_output = resize_engine.write_output
+
+    def spy(new_filepath, data):
+        written.append(os.path.basename(new_filepath))
+        write_output(new_filepath, data)
+    monkeypatch.setattr(resize_engine, 'write_output', spy)
+
+    sizes = [64, (64, 64), '64x64', 32, {'size': 32, 'format': 'JPG'}, {'size': '32', 'format': 'jpeg'}]
+    results = resize_engine.resize_file(source, sizes, 'PNG',
+                                        {'save_directory': str(tmp_path), 'encode_threads': encode_threads})
+    assert [result['error'] for result in results] == [None, None, None]
+    assert sorted(written) == ['source_32x32.jpg', 'source_32x32.png', 'source_64x64.png']
@@ -0,0 +1,40 @@
+import os
+from PIL import Image, ImageChops
+import resize_engine
+import strip_resize
+
+
+def make_pages(path, count, size=(400, 300)):
+    pages = [Image.linear_gradient('L').resize(size).rotate(90 * index).convert('RGB') for index in range(count)]
+    pages[0].save(path, save_all=True, append_images=pages[1:], compression='raw')
+    return str(path)
+
+
+def test_every_page_is_resized_in_strips(tmp_path):
+    source = make_pages(tmp_path / 'pages.tiff', 3)
+    budgeted = tmp_path / 'budgeted'
+    plain = tmp_path / 'plain'
+    budgeted.mkdir()
+    plain.mkdir()
+    options = {'save_directory': str(budgeted), 'memory_budget': 64 * 1024}
+    assert [result['error'] for result in resize_engine.resize_file(source, [40], 'TIFF', options)] == [None]
+    resize_engine.resize_file(source, [40], 'TIFF', {'save_directory': str(plain)})
+
+    with Image.open(budgeted / 'pages_40x40.tiff') as strips, Image.open(plain / 'pages_40x40.tiff') as whole:
+        assert strips.n_frames == whole.n_frames == 3
+        for index in range(3):
+            strips.seek(index)
+            whole.seek(index)
+            difference = ImageChops.difference(strips.convert('RGB'), whole.convert('RGB'))
+            assert max(high for low, high in difference.getextrema()) <= 2
+
+
+def test_decoded_bytes_counts_what_pillow_holds(make_image):
+    with Image.open(make_image('rgb.png', size=(100, 10))) as img:
+        # RGB is stored in four bytes per pixel
+        assert strip_resize.decoded_bytes(img) == 100 * 10 * 4
+    with Image.open(make_image('rgba.png', size=(100, 10), mode='RGBA')) as img:
+        # Plus the premultiplied working copy
+        assert strip_resize.decoded_bytes(img) == 2 * 100 * 10 * 4
+    with Image.open(make_image('grey.png', size=(100, 10), mode='L')) as img:
+        assert strip_resize.decoded_bytes(img) == 100 * 10
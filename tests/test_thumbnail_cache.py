@@ -0,0 +1,19 @@
+import os
+from PIL import Image
+import thumbnail_cache
+
+
+def disk_bytes(cache_dir):
+    return sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+
+def test_store_counts_each_thumbnail_once(tmp_path):
+    cache_dir = str(tmp_path)
+    thumb = Image.linear_gradient('L').resize((64, 64))
+    thumbnail_cache.store(cache_dir, os.path.join(cache_dir, 'a.png'), thumb, 1 << 30)
+    assert thumbnail_cache.folder_bytes(cache_dir) == disk_bytes(cache_dir)
+
+    # Storing the same entry again replaces it rather than adding to it
+    thumbnail_cache.store(cache_dir, os.path.join(cache_dir, 'a.png'), thumb, 1 << 30)
+    thumbnail_cache.store(cache_dir, os.path.join(cache_dir, 'b.png'), thumb, 1 << 30)
+    assert thumbnail_cache.folder_bytes(cache_dir) == disk_bytes(cache_dir)
@@ -0,0 +1,43 @@
+import os
+import random
+import pytest
+from PIL import Image, ImageChops
+import resize_engine
+import vector_resize
+
+pytestmark = pytest.mark.skipif(not vector_resize.available(), reason="NumPy is not installed")
+
+
+def test_failed_file_keeps_earlier_results(make_image, tmp_path):
+    first = make_image('first.png')
+    last = make_image('last.png')
+    missing = str(tmp_path / 'missing.png')
+    options = {'backend': 'numpy', 'cache': str(tmp_path / 'cache.db'), 'save_directory': str(tmp_path)}
+    results = resize_engine.resize_stack_files([first, missing, last], [16], 'PNG', options)
+    assert [file_results[0]['source'] for file_results in results] == [first, missing, last]
+    assert results[0][0]['error'] is None and os.path.exists(results[0][0]['output'])
+    assert results[1][0]['error']
+    assert results[2][0]['error'] is None
+
+
+@pytest.mark.parametrize('mode', vector_resize.VECTOR_MODES)
+@pytest.mark.parametrize('source_size, new_size', [((120, 80), (16, 16)), ((37, 29), (13, 7)),
+                                                   ((16, 16), (64, 64)), ((20, 10), (33, 47))])
+def test_stack_matches_pillow_within_one_level(mode, source_size, new_size):
+    # Noise on one side and a smooth gradient on the other, so upscaling
+    # overshoots and has to be clipped between passes like Pillow does
+    noise = random.Random(0)
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    img = Image.linear_gradient('L').resize(source_size).convert(mode)
+    half = (source_size[0] // 2, source_size[1])
+    img.paste(Image.frombytes(mode, half, bytes(noise.randrange(256) for _ in range(half[0] * half[1] * bands))))
+    if mode == 'RGBA':
+        # Low alpha included, where colour errors would be magnified
+        img.putalpha(Image.linear_gradient('L').resize(source_size))
+        expected = img.convert('RGBa').resize(new_size, Image.LANCZOS).convert('RGBA')
+    else:
+        expected = img.resize(new_size, Image.LANCZOS)
+    stack = vector_resize.stack_images([img, img])
+    for array in vector_resize.resize_stack(stack, new_size, mode):
+        difference = ImageChops.difference(vector_resize.unstack_image(array, mode), expected)
+        assert max(band.getextrema()[1] for band in difference.split()) <= 1
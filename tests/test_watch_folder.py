@@ -0,0 +1,28 @@
+import os
+import threading
+import watch_folder
+
+
+def watch_once(root, options):
+    # Polls the folder for a second, then stops
+    stop_event = threading.Event()
+    timer = threading.Timer(1.0, stop_event.set)
+    timer.start()
+    try:
+        return watch_folder.watch([root], [16, 32], 'PNG', options, settle=0, poll_interval=0.2,
+                                  use_inotify=False, stop_event=stop_event, status_interval=0)
+    finally:
+        timer.cancel()
+
+
+def test_restart_does_not_resize_earlier_outputs(make_image, tmp_path):
+    make_image('a.png')
+    stats = watch_once(str(tmp_path), {})
+    assert stats['processed'] == 1
+    assert sorted(os.listdir(tmp_path)) == ['a.png', 'a_16x16.png', 'a_32x32.png']
+
+    # Without a journal a.png is resized again, but the outputs next to it
+    # must not be taken for new sources
+    stats = watch_once(str(tmp_path), {})
+    assert stats['processed'] == 1
+    assert sorted(os.listdir(tmp_path)) == ['a.png', 'a_16x16.png', 'a_32x32.png']
@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import os
+import threading
+from PIL import Image
+from resize_engine import PREVIEW_SIZE, load_preview
+
+# On-disk cache of preview thumbnails, one PNG per (path, size, mtime,
+# thumbnail size). A changed file gets a new key, so stale entries are never
+# served; they just age out. Reading an entry bumps its mtime, and once the
+# folder grows past max_bytes the least recently used thumbnails are deleted.
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_lock = threading.Lock()
+# Running byte total per cache folder, computed on first use
+_folder_bytes = {}
+
+
+def thumbnail_key(file_path, max_size):
+    stat = os.stat(file_path)
+    payload = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{max_size[0]}x{max_size[1]}"
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def folder_bytes(cache_dir):
+    with _lock:
+        if cache_dir not in _folder_bytes:
+            total = 0
+            with os.scandir(cache_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.png'):
+                        total += entry.stat().st_size
+            _folder_bytes[cache_dir] = total
+        return _folder_bytes[cache_dir]
+
+
+def get_thumbnail(file_path, max_size=PREVIEW_SIZE, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    # Returns a loaded thumbnail no larger than max_size; decodes the source
+    # only on a cache miss. Without cache_dir this is just load_preview.
+    if not cache_dir:
+        return load_preview(file_path, max_size)
+    os.makedirs(cache_dir, exist_ok=True)
+    thumb_path = os.path.join(cache_dir, thumbnail_key(file_path, max_size) + '.png')
+    try:
+        with Image.open(thumb_path) as thumb:
+            thumb = thumb.copy()
+        os.utime(thumb_path)
+        return thumb
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Discarding unreadable thumbnail {thumb_path}: {str(e)}")
+
+    img = load_preview(file_path, max_size)
+    if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    store(cache_dir, thumb_path, img, max_bytes)
+    return img
+
+
+def store(cache_dir, thumb_path, img, max_bytes):
+    # Count the folder before the new file lands in it, or a first scan
+    # would include it and it would be added a second time below
+    folder_bytes(cache_dir)
+    previous = os.path.getsize(thumb_path) if os.path.exists(thumb_path) else 0
+    temp_path = f"{thumb_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        img.save(temp_path, format='PNG', compress_level=1)
+        os.replace(temp_path, thumb_path)
+    except OSError as e:
+        # A read-only or full disk only costs the caching, not the preview
+        logging.warning(f"Could not cache thumbnail {thumb_path}: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return
+    with _lock:
+        total = _folder_bytes[cache_dir] + os.path.getsize(thumb_path) - previous
+        _folder_bytes[cache_dir] = total
+    if total > max_bytes:
+        evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    # Oldest first until the folder is back to 3/4 of max_bytes, so eviction
+    # does not run again on the very next store
+    with _lock:
+        entries = []
+        with os.scandir(cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith('.png'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        _folder_bytes[cache_dir] = total
+    return removed
+
+
+def clear(cache_dir):
+    with _lock:
+        if os.path.isdir(cache_dir):
+            for name in os.listdir(cache_dir):
+                if name.endswith('.png'):
+                    os.remove(os.path.join(cache_dir, name))
+        _folder_bytes[cache_dir] = 0
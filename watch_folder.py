@@ -0,0 +1,328 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import re
+import select
+import struct
+import sys
+import time
+from collections import OrderedDict, deque
+import resize_engine
+
+# Long-running watch mode: resizes sources as they appear in (or change
+# inside) the watched folders, with the same engine as the batch commands.
+# Linux uses inotify through libc; everywhere else, or if inotify cannot be
+# set up, the folders are rescanned every poll_interval seconds. Either way a
+# file is only handed to the engine once its size and mtime have stayed the
+# same for `settle` seconds, so half-copied files are never resized.
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+DEFAULT_SETTLE = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_STATUS_INTERVAL = 30.0
+
+# Sources per engine call, so a flood of new files still reports progress
+MAX_BATCH = 500
+
+# Window for the processing rate counter
+RATE_WINDOW = 60.0
+
+# Processed sources and produced outputs remembered at most, oldest dropped first
+MAX_REMEMBERED = 100000
+
+# <stem>_<W>x<H>.<ext>, as written by resize_engine.build_output_path
+OUTPUT_NAME = re.compile(r'.+_(\d+)x(\d+)\.(\w+)$')
+
+
+def open_inotify(roots, recursive):
+    # Returns the inotify state dict, or None when inotify is not available
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError) as e:
+        logging.warning(f"inotify unavailable, polling instead: {str(e)}")
+        return None
+    if fd < 0:
+        logging.warning(f"inotify_init1 failed ({os.strerror(ctypes.get_errno())}), polling instead")
+        return None
+    state = {'libc': libc, 'fd': fd, 'dirs': {}, 'recursive': recursive}
+    for root in roots:
+        add_watch_tree(state, root)
+    return state
+
+
+def add_watch(state, directory):
+    wd = state['libc'].inotify_add_watch(state['fd'], os.fsencode(directory), WATCH_MASK)
+    if wd < 0:
+        logging.warning(f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+        return
+    state['dirs'][wd] = directory
+
+
+def add_watch_tree(state, root):
+    add_watch(state, root)
+    if not state['recursive']:
+        return
+    for directory, subdirs, files in os.walk(root):
+        for subdir in subdirs:
+            add_watch(state, os.path.join(directory, subdir))
+
+
+def close_inotify(state):
+    os.close(state['fd'])
+
+
+def read_inotify(state, timeout):
+    # Paths of files touched since the last call; None means events were
+    # lost (queue overflow) and the caller should rescan everything
+    readable, _, _ = select.select([state['fd']], [], [], timeout)
+    if not readable:
+        return []
+    paths = []
+    while True:
+        try:
+            data = os.read(state['fd'], 64 * 1024)
+        except BlockingIOError:
+            break
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+            offset += 16 + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            directory = state['dirs'].get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if state['recursive'] and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may land in the new folder before its watch exists
+                    add_watch_tree(state, path)
+                    paths.extend(os.path.join(subdir, f) for subdir, _, files in os.walk(path) for f in files)
+            else:
+                paths.append(path)
+    return paths
+
+
+def file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def remember(mapping, key, value=None):
+    mapping[key] = value
+    mapping.move_to_end(key)
+    while len(mapping) > MAX_REMEMBERED:
+        mapping.popitem(last=False)
+
+
+def output_matcher(sizes, output_format, options):
+    # Tells whether a file name is one the engine would give an output of
+    # these sizes, so outputs written next to their sources, by this run or an
+    # earlier one, are not picked up as new sources after a restart
+    if options['icon_set']:
+        return lambda name: name.lower().endswith('_icon.ico')
+    targets = resize_engine.make_targets(sizes, resize_engine.validate_format(output_format))
+    aspect = options['maintain_aspect_ratio']
+
+    def is_output(name):
+        match = OUTPUT_NAME.match(name)
+        if not match:
+            return False
+        width, height, ext = int(match[1]), int(match[2]), match[3].lower()
+        for target in targets:
+            box_width, box_height = target['size']
+            if ext != target['format'].lower():
+                continue
+            if (width, height) == (box_width, box_height):
+                return True
+            # With the aspect ratio kept, one side fills the box
+            if aspect and ((width == box_width and height <= box_height) or
+                           (height == box_height and width <= box_width)):
+                return True
+        return False
+    return is_output
+
+
+def new_stats():
+    return {'started': time.time(), 'queued': 0, 'processed': 0, 'failed': 0, 'outputs': 0, 'cached': 0,
+            'batches': 0, 'rate_per_minute': 0.0, 'backend': None}
+
+
+def watch(roots, sizes, output_format, options=None, include=None, exclude=None, recursive=True,
+          settle=DEFAULT_SETTLE, poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True, stop_event=None,
+          status_interval=DEFAULT_STATUS_INTERVAL, status_file=None, on_results=None):
+    # Runs until stop_event is set (or KeyboardInterrupt). Existing sources are
+    # queued once at startup; with options['journal'] set, the ones finished
+    # in an earlier run are skipped without being decoded.
+    options = resize_engine.merge_options(options)
+    include = include or ['*' + ext for ext in resize_engine.INPUT_EXTENSIONS]
+    exclude = exclude or []
+    roots = [os.path.abspath(root) for root in roots]
+    stats = new_stats()
+    done_times = deque()
+    processed = OrderedDict()
+    candidates = {}
+    # Outputs of this run are never treated as sources, nor is anything in
+    # the save directory when it lies inside a watched folder, nor anything
+    # named like an output of the configured sizes
+    produced = OrderedDict()
+    is_output = output_matcher(sizes, output_format, options)
+    save_directory = os.path.abspath(options['save_directory']) if options['save_directory'] else None
+
+    def root_of(path):
+        for root in roots:
+            if path.startswith(root + os.sep):
+                return root
+        return None
+
+    def wanted(path):
+        root = root_of(path)
+        if root is None or (save_directory and path.startswith(save_directory + os.sep)):
+            return False
+        if is_output(os.path.basename(path)):
+            return False
+        parts = os.path.relpath(path, root).split(os.sep)
+        if not recursive and len(parts) > 1:
+            return False
+        # Same rules as iter_tree, which does not enter excluded directories
+        for depth in range(1, len(parts) + 1):
+            if resize_engine.matches_any(parts[depth - 1], '/'.join(parts[:depth]), exclude):
+                return False
+        return resize_engine.matches_any(parts[-1], '/'.join(parts), include)
+
+    def note(path):
+        path = os.path.abspath(path)
+        if path in produced or not wanted(path):
+            return
+        state = file_state(path)
+        if state is None:
+            candidates.pop(path, None)
+        elif processed.get(path) != state and candidates.get(path, (None,))[0] != state:
+            candidates[path] = (state, time.monotonic())
+
+    def rescan():
+        seen = set()
+        for root in roots:
+            for path in resize_engine.iter_tree(root, include, exclude, recursive):
+                seen.add(os.path.abspath(path))
+                note(path)
+        # Forget files that have been deleted since
+        for remembered in (processed, produced):
+            for path in [path for path in remembered if path not in seen]:
+                del remembered[path]
+
+    def settled():
+        # Candidates whose size and mtime have not moved for `settle` seconds
+        now = time.monotonic()
+        ready = []
+        for path, (state, since) in list(candidates.items()):
+            current = file_state(path)
+            if current is None:
+                del candidates[path]
+            elif current != state:
+                candidates[path] = (current, now)
+            elif now - since >= settle:
+                ready.append(path)
+        return ready[:MAX_BATCH]
+
+    def iter_ready(ready):
+        # One engine batch per watched root, so recursive runs mirror the
+        # folder structure exactly like the batch command does
+        for root in roots:
+            paths = [path for path in ready if root_of(path) == root]
+            if paths:
+                yield from resize_engine.iter_resize_batch(paths, sizes, output_format,
+                                                           dict(options, source_root=root if recursive else None),
+                                                           cancel_event=stop_event)
+
+    inotify = open_inotify(roots, recursive) if use_inotify else None
+    stats['backend'] = 'inotify' if inotify else 'polling'
+    logging.info(f"Watching {', '.join(roots)} ({stats['backend']})")
+    rescan()
+    last_scan = time.monotonic()
+    last_status = time.monotonic()
+    try:
+        while not (stop_event and stop_event.is_set()):
+            if inotify:
+                paths = read_inotify(inotify, min(settle, 1.0) if candidates else 1.0)
+                if paths is None:
+                    logging.warning("inotify queue overflowed; rescanning")
+                    rescan()
+                else:
+                    for path in paths:
+                        note(path)
+            else:
+                if time.monotonic() - last_scan >= poll_interval:
+                    rescan()
+                    last_scan = time.monotonic()
+                time.sleep(min(settle, poll_interval, 1.0) if candidates else min(poll_interval, 1.0))
+
+            ready = settled()
+            if ready:
+                states = {path: candidates.pop(path)[0] for path in ready}
+                start = time.perf_counter()
+                for file_results in iter_ready(ready):
+                    source = os.path.abspath(file_results[0]['source'])
+                    remember(processed, source, states.get(source))
+                    errors = [result for result in file_results if result['error']]
+                    stats['processed'] += 1
+                    stats['failed'] += 1 if errors else 0
+                    for result in file_results:
+                        if result['output']:
+                            output = os.path.abspath(result['output'])
+                            if root_of(output):
+                                remember(produced, output)
+                            stats['outputs'] += 1
+                            stats['cached'] += 1 if result.get('cached') else 0
+                    done_times.append(time.monotonic())
+                    if on_results:
+                        on_results(file_results)
+                stats['batches'] += 1
+                logging.info(f"Watch batch of {len(ready)} source(s) took {time.perf_counter() - start:.2f}s")
+
+            now = time.monotonic()
+            while done_times and now - done_times[0] > RATE_WINDOW:
+                done_times.popleft()
+            stats['queued'] = len(candidates)
+            stats['rate_per_minute'] = len(done_times) * 60.0 / RATE_WINDOW
+            if status_interval and now - last_status >= status_interval:
+                last_status = now
+                report_status(stats, status_file)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if inotify:
+            close_inotify(inotify)
+        report_status(stats, status_file)
+    return stats
+
+
+def format_status(stats):
+    return (f"queued={stats['queued']} processed={stats['processed']} failed={stats['failed']} "
+            f"outputs={stats['outputs']} cached={stats['cached']} rate={stats['rate_per_minute']:.1f}/min")
+
+
+def report_status(stats, status_file=None):
+    logging.info(f"Watch status: {format_status(stats)}")
+    if status_file:
+        # Rewritten atomically so monitoring never reads half a file
+        temp_path = f"{status_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(dict(stats, updated=time.time()), f, indent=2)
+        os.replace(temp_path, status_file)